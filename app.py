@@ -1,32 +1,165 @@
 import os
-import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from category_counts import CategoryCounts
+from image_store import open_image_store, record_epoch
+from time_hierarchy import LINK_LEVELS, TIME_LEVELS
+from time_index import SortedTimeIndex
+from virtual_tree import VirtualTimeTree
+
+# Saman kuvan linkeistä ensisijainen on karkein taso (years), kuten tietueiden lisäysjärjestyksessä
+_LEVEL_RANK = {level['dir']: rank for rank, level in enumerate(TIME_LEVELS)}
+
+def _level_rank(item):
+    return _LEVEL_RANK.get(item[0].split('/', 1)[0], len(_LEVEL_RANK))
+
 class ImageDatabase:
     def __init__(self, base_path):
         self.base_path = Path(base_path)
-        self.db_file = self.base_path / 'image_database.json'
         self.images = self.load_database()
+        self.db_file = self.images.db_file
+        self._virtual_tree = None
+        self._time_index = None
+        self.lock = threading.RLock()
+        self._transaction_depth = 0
+        self._transaction_added = []
+        self._transaction_replaced = {}
+        self.category_counts = self._load_category_counts()
     
-    def load_database(self):
-        if self.db_file.exists():
+    def _load_category_counts(self):
+        if self.images.backend != 'journal':
+            counts = CategoryCounts(self.base_path)
+            if not counts.loaded or counts.total != len(self.images):
+                counts.rebuild(self.images)
+            return counts
+        # Journal-tallennuksessa määrät tallennetaan tilannekuvan mukana tiivistyksen yhteydessä,
+        # ja sen jälkeiset muutokset lasketaan muistissa olevasta kerroksesta (O(muutokset))
+        if self.images.compactor is not None:
+            self.images.compactor.join()
+        counts = CategoryCounts(self.base_path, load=False)
+        if not counts.restore(self.images.snapshot_meta().get('category_counts')):
+            # Vanhempi tilannekuva ilman määriä: lasketaan sen poluista, tallentuu seuraavassa tiivistyksessä
+            counts.rebuild(self.images.snapshot_paths())
+        for rel_path, present in self.images.snapshot_changes():
+            if present:
+                counts.add(rel_path)
+            else:
+                counts.remove(rel_path)
+        self.images.snapshot_meta_for = self._snapshot_meta
+        return counts
+    
+    def _snapshot_meta(self, rel_paths):
+        """Tilannekuvan mukana tallennettavat kategoriamäärät (tiivistyssäikeessä)"""
+        counts = CategoryCounts(self.base_path, load=False)
+        counts.rebuild(rel_paths)
+        return {'category_counts': counts.state()}
+    
+    def get_virtual_tree(self):
+        """Aikahierarkia muistissa (rakennetaan ensimmäisellä käyttökerralla, päivittyy lisäysten mukana)"""
+        if self._virtual_tree is None:
+            tree = VirtualTimeTree(levels=LINK_LEVELS)
+            for rel_path, info in list(self.images.items()):
+                tree.add_record(rel_path, info)
+            self._virtual_tree = tree
+        return self._virtual_tree
+    
+    def get_time_index(self):
+        """Aikaleimojen järjestetty indeksi aikavälihakuja varten (rakennetaan ensimmäisellä
+        haulla, päivittyy lisäysten mukana). SQLite-varastolla None: haku käyttää taulun indeksiä."""
+        if self.images.backend == 'sqlite':
+            return None
+        if self._time_index is None:
+            with self.lock:
+                if self._time_index is None:
+                    # Aikaleimat tulevat tilannekuvan epoch-sarakkeesta purkamatta tietueita
+                    self._time_index = SortedTimeIndex.build(self.images.epoch_entries())
+        return self._time_index
+    
+    def _records_in_range(self, start_epoch, end_epoch):
+        index = self.get_time_index()
+        if index is None:
+            return self.images.iter_range(start_epoch, end_epoch)
+        records = []
+        for rel_path in index.range(start_epoch, end_epoch):
+            info = self.images.get(rel_path)
+            if info is not None:
+                records.append((rel_path, info))
+        return records
+    
+    def _index_record(self, rel_path, is_new=True):
+        if is_new:
+            self.category_counts.add(rel_path)
+            if self._transaction_depth:
+                self._transaction_added.append(rel_path)
+        if self._virtual_tree is not None:
+            self._virtual_tree.add_record(rel_path, self.images[rel_path])
+        if self._time_index is not None:
+            self._time_index.add(rel_path, record_epoch(self.images[rel_path]))
+    
+    @contextmanager
+    def transaction(self, save=True):
+        """Rekisteröi joukko kuvia yhtenä kokonaisuutena: jos lohko keskeytyy virheeseen,
+        sen aikana lisätyt tietueet poistetaan. save=True tallentaa tietokannan onnistuneen
+        lohkon lopuksi (sisäkkäisissä transaktioissa vasta uloimman päättyessä)."""
+        with self.lock:
+            outer = self._transaction_depth == 0
+            if outer:
+                self._transaction_added = []
+                self._transaction_replaced = {}
+            self._transaction_depth += 1
             try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Virhe tietokannan lataamisessa: {e}")
-                return {}
-        return {}
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if outer:
+                    self._rollback(self._transaction_added, self._transaction_replaced)
+                raise
+            self._transaction_depth -= 1
+            if outer:
+                self._transaction_added = []
+                self._transaction_replaced = {}
+                if save:
+                    self.save_database()
+    
+    def _rollback(self, rel_paths, replaced=None):
+        # Muutetut tietueet (esim. puuttuvan merkintä) palautetaan ennen lisättyjen poistoa
+        for rel_path, info in (replaced or {}).items():
+            self.images[rel_path] = info
+        for rel_path in rel_paths:
+            self.images.pop(rel_path, None)
+            self.category_counts.remove(rel_path)
+            if self._time_index is not None:
+                self._time_index.remove(rel_path)
+        self._transaction_added = []
+        self._transaction_replaced = {}
+        if rel_paths:
+            # Virtuaalipuu rakennetaan uudelleen seuraavalla käyttökerralla
+            self._virtual_tree = None
+            print(f"Peruttu {len(rel_paths)} keskeneräistä tietuetta")
+    
+    def load_database(self):
+        """Avaa tietueet DB_BACKEND-asetuksen mukaisesta varastosta (journal tai sqlite)"""
+        return open_image_store(self.base_path)
     
     def save_database(self):
         try:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(self.images, f, indent=2, ensure_ascii=False, default=str)
+            with self.lock:
+                self.images.save()
+            if self.images.backend != 'journal':
+                # Journal-tallennus kirjoittaa määrät tilannekuvaan tiivistyksen yhteydessä (_snapshot_meta)
+                self.category_counts.save_counts()
         except Exception as e:
             print(f"Virhe tietokannan tallennuksessa: {e}")
     
-    def add_image(self, image_path, timestamp, category, source='filesystem'):
+    def close(self):
+        self.save_database()
+        self.images.close()
+    
+    def add_image(self, image_path, timestamp, category, source='filesystem', camera=None, filename=None,
+                  content_hash=None):
         try:
             # Käytä suhteellista polkua
             if isinstance(image_path, Path):
@@ -34,16 +167,27 @@ class ImageDatabase:
             else:
                 rel_path = str(Path(image_path).relative_to(self.base_path))
             
-            self.images[rel_path] = {
+            record = {
                 'timestamp': timestamp,
                 'category': category,
                 'source': source,
-                'filename': Path(image_path).name,
+                'filename': filename or Path(image_path).name,
                 'added': datetime.now().isoformat()
             }
+            if camera:
+                record['camera'] = camera
+            if content_hash:
+                record['hash'] = content_hash
+            with self.lock:
+                is_new = rel_path not in self.images
+                self.images[rel_path] = record
+                self._index_record(rel_path, is_new)
             print(f"Lisätty tietokantaan: {rel_path} - {category}")
         except Exception as e:
             print(f"Virhe kuvan lisäämisessä tietokantaan {image_path}: {e}")
+            if self._transaction_depth:
+                # Transaktion sisällä virhe välitetään eteenpäin, jotta jo lisätyt tietueet perutaan
+                raise
     
     def scan_for_images(self):
         """Skannaa kansion kuvat ja lisää ne tietokantaan jos puuttuvat"""
@@ -55,6 +199,9 @@ class ImageDatabase:
             if file_path.is_file() and file_path.suffix.lower() in image_extensions:
                 try:
                     rel_path = str(file_path.relative_to(self.base_path))
+                    # Sisältövaraston blobit eivät ole selattavia kuvia
+                    if rel_path.split(os.sep, 1)[0] == 'store':
+                        continue
                     
                     # Tarkista onko kuva jo tietokannassa
                     if rel_path not in self.images:
@@ -63,13 +210,15 @@ class ImageDatabase:
                         # Käytä tiedoston muokkausaikaa
                         timestamp = datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
                         
-                        self.images[rel_path] = {
-                            'timestamp': timestamp,
-                            'category': category,
-                            'source': 'filesystem',
-                            'filename': file_path.name,
-                            'added': datetime.now().isoformat()
-                        }
+                        with self.lock:
+                            self.images[rel_path] = {
+                                'timestamp': timestamp,
+                                'category': category,
+                                'source': 'filesystem',
+                                'filename': file_path.name,
+                                'added': datetime.now().isoformat()
+                            }
+                            self._index_record(rel_path)
                         added_count += 1
                         print(f"Lisätty skannauksessa: {rel_path} - {category}")
                 except Exception as e:
@@ -116,7 +265,27 @@ class ImageDatabase:
         else:
             return "unknown"
     
-    def get_images_by_date_range(self, start_date, end_date):
+    def set_missing(self, rel_path, missing=True):
+        """Merkitse tietueen tiedosto puuttuvaksi (tai taas löytyneeksi). Puuttuvat ohitetaan hauissa
+        ilman tiedostojärjestelmäkutsuja. Palauttaa True jos tila muuttui."""
+        with self.lock:
+            info = self.images.get(rel_path)
+            if info is None or bool(info.get('missing')) == missing:
+                return False
+            if self._transaction_depth:
+                self._transaction_replaced.setdefault(rel_path, info)
+            info = dict(info)
+            if missing:
+                info['missing'] = datetime.now().isoformat()
+            else:
+                info.pop('missing', None)
+            self.images[rel_path] = info
+            return True
+    
+    def get_images_by_date_range(self, start_date, end_date, verify=False):
+        """Hae kuvat aikaväliltä. Tiedostojen olemassaolo tulee tietokannasta (luokittelu ja
+        ArchiveReconcilerin orpojen tarkistus ylläpitävät sitä); verify=True tarkistaa jokaisen
+        osuman levyltä ja korjaa tietokannan tilan (vianetsintään)."""
         try:
             # Muunna päivämäärät datetime-objekteiksi
             if start_date:
@@ -134,8 +303,14 @@ class ImageDatabase:
             
             matching_images = []
             seen_filenames = set()  # Estä duplikaatit
+            corrected = 0
             
-            for rel_path, info in self.images.items():
+            # Aikaväli rajataan järjestetystä aikaindeksistä (sqlite: taulun epoch-indeksi), joten vain
+            # osumat käydään läpi. Tulos on tilannekuva, jotta luokittelu voi lisätä kuvia samaan aikaan.
+            start_epoch = start_dt.timestamp() if start_dt else None
+            end_epoch = end_dt.timestamp() if end_dt else None
+            # Vakaa lajittelu tasoittain: tiedostonimen duplikaateista säilyy karkeimman tason linkki
+            for rel_path, info in sorted(self._records_in_range(start_epoch, end_epoch), key=_level_rank):
                 try:
                     # Muunna timestamp datetime-objektiksi
                     if isinstance(info['timestamp'], str):
@@ -143,16 +318,16 @@ class ImageDatabase:
                     else:
                         img_dt = info['timestamp']
                     
-                    # Tarkista aikaväli
-                    if start_dt and img_dt < start_dt:
-                        continue
-                    if end_dt and img_dt >= end_dt:  # Huomaa >= koska lisäsimme yhden päivän
-                        continue
-                    
-                    # Tarkista että kuva on olemassa
                     full_path = self.base_path / rel_path
-                    if not full_path.exists():
-                        print(f"Kuvaa ei löydy: {full_path}")
+                    if verify:
+                        exists = full_path.exists()
+                        if self.set_missing(rel_path, not exists):
+                            corrected += 1
+                            print(f"Korjattu tiedoston tila: {rel_path} ({'löytyy' if exists else 'puuttuu'})")
+                        if not exists:
+                            print(f"Kuvaa ei löydy: {full_path}")
+                            continue
+                    elif info.get('missing'):
                         continue
                     
                     # Estä duplikaatit samalla tiedostonimellä
@@ -175,6 +350,9 @@ class ImageDatabase:
                     print(f"Virhe käsiteltäessä kuvaa {rel_path}: {e}")
                     continue
             
+            if corrected:
+                self.save_database()
+            
             # Järjestä aikajärjestykseen
             matching_images.sort(key=lambda x: x['date_obj'] if 'date_obj' in x else x['timestamp'], reverse=True)
             print(f"Haettu {len(matching_images)} uniikkia kuvaa aikavälillä {start_date} - {end_date}")
@@ -190,10 +368,10 @@ class ImageDatabase:
             print(f"Virhe kuvien haussa: {e}")
             return []
     
-    def get_unique_images_by_date_range(self, start_date, end_date):
+    def get_unique_images_by_date_range(self, start_date, end_date, verify=False):
         """Hae kuvat aikavälin perusteella ilman duplikaatteja (tarkempi versio)"""
         try:
-            images = self.get_images_by_date_range(start_date, end_date)
+            images = self.get_images_by_date_range(start_date, end_date, verify)
             
             # Käytä tarkempaa duplikaattien poistoa
             unique_images = []
@@ -217,34 +395,18 @@ class ImageDatabase:
     
     def get_categories(self):
         try:
-            categories = set()
-            for info in self.images.values():
-                categories.add(info['category'])
-            return sorted(categories)
+            return self.images.categories()
         except Exception as e:
             print(f"Virhe kategorioiden haussa: {e}")
             return []
     
     def get_date_range(self):
         try:
-            if not self.images:
+            index = self.get_time_index()
+            first, last = index.bounds() if index is not None else self.images.epoch_bounds()
+            if first is None:
                 return None, None
-            
-            timestamps = []
-            for info in self.images.values():
-                try:
-                    if isinstance(info['timestamp'], str):
-                        ts = datetime.fromisoformat(info['timestamp'])
-                    else:
-                        ts = info['timestamp']
-                    timestamps.append(ts)
-                except Exception:
-                    continue
-            
-            if not timestamps:
-                return None, None
-                
-            return min(timestamps), max(timestamps)
+            return datetime.fromtimestamp(first), datetime.fromtimestamp(last)
         except Exception as e:
             print(f"Virhe aikavälin haussa: {e}")
             return None, None
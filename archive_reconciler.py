@@ -0,0 +1,198 @@
+"""
+Taustalla ajettava arkiston täsmäytys.
+
+Luokittelu rekisteröi itse luomansa linkit tietokantaan, joten luokitteluajon lopussa
+ei enää skannata koko arkistoa. Tämä säie käy linkkipuun läpi harvakseltaan
+(RECONCILE_INTERVAL_SECONDS) ja rajoitetulla nopeudella (RECONCILE_FILES_PER_SECOND)
+ja lisää tietokantaan tiedostot, jotka ovat ilmestyneet luokittelun ohi
+(esim. käsin kopioidut kuvat).
+
+Samalla kierroksella tarkistetaan orvot tietueet: tietokannan kuvat, joiden tiedosto on
+poistettu (tai symlinkin lähde on poistettu lähdekansiosta), merkitään puuttuviksi, ja
+taas löytyneistä merkintä poistetaan. Näin aikavälihaut eivät tarvitse tiedostojärjestelmää.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from classify_images import IMAGE_EXTENSIONS, INGEST_LOCK
+from time_hierarchy import active_levels, category_from_rel_path
+
+class ArchiveReconciler(threading.Thread):
+    def __init__(self, base_dir, db, interval=3600.0, files_per_second=200, batch_size=100, initial_delay=60.0,
+                 sweep_orphans=True):
+        super().__init__(daemon=True, name='archive-reconciler')
+        self.base_path = Path(base_dir)
+        self.db = db
+        self.interval = interval
+        self.files_per_second = files_per_second
+        self.batch_size = batch_size
+        self.initial_delay = initial_delay
+        self.stop_event = threading.Event()
+        self.last_run = None
+        self.last_added = 0
+        self.total_added = 0
+        self.sweep_orphans = sweep_orphans
+        self.last_sweep = None
+        self.missing = 0
+        self.running = False
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'files_per_second': self.files_per_second,
+            'last_run': self.last_run,
+            'last_added': self.last_added,
+            'total_added': self.total_added,
+            'sweep_orphans': self.sweep_orphans,
+            'last_sweep': self.last_sweep,
+            'missing': self.missing
+        }
+
+    def run(self):
+        if self.stop_event.wait(self.initial_delay):
+            return
+        while not self.stop_event.is_set():
+            try:
+                self.reconcile()
+                if self.sweep_orphans:
+                    self.sweep()
+            except Exception as e:
+                print(f"Virhe arkiston täsmäytyksessä: {e}")
+            if self.stop_event.wait(self.interval):
+                return
+
+    def _throttle(self, started, scanned):
+        # Pidetään läpikäynti annetussa tiedostoa/s -tahdissa, jottei se kilpaile luokittelun kanssa levystä
+        if self.files_per_second <= 0:
+            return
+        ahead = scanned / self.files_per_second - (time.monotonic() - started)
+        if ahead > 0:
+            self.stop_event.wait(ahead)
+
+    def iter_unindexed(self):
+        """Käy aktiiviset aikatasot läpi ja tuota (suhteellinen polku, täysi polku) tietokannasta puuttuville kuville"""
+        started = time.monotonic()
+        scanned = 0
+        for level in active_levels():
+            stack = [os.path.join(str(self.base_path), level['dir'])]
+            while stack and not self.stop_event.is_set():
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as entries:
+                        entries = list(entries)
+                except OSError:
+                    continue
+                for entry in entries:
+                    scanned += 1
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    rel_path = os.path.relpath(entry.path, str(self.base_path)).replace(os.sep, '/')
+                    if rel_path not in self.db.images:
+                        yield rel_path, entry.path
+                self._throttle(started, scanned)
+
+    def reconcile(self):
+        """Yksi täsmäytyskierros. Palauttaa lisättyjen kuvien määrän."""
+        self.running = True
+        added = 0
+        batch = []
+        try:
+            for item in self.iter_unindexed():
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    added += self._register(batch)
+                    batch = []
+            if batch:
+                added += self._register(batch)
+        finally:
+            self.running = False
+            self.last_run = datetime.now().isoformat()
+            self.last_added = added
+            self.total_added += added
+        if added:
+            print(f"Täsmäytys lisäsi {added} luokittelun ohi tullutta kuvaa tietokantaan")
+        return added
+
+    def _register(self, batch):
+        # INGEST_LOCK: käynnissä oleva luokittelu on luonut linkin mutta ei vielä indeksoinut sitä,
+        # joten odotetaan sen valmistumista ja tarkistetaan tietokanta uudelleen lukon alla
+        added = 0
+        with INGEST_LOCK:
+            for rel_path, full_path in batch:
+                if rel_path in self.db.images:
+                    continue
+                try:
+                    timestamp = datetime.fromtimestamp(os.stat(full_path).st_mtime).isoformat()
+                except OSError:
+                    continue
+                category = category_from_rel_path(rel_path) or 'unknown'
+                # Oma transaktio kullekin kuvalle: epäonnistunut lisäys perutaan eikä kaada muuta erää
+                try:
+                    with self.db.transaction(save=False):
+                        self.db.add_image(full_path, timestamp, category, 'filesystem')
+                except Exception:
+                    continue
+                added += 1
+            if added:
+                self.db.save_database()
+        return added
+
+    def sweep(self):
+        """Tarkista tietokannan tietueiden tiedostot rajoitetulla nopeudella ja päivitä puuttuvien
+        merkinnät. Palauttaa (uudet puuttuvat, taas löytyneet)."""
+        self.running = True
+        started = time.monotonic()
+        # Jos tason kansio puuttuu kokonaan (esim. verkkolevy ei ole liitettynä), sen tietueita ei merkitä
+        present_roots = {entry.name for entry in os.scandir(self.base_path) if entry.is_dir()} if self.base_path.is_dir() else set()
+        changes = []
+        lost = found = missing = 0
+        try:
+            # Polut ja puuttuvan merkinnät luetaan laiskasti; koko tietuetta ei pureta
+            for scanned, (rel_path, was_missing) in enumerate(self.db.images.missing_entries(), 1):
+                if self.stop_event.is_set():
+                    break
+                if rel_path.split('/', 1)[0] not in present_roots:
+                    continue
+                # os.stat seuraa symlinkkiä, joten lähteen poistanut linkki on orpo
+                exists = os.path.exists(os.path.join(str(self.base_path), rel_path))
+                missing += not exists
+                if exists == was_missing:
+                    changes.append(rel_path)
+                if len(changes) >= self.batch_size:
+                    lost, found = self._apply_missing(changes, lost, found)
+                    changes = []
+                if scanned % self.batch_size == 0:
+                    self._throttle(started, scanned)
+            if changes:
+                lost, found = self._apply_missing(changes, lost, found)
+        finally:
+            self.running = False
+            self.last_sweep = datetime.now().isoformat()
+        self.missing = missing
+        if lost or found:
+            self.db.save_database()
+            print(f"Orpojen tarkistus: {lost} kuvaa puuttuu, {found} löytyi uudelleen")
+        return lost, found
+
+    def _apply_missing(self, changes, lost, found):
+        # Tila tarkistetaan uudelleen lukon alla: luokittelu on voinut luoda tiedoston välillä uudelleen
+        with self.db.lock:
+            for rel_path in changes:
+                missing = not os.path.exists(os.path.join(str(self.base_path), rel_path))
+                if self.db.set_missing(rel_path, missing):
+                    if missing:
+                        lost += 1
+                    else:
+                        found += 1
+        return lost, found
@@ -0,0 +1,88 @@
+"""
+EXIF-päivämäärän lukemisen mikrobenchmark: kevyt otsakelukija vs. PIL.
+
+Käyttö:
+    python benchmarks/bench_exif.py /polku/kameroiden/kuviin [--repeat 3] [--limit 2000] [--json tulos.json]
+
+Ajaa molemmat polut samoille tiedostoille, tarkistaa että päivämäärät ja lähteet
+täsmäävät ja tulostaa keskimääräisen ajan kuvaa kohden. Tiedostot luetaan ensin
+muistiin, jotta mitataan jäsentämistä eikä levyä.
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from classify_images import IMAGE_EXTENSIONS, get_pil_metadata_date  # noqa: E402
+from exif_reader import EXIF_HEADER_BYTES, parse_exif_date  # noqa: E402
+
+
+def header_path(file_path, data):
+    parsed = parse_exif_date(data[:EXIF_HEADER_BYTES])
+    if parsed is None:
+        return get_pil_metadata_date(file_path, data)
+    return parsed
+
+
+def pil_path(file_path, data):
+    return get_pil_metadata_date(file_path, data)
+
+
+def time_path(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file_path, data in corpus:
+            func(file_path, data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXIF-otsakelukijan mikrobenchmark')
+    parser.add_argument('corpus', help='kansio, jossa kameroiden kuvia')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=2000)
+    parser.add_argument('--json', help='kirjoita tulokset JSON-tiedostoon')
+    args = parser.parse_args()
+
+    files = [p for p in sorted(Path(args.corpus).rglob('*')) if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS]
+    files = files[:args.limit]
+    if not files:
+        print(f"Kansiosta {args.corpus} ei löytynyt kuvia")
+        return 1
+    corpus = [(p, p.read_bytes()) for p in files]
+
+    mismatches = []
+    fallback = 0
+    for file_path, data in corpus:
+        if parse_exif_date(data[:EXIF_HEADER_BYTES]) is None:
+            fallback += 1
+        if header_path(file_path, data) != pil_path(file_path, data):
+            mismatches.append(str(file_path))
+
+    pil_seconds = time_path(pil_path, corpus, args.repeat)
+    header_seconds = time_path(header_path, corpus, args.repeat)
+    result = {
+        'files': len(corpus),
+        'pil_us_per_file': round(pil_seconds / len(corpus) * 1e6, 1),
+        'header_us_per_file': round(header_seconds / len(corpus) * 1e6, 1),
+        'speedup': round(pil_seconds / header_seconds, 2) if header_seconds > 0 else None,
+        'pil_fallbacks': fallback,
+        'mismatches': len(mismatches),
+    }
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    for path in mismatches[:10]:
+        print(f"  eroava tulos: {path}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2), encoding='utf-8')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
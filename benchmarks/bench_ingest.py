@@ -0,0 +1,200 @@
+"""
+Luokitteluputken läpimenotestit synteettisellä kamerakorpuksella.
+
+Käyttö:
+    python benchmarks/bench_ingest.py [--count 2000] [--modes symlink,hardlink,copy] [--workers 1]
+        [--corpus /tmp/korpus] [--workdir /tmp/bench] [--json tulos.json] [--compare edellinen.json]
+
+Luo korpuksen (make_corpus.py) tai käyttää annettua, ja ajaa jokaisella LINK_MODE-arvolla
+classify_images_hierarchical-putken tyhjään kohdekansioon. Mitataan:
+  - putken vaiheet (discovery, extract, dedup, link, index) luokittelun omasta mittauksesta
+  - EXIF-päivämäärän ja hashin laskenta erikseen samoille tiedostoille
+  - tietokannan tallennus, koko arkiston uudelleenskannaus ja toistoajo (kaikki ohitetaan)
+Tulokset tulostetaan ja --json kirjoittaa ne koneluettavana. --compare vertaa aiempaan
+tulostiedostoon ja näyttää muutoksen prosentteina, jolloin eri committien tuloksia voi verrata.
+Kohdekansio on hyvä pitää samalla tiedostojärjestelmällä kuin korpus (hardlink).
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import contextlib
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from make_corpus import generate_corpus  # noqa: E402
+from app import ImageDatabase  # noqa: E402
+from classify_images import (classify_images_hierarchical, get_image_hash, get_image_metadata_date,  # noqa: E402
+                             iter_image_files, read_image_file)
+
+LINK_MODES = ('symlink', 'hardlink', 'copy')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _rate(files, seconds):
+    return round(files / seconds, 1) if seconds > 0 else None
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+@contextlib.contextmanager
+def _quiet(enabled=True):
+    # Luokittelu tulostaa rivin jokaisesta kuvasta; tulostus ohjataan pois, ettei pääte hidasta mittausta
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_metadata(corpus):
+    """EXIF-päivämäärä ja hash erikseen (tiedostot luetaan ensin muistiin, jotta levy ei vaikuta)"""
+    files = [path for path, _ in iter_image_files(corpus)]
+    data = [(path, read_image_file(path)[0]) for path in files]
+    _, exif_seconds = _timed(lambda: [get_image_metadata_date(path, content) for path, content in data])
+    _, hash_seconds = _timed(lambda: [get_image_hash(path, content) for path, content in data])
+    return {
+        'exif': {'files': len(data), 'seconds': round(exif_seconds, 3), 'files_per_sec': _rate(len(data), exif_seconds)},
+        'hash': {'files': len(data), 'seconds': round(hash_seconds, 3), 'files_per_sec': _rate(len(data), hash_seconds)},
+    }
+
+
+def bench_mode(corpus, workdir, mode, workers, quiet=True):
+    target = Path(workdir) / f"classified-{mode}"
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir(parents=True)
+    os.environ['LINK_MODE'] = mode
+    db = ImageDatabase(target)
+
+    with _quiet(quiet):
+        result, total_seconds = _timed(classify_images_hierarchical, str(corpus), str(target), db, workers=workers)
+    if 'error' in result:
+        raise RuntimeError(f"{mode}: {result['error']}")
+    stages = dict(result['throughput'])
+    processed = result['stats']['total'] - result['stats']['skipped'] - result['stats']['failed']
+
+    with _quiet(quiet):
+        _, save_seconds = _timed(db.save_database)
+        rescanned, rescan_seconds = _timed(db.scan_for_images)
+        rerun, rerun_seconds = _timed(classify_images_hierarchical, str(corpus), str(target), db, workers=workers)
+    records = len(db.images)
+    stages['save'] = {'files': records, 'seconds': round(save_seconds, 3), 'files_per_sec': _rate(records, save_seconds)}
+    stages['rescan'] = {'files': records, 'seconds': round(rescan_seconds, 3), 'files_per_sec': _rate(records, rescan_seconds)}
+    return {
+        'files': result['stats']['total'],
+        'processed': processed,
+        'duplicates': result['stats']['duplicates'],
+        'db_records': records,
+        'rescan_added': rescanned,
+        'total_seconds': round(total_seconds, 3),
+        'files_per_sec': _rate(result['stats']['total'], total_seconds),
+        'rerun_seconds': round(rerun_seconds, 3),
+        'rerun_skipped': rerun.get('stats', {}).get('skipped'),
+        'stages': stages,
+        'link_syscalls': result.get('link_syscalls', {}),
+    }
+
+
+def compare(current, previous):
+    """Tulosta vaiheiden aikojen muutos aiempaan tulokseen nähden"""
+    print(f"\nVertailu: {previous.get('meta', {}).get('commit')} -> {current['meta'].get('commit')}")
+    for mode, values in current['modes'].items():
+        old = previous.get('modes', {}).get(mode)
+        if not old:
+            continue
+        rows = [('total', values['total_seconds'], old.get('total_seconds'))]
+        rows += [(stage, timing['seconds'], old.get('stages', {}).get(stage, {}).get('seconds'))
+                 for stage, timing in values['stages'].items()]
+        for name, new_seconds, old_seconds in rows:
+            if old_seconds:
+                change = (new_seconds - old_seconds) / old_seconds * 100
+                print(f"  {mode:8s} {name:10s} {old_seconds:8.3f} s -> {new_seconds:8.3f} s ({change:+.1f} %)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Luokitteluputken läpimenotestit')
+    parser.add_argument('--count', type=int, default=2000, help='generoitavien kuvien määrä')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--corpus', help='valmis lähdekansio (muuten generoidaan työkansioon)')
+    parser.add_argument('--workdir', default='/tmp/image-classify-bench')
+    parser.add_argument('--modes', default=','.join(LINK_MODES))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='kirjoita tulokset JSON-tiedostoon')
+    parser.add_argument('--compare', help='aiempi JSON-tulos vertailuun')
+    parser.add_argument('--verbose', action='store_true', help='näytä luokittelun tulosteet')
+    parser.add_argument('--keep', action='store_true', help='älä poista työkansiota lopuksi')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    corpus_summary = None
+    if args.corpus:
+        corpus = Path(args.corpus)
+    else:
+        corpus = workdir / 'source'
+        shutil.rmtree(corpus, ignore_errors=True)
+        corpus_summary, generate_seconds = _timed(generate_corpus, corpus, args.count, cameras=args.cameras,
+                                                  seed=args.seed)
+        print(f"Korpus luotu: {corpus_summary['files']} tiedostoa {generate_seconds:.1f} s")
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'corpus': str(corpus),
+            'corpus_summary': corpus_summary,
+            'env': {name: os.environ.get(name) for name in ('DEDUP', 'HASH_ALGORITHM', 'LAYOUT_MODE', 'LINK_LEVELS',
+                                                            'INGEST_ORDER')},
+        },
+        'metadata': bench_metadata(corpus),
+        'modes': {},
+    }
+    for name, timing in results['metadata'].items():
+        print(f"{name:8s} {timing['files']} tiedostoa {timing['seconds']} s ({timing['files_per_sec']} tiedostoa/s)")
+
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        values = bench_mode(corpus, workdir, mode, args.workers, quiet=not args.verbose)
+        results['modes'][mode] = values
+        print(f"\nLINK_MODE={mode}: {values['files']} tiedostoa {values['total_seconds']} s "
+              f"({values['files_per_sec']} tiedostoa/s), toistoajo {values['rerun_seconds']} s")
+        for stage, timing in values['stages'].items():
+            print(f"  {stage:10s} {timing['seconds']:8.3f} s  {timing['files_per_sec']} tiedostoa/s")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, default=str), encoding='utf-8')
+        print(f"\nTulokset kirjoitettu: {args.json}")
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text(encoding='utf-8')))
+    if not args.keep:
+        for mode in results['modes']:
+            shutil.rmtree(workdir / f"classified-{mode}", ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
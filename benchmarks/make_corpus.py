@@ -0,0 +1,108 @@
+"""
+Synteettisen kamerakorpuksen generaattori luokittelun suorituskykytesteihin.
+
+Käyttö:
+    python benchmarks/make_corpus.py /tmp/korpus --count 5000 [--cameras 4] [--exif-ratio 0.3]
+        [--plain-ratio 0.1] [--duplicate-ratio 0.05] [--seed 1]
+
+Luo kameroittain kansiot, joissa on pieniä JPEG-kuvia:
+  - kameran kuvat nimellä <kamera>-<epoch>.<desimaalit>-<tunniste>.jpg (aika tiedostonimestä)
+  - osa kuvista EXIF-päivämäärällä ja nimellä IMG_<n>.jpg (aika EXIFistä)
+  - osa kuvista ilman aikatietoa (aika tiedoston mtimesta)
+  - duplikaatteja: sama sisältö eri nimellä
+Jokaisen kuvan sisältö on uniikki (duplikaatteja lukuun ottamatta), jotta hash-vertailu
+toimii kuten oikeilla kuvilla. Sama siemen tuottaa saman korpuksen.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+CAMERA_NAMES = ['1-Piha', '2-Ovi', '3-Autotalli', '4-Takapiha', '5-Katto', '6-Portti', '7-Varasto', '8-Pihatie']
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL = 36867
+
+
+def _frame(rng, size):
+    # Satunnainen väri ja muutama pikseli riittävät tekemään sisällöstä uniikin
+    image = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    pixels = image.load()
+    for _ in range(8):
+        pixels[rng.randrange(size[0]), rng.randrange(size[1])] = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    return image
+
+
+def generate_corpus(target, count, cameras=4, exif_ratio=0.3, plain_ratio=0.1, duplicate_ratio=0.05, seed=1,
+                    size=(64, 48), start=None, interval_seconds=5):
+    """Luo korpus kansioon target. Palauttaa yhteenvedon (dict)."""
+    rng = random.Random(seed)
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    start = start or datetime(2025, 11, 1, 8, 0, 0)
+    names = CAMERA_NAMES[:max(1, min(cameras, len(CAMERA_NAMES)))]
+    summary = {'files': 0, 'filename': 0, 'exif': 0, 'plain': 0, 'duplicates': 0, 'bytes': 0}
+    created = []
+
+    for index in range(count):
+        camera = names[index % len(names)]
+        camera_dir = target / camera
+        camera_dir.mkdir(exist_ok=True)
+        moment = start + timedelta(seconds=index * interval_seconds + rng.random())
+        image = _frame(rng, size)
+        roll = rng.random()
+        if roll < exif_ratio:
+            exif = Image.Exif()
+            exif[EXIF_IFD] = {DATETIME_ORIGINAL: moment.strftime('%Y:%m:%d %H:%M:%S')}
+            path = camera_dir / f"IMG_{index:07d}.jpg"
+            image.save(path, format='JPEG', quality=80, exif=exif)
+            summary['exif'] += 1
+        elif roll < exif_ratio + plain_ratio:
+            path = camera_dir / f"frame_{index:07d}.jpg"
+            image.save(path, format='JPEG', quality=80)
+            epoch = moment.timestamp()
+            os.utime(path, (epoch, epoch))
+            summary['plain'] += 1
+        else:
+            suffix = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(6))
+            path = camera_dir / f"{camera}-{moment.timestamp():.6f}-{suffix}.jpg"
+            image.save(path, format='JPEG', quality=80)
+            summary['filename'] += 1
+        created.append(path)
+        summary['files'] += 1
+        summary['bytes'] += path.stat().st_size
+
+    for index in range(int(count * duplicate_ratio)):
+        original = rng.choice(created)
+        duplicate = original.with_name(f"copy_{index:06d}_{original.name}")
+        shutil.copy2(original, duplicate)
+        summary['duplicates'] += 1
+        summary['files'] += 1
+        summary['bytes'] += duplicate.stat().st_size
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synteettisen kamerakorpuksen generaattori')
+    parser.add_argument('target', help='kohdekansio (luodaan)')
+    parser.add_argument('--count', type=int, default=1000, help='uniikkien kuvien määrä')
+    parser.add_argument('--cameras', type=int, default=4)
+    parser.add_argument('--exif-ratio', type=float, default=0.3, help='osuus kuvista EXIF-päivämäärällä')
+    parser.add_argument('--plain-ratio', type=float, default=0.1, help='osuus kuvista ilman aikatietoa')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05, help='duplikaattien osuus kuvamäärästä')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    summary = generate_corpus(args.target, args.count, args.cameras, args.exif_ratio, args.plain_ratio,
+                              args.duplicate_ratio, args.seed)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import os
+import json
+import threading
+from pathlib import Path
+
+from durable_io import atomic_write_text
+from time_hierarchy import LEVEL_DIRS, is_shard_dir
+
+def _folder_parts(rel_path):
+    """Polun osat ilman jakokansioita (SHARD_LEVELS), jotka eivät ole omia aikakansioitaan"""
+    parts = rel_path.replace(os.sep, '/').split('/')
+    if len(parts) < 2:
+        return parts
+    return parts[:1] + [part for part in parts[1:-1] if not is_shard_dir(part)] + parts[-1:]
+
+# Tallennusmuodon versio: vanhemmat tiedostot (jakokansiot laskettu aikakansioiksi) rakennetaan uudelleen
+COUNTS_FORMAT = 2
+
+class CategoryCounts:
+    """Aikakategorioiden kuva- ja kansiomäärät ylläpidettynä tietokannan lisäysten mukana.
+
+    Jokaiselle tasolle (years, months, ...) pidetään kuvien kokonaismäärä ja jokaisen
+    alikansion kuvamäärä alikansioineen, joten tulokset, /api/categories ja selauksen
+    kansiomäärät saadaan ilman os.walk-läpikäyntiä. Määrät tallennetaan tiedostoon
+    category_counts.json; jos tiedosto puuttuu tai ei vastaa tietokantaa, määrät
+    rakennetaan tietokannan tietueista (muistissa, ei levyltä). Journal-tallennuksessa
+    määrät tallennetaan tilannekuvan mukana (state()/restore()) eikä tiedostoa käytetä.
+    """
+
+    def __init__(self, base_path, load=True):
+        self.base_path = Path(base_path)
+        self.counts_file = self.base_path / 'category_counts.json'
+        self.levels = {}  # tason kansio -> {'images': int, 'folders': {kansiopolku: kuvamäärä}}
+        self.total = 0
+        self.lock = threading.Lock()
+        self.loaded = self.load_counts() if load else False
+
+    def load_counts(self):
+        if not self.counts_file.exists():
+            return False
+        try:
+            with open(self.counts_file, 'r', encoding='utf-8') as f:
+                return self.restore(json.load(f))
+        except Exception as e:
+            print(f"Virhe kategoriamäärien lataamisessa: {e}")
+            self.levels = {}
+            self.total = 0
+            return False
+
+    def save_counts(self):
+        try:
+            atomic_write_text(self.counts_file, json.dumps(self.state(), ensure_ascii=False))
+        except Exception as e:
+            print(f"Virhe kategoriamäärien tallennuksessa: {e}")
+
+    def state(self):
+        """Määrät tallennettavassa muodossa"""
+        with self.lock:
+            return {'format': COUNTS_FORMAT, 'total': self.total,
+                    'levels': {name: {'images': level['images'], 'folders': dict(level['folders'])}
+                               for name, level in self.levels.items()}}
+
+    def restore(self, data):
+        """Ota käyttöön state():n tuottamat määrät. Palauttaa False, jos ne puuttuvat tai ovat vanhaa muotoa."""
+        if not isinstance(data, dict) or data.get('format') != COUNTS_FORMAT:
+            return False
+        with self.lock:
+            self.levels = data.get('levels', {})
+            self.total = data.get('total', 0)
+        return True
+
+    def rebuild(self, images):
+        """Laske määrät uudelleen tietokannan tietueista"""
+        with self.lock:
+            self.levels = {}
+            self.total = 0
+        for rel_path in list(images):
+            self.add(rel_path)
+
+    def add(self, rel_path):
+        """Kirjaa uusi tietokantatietue (kutsutaan vain kun polku on tietokannassa uusi)"""
+        parts = _folder_parts(rel_path)
+        with self.lock:
+            self.total += 1
+            if parts[0] not in LEVEL_DIRS or len(parts) < 2:
+                return
+            level = self.levels.setdefault(parts[0], {'images': 0, 'folders': {}})
+            level['images'] += 1
+            folders = level['folders']
+            for depth in range(2, len(parts)):
+                folder = '/'.join(parts[1:depth])
+                folders[folder] = folders.get(folder, 0) + 1
+
+    def remove(self, rel_path):
+        """Poista tietokannasta poistunut tietue määristä (add():n käänteinen)"""
+        parts = _folder_parts(rel_path)
+        with self.lock:
+            self.total -= 1
+            level = self.levels.get(parts[0])
+            if level is None or len(parts) < 2:
+                return
+            level['images'] -= 1
+            folders = level['folders']
+            for depth in range(2, len(parts)):
+                folder = '/'.join(parts[1:depth])
+                remaining = folders.get(folder, 0) - 1
+                if remaining > 0:
+                    folders[folder] = remaining
+                else:
+                    folders.pop(folder, None)
+
+    def summary(self, level_dir):
+        """Palauta (kansioiden määrä, kuvien määrä) tason alla"""
+        with self.lock:
+            level = self.levels.get(level_dir)
+            if not level:
+                return 0, 0
+            return len(level['folders']), level['images']
+
+    def count(self, rel_folder):
+        """Kuvien määrä kansiossa (esim. 'days' tai 'days/2025/11') alikansioineen"""
+        parts = rel_folder.strip('/').split('/')
+        with self.lock:
+            level = self.levels.get(parts[0])
+            if not level:
+                return 0
+            if len(parts) == 1:
+                return level['images']
+            return level['folders'].get('/'.join(parts[1:]), 0)
@@ -1,18 +1,54 @@
+import io
+import multiprocessing
 import os
-import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import hashlib
 from PIL import Image
 from PIL.ExifTags import TAGS
+from ingest_checkpoint import IngestCheckpoint
+from ingest_manifest import IngestManifest
+from content_store import ContentStore
+from ingest_scheduler import LIVE_INBOX, PriorityScheduler
+from link_executor import LinkExecutor
+from time_hierarchy import active_levels, finest_level, is_virtual_layout, level_paths, shard_parts
+from external_sort import external_sort
+from filename_timestamps import extract_camera_from_filename, parse_filename_timestamp
+from exif_reader import EXIF_HEADER_BYTES, parse_exif_date, read_exif_header
 
-def get_image_hash(file_path):
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.heic', '.jfif'}
+
+# Tiivistealgoritmi (hashlib-nimi). md5 säilyttää yhteensopivuuden vanhojen hashien kanssa,
+# blake2b/sha1 ovat useimmilla koneilla nopeampia.
+HASH_ALGORITHM = os.environ.get('HASH_ALGORITHM', 'md5').lower()
+
+def new_hasher():
+    try:
+        return hashlib.new(HASH_ALGORITHM)
+    except ValueError:
+        print(f"Tuntematon HASH_ALGORITHM {HASH_ALGORITHM}, käytetään md5:tä")
+        return hashlib.md5()
+
+def read_image_file(file_path):
+    """Lue kuvatiedosto yhdellä avauksella. Palauttaa (sisältö, os.stat_result)."""
+    with open(file_path, "rb") as f:
+        file_stat = os.fstat(f.fileno())
+        return f.read(), file_stat
+
+def get_image_hash(file_path, data=None):
     try:
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        hasher = new_hasher()
+        if data is not None:
+            hasher.update(data)
+        else:
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+        return hasher.hexdigest()
     except Exception as e:
         print(f"Virhe hashin laskennassa {file_path}: {e}")
         return None
@@ -20,179 +56,590 @@ def get_image_hash(file_path):
 def get_week_number(date):
     return date.isocalendar()[1]
 
-def get_exif_date(image):
+def _parse_exif_datetime(date_str):
+    for fmt in ('%Y:%m:%d %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(date_str, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def get_exif_date(image, exif_data=None):
     try:
-        exif_data = image._getexif()
+        if exif_data is None:
+            exif_data = image._getexif()
         if exif_data:
             date_tags = [36867, 36868, 306]
             for tag_id in date_tags:
                 if tag_id in exif_data:
-                    date_str = exif_data[tag_id]
-                    try:
-                        return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                    except ValueError:
-                        try:
-                            return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            continue
+                    parsed_date = _parse_exif_datetime(exif_data[tag_id])
+                    if parsed_date:
+                        return parsed_date
     except Exception:
         pass
     return None
 
-def get_image_metadata_date(file_path):
+def get_image_metadata_date(file_path, data=None):
+    """Hae päivämäärä EXIF-tiedoista. JPEG-otsake luetaan kevyellä lukijalla (vain tiedoston alku),
+    muut muodot PIL:llä. Jos data on annettu, tiedostoa ei avata uudelleen."""
     try:
-        with Image.open(file_path) as img:
-            exif_date = get_exif_date(img)
-            if exif_date:
-                return exif_date, 'exif'
+        header = memoryview(data)[:EXIF_HEADER_BYTES] if data is not None else read_exif_header(file_path)
+        parsed = parse_exif_date(header)
+        if parsed is not None:
+            return parsed
+    except OSError as e:
+        print(f"Virhe luettaessa otsaketta {file_path}: {e}")
+    return get_pil_metadata_date(file_path, data)
+
+def get_pil_metadata_date(file_path, data=None):
+    """Hae päivämäärä avaamalla kuva PIL:llä (muodoille, joita otsakelukija ei tue)"""
+    try:
+        with Image.open(io.BytesIO(data) if data is not None else file_path) as img:
             try:
-                if hasattr(img, '_getexif') and img._getexif():
-                    for tag_id, value in img._getexif().items():
-                        tag_name = TAGS.get(tag_id, tag_id)
-                        if 'date' in tag_name.lower() or 'time' in tag_name.lower():
-                            if isinstance(value, str) and len(value) > 8:
-                                try:
-                                    parsed_date = datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
-                                    return parsed_date, 'exif_other'
-                                except ValueError:
-                                    continue
+                exif_data = img._getexif() if hasattr(img, '_getexif') else None
             except Exception:
-                pass
+                exif_data = None
+            if not exif_data:
+                return None, 'none'
+            exif_date = get_exif_date(img, exif_data)
+            if exif_date:
+                return exif_date, 'exif'
+            for tag_id, value in exif_data.items():
+                tag_name = str(TAGS.get(tag_id, tag_id))
+                if 'date' in tag_name.lower() or 'time' in tag_name.lower():
+                    if isinstance(value, str) and len(value) > 8:
+                        try:
+                            parsed_date = datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+                            return parsed_date, 'exif_other'
+                        except ValueError:
+                            continue
     except Exception as e:
         print(f"Virhe avattaessa kuvaa {file_path}: {e}")
     return None, 'none'
 
-def get_best_available_date(file_path):
-    metadata_date, source = get_image_metadata_date(file_path)
+def get_best_available_date(file_path, data=None, file_stat=None):
+    """Paras saatavilla oleva päivämäärä: tiedostonimen aikaleima (ei tiedosto-operaatioita),
+    EXIF, lopuksi tiedoston muokkausaika. Palauttaa (päivämäärä, lähde, kamera), jossa kamera
+    on tiedostonimen poimijan 'camera'-ryhmä tai None."""
+    filename_date, camera = parse_filename_timestamp(Path(file_path).name)
+    if filename_date:
+        return filename_date, 'filename', camera
+    metadata_date, source = get_image_metadata_date(file_path, data)
     if metadata_date:
-        return metadata_date, source
+        return metadata_date, source, camera
     try:
-        filesystem_time = file_path.stat().st_mtime
-        return datetime.fromtimestamp(filesystem_time), 'filesystem'
+        filesystem_time = (file_stat or file_path.stat()).st_mtime
+        return datetime.fromtimestamp(filesystem_time), 'filesystem', camera
     except Exception as e:
         print(f"Virhe aikaleiman haussa {file_path}: {e}")
-        return None, 'none'
+        return None, 'none', camera
+
+# Yksi luokittelu kerrallaan: /api/classify ja tiedostovahti jakavat tietokannan ja manifestin
+INGEST_LOCK = threading.RLock()
+_manifests = {}
+_content_stores = {}
+_checkpoints = {}
+# DEDUP=1 tallentaa jokaisen uniikin sisällön kerran varastoon ja ohittaa duplikaatit ennen linkitystä
+DEDUP_ENABLED = os.environ.get('DEDUP', '1').lower() not in ('0', 'false', 'no')
+
+def get_manifest(target_base_path):
+    """Palauta kohdekansion manifesti (ladataan levyltä vain kerran prosessia kohden)"""
+    key = str(Path(target_base_path))
+    if key not in _manifests:
+        _manifests[key] = IngestManifest(target_base_path)
+    return _manifests[key]
+
+def get_checkpoint(target_base_path):
+    """Palauta kohdekansion luokitteluajon tarkistuspiste"""
+    key = str(Path(target_base_path))
+    if key not in _checkpoints:
+        _checkpoints[key] = IngestCheckpoint(target_base_path)
+    return _checkpoints[key]
+
+def get_content_store(target_base_path):
+    """Palauta kohdekansion sisältövarasto tai None jos DEDUP ei ole käytössä.
+    Virtuaalinen asettelu tarvitsee aina varaston, koska kuvat tallennetaan vain sinne."""
+    if not DEDUP_ENABLED and not is_virtual_layout():
+        return None
+    key = str(Path(target_base_path))
+    if key not in _content_stores:
+        _content_stores[key] = ContentStore(target_base_path)
+    return _content_stores[key]
+
+def get_ingest_workers(workers=None):
+    """Palauta käytettävien työprosessien määrä (INGEST_WORKERS, 0 = kaikki ytimet)"""
+    if workers is None:
+        try:
+            workers = int(os.environ.get('INGEST_WORKERS', '1'))
+        except ValueError:
+            workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def extract_image_info(file_path):
+    """Hae kuvan päivämäärä ja hash yhdellä tiedoston lukukerralla.
+    Ajetaan myös prosessipoolissa, joten palauttaa vain picklattavia arvoja."""
+    try:
+        data, file_stat = read_image_file(file_path)
+        image_date, source, camera = get_best_available_date(file_path, data, file_stat)
+        if not image_date:
+            return file_path, None, source, None, None
+        camera = camera or extract_camera_from_filename(file_path.name) or None
+        return file_path, image_date, source, get_image_hash(file_path, data), camera
+    except Exception as e:
+        print(f"Virhe käsiteltäessä {file_path}: {e}")
+        return file_path, None, 'none', None, None
+
+def iter_image_files(source_path):
+    """Käy lähdekansio läpi os.scandirilla. Palauttaa (polku, stat) -pareja kuvatiedostoista."""
+    pending = [str(source_path)]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            yield Path(entry.path), entry.stat()
+                    except OSError as e:
+                        print(f"Virhe luettaessa {entry.path}: {e}")
+        except OSError as e:
+            print(f"Virhe luettaessa kansiota {current}: {e}")
+
+def _stage_throughput(count, seconds):
+    return {'files': count, 'seconds': round(seconds, 3), 'files_per_sec': round(count / seconds, 1) if seconds > 0 else None}
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+# Muistiraja (Mt) lajittelupuskurille ja käsittelyssä oleville kuvatiedoille
+INGEST_MEMORY_MB = _env_int('INGEST_MEMORY_MB', 256)
+# INGEST_ORDER=priority käsittelee uusimmat kuvat ensin (ingest_scheduler.py), date linkittää kuvat
+# aikajärjestyksessä (vaatii ulkoisen lajittelun), none käsittelee löytymisjärjestyksessä
+INGEST_ORDER = os.environ.get('INGEST_ORDER', 'priority').lower()
+# Prioriteettijärjestyksen ikkuna: näin monesta löydetystä tiedostosta valitaan seuraavaksi käsiteltävä
+INGEST_PRIORITY_WINDOW = _env_int('INGEST_PRIORITY_WINDOW', 4096)
+# Tietokanta ja manifesti tallennetaan näin usein (kuvia / sekunteja) ison ajon aikana
+INGEST_FLUSH_EVERY = _env_int('INGEST_FLUSH_EVERY', 1000)
+INGEST_FLUSH_SECONDS = _env_int('INGEST_FLUSH_SECONDS', 30)
+# Linkitettävien kuvien eräkoko (LinkExecutor ryhmittelee erän operaatiot kohdekansioittain)
+LINK_BATCH_SIZE = _env_int('LINK_BATCH_SIZE', 64)
+# Karkea arvio yhden kuvatietueen (dict, Path, datetime) muistinkäytöstä
+_IMAGE_RECORD_BYTES = 1024
+
+def _timed_stage(name, iterable, timings):
+    """Mittaa generaattorivaiheen kumulatiivisen ajan (sisältää edeltävät vaiheet)"""
+    timing = timings.setdefault(name, {'files': 0, 'seconds': 0.0})
+    iterator = iter(iterable)
+    while True:
+        stage_start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timing['seconds'] += time.perf_counter() - stage_start
+            return
+        timing['seconds'] += time.perf_counter() - stage_start
+        timing['files'] += 1
+        yield item
+
+def discover_stage(source_path, manifest, stats, cancel_event=None):
+    """Vaihe 1: etsi käsittelemättömät kuvatiedostot. cancel_event lopettaa etsinnän."""
+    for file_path, file_stat in iter_image_files(source_path):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        stats['total'] += 1
+        manifest.mark_seen(file_path)
+        if manifest.is_processed(file_path, file_stat):
+            stats['skipped'] += 1
+            continue
+        yield file_path, file_stat
+
+def schedule_stage(files, order, manifest, stats, handed_off=None):
+    """Vaihe 1b: järjestä (polku, stat) -parit käsittelyjärjestykseen. order='priority' käsittelee
+    uusimmat kuvat ensin kameroittain vuorotellen ja ottaa vastaan tiedostovahdin antamat kuvat
+    (LIVE_INBOX) kesken ajon; muuten tiedostot käsitellään löytymisjärjestyksessä. handed_off-joukkoon
+    kerätään vastaanotetut kuvat, jotta keskeytetty ajo voi käsitellä ne loppuun."""
+    if order != 'priority':
+        for file_path, _ in files:
+            yield file_path
+        return
+
+    def accept_injected(file_path, file_stat):
+        stats['total'] += 1
+        manifest.mark_seen(file_path)
+        if manifest.is_processed(file_path, file_stat):
+            stats['skipped'] += 1
+            return False
+        if handed_off is not None:
+            handed_off.add(file_path)
+        return True
+
+    scheduler = PriorityScheduler(window=INGEST_PRIORITY_WINDOW)
+    yield from scheduler.run(files, LIVE_INBOX, accept_injected)
+    if scheduler.stats['injected'] or scheduler.stats['backlog']:
+        print(f"Prioriteettijärjestys: {scheduler.stats['live']} tuoretta, {scheduler.stats['backlog']} ruuhkasta, "
+              f"{scheduler.stats['injected']} tiedostovahdilta kesken ajon")
+
+def extract_image_batch(file_paths):
+    return [extract_image_info(file_path) for file_path in file_paths]
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _worker_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def _extract_results(file_paths, workers, max_in_flight):
+    if workers <= 1:
+        for file_path in file_paths:
+            yield extract_image_info(file_path)
+        return
+    # Rajattu ikkuna keskeneräisiä eriä: pooli pysyy kiireisenä mutta muisti ei kasva syötteen mukana
+    batch_size = max(1, min(64, max_in_flight // (workers * 2)))
+    print(f"Luetaan metatiedot {workers} prosessilla (erä {batch_size})")
+    # Luokittelu ajetaan säikeessä Flaskin, tiedostovahdin ja muiden taustasäikeiden rinnalla. fork kopioisi
+    # niiden pitämät lukot (esim. stdoutin) lapsiprosesseihin ja voisi jumittaa ne, joten työprosessit
+    # käynnistetään forkserverin kautta.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_worker_context()) as executor:
+        pending = deque()
+        for batch in _batched(file_paths, batch_size):
+            pending.append(executor.submit(extract_image_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def extract_stage(file_paths, workers, stats, max_in_flight=1024):
+    """Vaihe 2: lue päivämäärä ja hash, päivitä lähdetilastot"""
+    for file_path, image_date, source, image_hash, camera in _extract_results(file_paths, workers, max_in_flight):
+        if not image_date:
+            stats['failed'] += 1
+            continue
+        if source in stats:
+            stats[source] += 1
+        if not image_hash:
+            continue
+        yield {'path': file_path, 'date': image_date, 'hash': image_hash, 'filename': file_path.name, 'source': source,
+               'camera': camera}
+
+def dedup_stage(images, store, manifest, link_mode, stats):
+    """Tunnista sama sisältö eri tiedostossa tiivisteen perusteella ennen linkitystä.
+    Uusi sisältö tallennetaan varastoon ja kuvan linkit osoittavat siihen."""
+    for image in images:
+        entry = store.lookup(image['hash'])
+        if entry and entry.get('source') != str(image['path']):
+            stats['duplicates'] += 1
+            print(f"Duplikaatti ohitettu: {image['path']} (sama sisältö kuin {entry.get('source')})")
+            try:
+                manifest.mark_processed(image['path'], image['path'].stat(), image)
+            except OSError:
+                pass
+            continue
+        if entry:
+            image['blob'] = store.base_path / entry['path']
+        else:
+            try:
+                image['blob'] = store.put(image, link_mode)
+            except Exception as e:
+                print(f"Virhe tallennettaessa varastoon {image['path']}: {e}")
+        yield image
+
+def link_stage(images, target_base_path, link_mode, counters, batch_size=None):
+    """Vaihe 3: luo kuvalle linkit aikahierarkiaan. Kuvat linkitetään erissä, jolloin
+    LinkExecutor voi käsitellä saman kohdekansion operaatiot yhdellä avauksella."""
+    prepare_hierarchical_structure(target_base_path)
+    with LinkExecutor() as executor:
+        for batch in _batched(images, batch_size or LINK_BATCH_SIZE):
+            planned = [(image, submit_image_links(image, target_base_path, link_mode, executor)) for image in batch]
+            executor.flush()
+            for image, ops in planned:
+                counters['copied'] += collect_image_links(image, ops)
+            yield from batch
+        counters['syscalls'] = executor.stats()
+
+def index_stage(images, db, target_base_path, flush_every=None, flush_seconds=None):
+    """Vaihe 4: lisää linkit tietokantaan ja manifestiin, tallenna säännöllisesti"""
+    flush_every = INGEST_FLUSH_EVERY if flush_every is None else flush_every
+    flush_seconds = INGEST_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+    manifest = get_manifest(target_base_path)
+    since_flush = 0
+    last_flush = time.monotonic()
+    for image in images:
+        # Epäonnistunutta kuvaa ei merkitä manifestiin, joten seuraava ajo yrittää sitä uudelleen
+        if index_image(image, db):
+            # Linkitys voi päivittää lähdetiedoston mtimen (utime symlinkin läpi), joten stat luetaan uudelleen
+            try:
+                manifest.mark_processed(image['path'], image['path'].stat(), image)
+            except OSError as e:
+                print(f"Virhe manifestin päivityksessä {image['path']}: {e}")
+        since_flush += 1
+        if since_flush >= flush_every or time.monotonic() - last_flush >= flush_seconds:
+            save_ingest_state(target_base_path, db)
+            since_flush = 0
+            last_flush = time.monotonic()
+        yield image
+
+def classify_images_hierarchical(source_dir, target_base_dir, db, workers=None, full_reprocess=False, order=None,
+                                 progress=None, cancel_event=None):
+    """Luokittele lähdekansion kuvat virtaavana putkena: etsintä -> metatiedot -> linkitys -> indeksointi.
+
+    Manifestin perusteella jo luokitellut tiedostot ohitetaan, ellei full_reprocess ole päällä
+    (esim. luokittelusääntöjen muuttuessa). order='date' linkittää aikajärjestyksessä ulkoisen
+    lajittelun kautta, muuten kuvat linkitetään heti kun ne on luettu.
+
+    progress(dict) kutsutaan enintään PROGRESS_INTERVAL sekunnin välein (vaihe, löydetyt,
+    käsitellyt, ohitetut...). Kun cancel_event asetetaan, ajo pysähtyy seuraavan kuvan kohdalla,
+    jo indeksoidut kuvat tallennetaan ja tulokseen tulee 'cancelled': True.
+    """
+    with INGEST_LOCK:
+        checkpoint = get_checkpoint(target_base_dir)
+        try:
+            result = _classify_images_hierarchical(source_dir, target_base_dir, db, workers, full_reprocess, order,
+                                                   progress, cancel_event)
+        except Exception:
+            checkpoint.finish('failed')
+            _drain_live_inbox(target_base_dir, db)
+            raise
+        checkpoint.finish('cancelled' if result.get('cancelled') else 'completed')
+        return result
+
+def _drain_live_inbox(target_base_dir, db, handed_off=()):
+    """Keskeytyneelle ajolle annetut tiedostot (tiedostovahti, HTTP-vastaanotto) käsitellään heti,
+    jotteivät ne jää odottamaan seuraavaa ajoa. Jo käsitellyt ohitetaan manifestin perusteella."""
+    pending = set(handed_off)
+    pending.update(LIVE_INBOX.take_orphaned())
+    if not pending:
+        return
+    print(f"Käsitellään {len(pending)} keskeytyneelle ajolle annettua tiedostoa")
+    try:
+        classify_files(sorted(pending), target_base_dir, db)
+    except Exception as e:
+        print(f"Virhe jonoon jääneiden tiedostojen käsittelyssä: {e}")
+
+# Edistymisraportin vähimmäisväli sekunteina
+PROGRESS_INTERVAL = 0.5
+
+class _ProgressReporter:
+    def __init__(self, callback, stats):
+        self.callback = callback
+        self.stats = stats
+        self.stage = 'discovery'
+        self.processed = 0
+        self.discovery_done = False
+        self.last_report = 0.0
+
+    def report(self, stage=None, force=False):
+        if stage:
+            self.stage = stage
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        try:
+            self.callback({'stage': self.stage, 'discovered': self.stats['total'], 'processed': self.processed,
+                           'skipped': self.stats['skipped'], 'failed': self.stats['failed'],
+                           'duplicates': self.stats['duplicates'], 'discovery_done': self.discovery_done})
+        except Exception as e:
+            print(f"Virhe edistymisen raportoinnissa: {e}")
+
+    def track_discovery(self, file_paths):
+        for file_path in file_paths:
+            self.report()
+            yield file_path
+        self.discovery_done = True
+        self.report(force=True)
 
-def classify_images_hierarchical(source_dir, target_base_dir, db):
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.heic', '.jfif'}
+def _classify_images_hierarchical(source_dir, target_base_dir, db, workers, full_reprocess, order,
+                                  progress=None, cancel_event=None):
     source_path = Path(source_dir)
     target_base_path = Path(target_base_dir)
     if not source_path.exists():
         return {"error": f"Lähdekansiota ei löydy: {source_dir}"}
     target_base_path.mkdir(parents=True, exist_ok=True)
-    all_images = []
-    stats = {'total': 0, 'exif': 0, 'exif_other': 0, 'filesystem': 0, 'failed': 0}
-    for file_path in source_path.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            stats['total'] += 1
-            try:
-                image_date, source = get_best_available_date(file_path)
-                if not image_date:
-                    stats['failed'] += 1
-                    continue
-                if source == 'exif':
-                    stats['exif'] += 1
-                elif source == 'exif_other':
-                    stats['exif_other'] += 1
-                elif source == 'filesystem':
-                    stats['filesystem'] += 1
-                image_hash = get_image_hash(file_path)
-                if not image_hash:
-                    continue
-                image_info = {'path': file_path, 'date': image_date, 'hash': image_hash, 'filename': file_path.name, 'source': source}
-                all_images.append(image_info)
-            except Exception as e:
-                stats['failed'] += 1
-    if not all_images:
+    workers = get_ingest_workers(workers)
+    order = (order or INGEST_ORDER).lower()
+    link_mode = os.environ.get('LINK_MODE', 'symlink').lower()
+    max_records = max(1, INGEST_MEMORY_MB * 1024 * 1024 // _IMAGE_RECORD_BYTES)
+    manifest = get_manifest(target_base_path)
+    if full_reprocess:
+        print("Täysi uudelleenkäsittely: ohitetaan manifesti")
+        manifest.clear()
+        # Tyhjennys tallennetaan heti, jotta keskeytynyt täysi ajo jatkuu eikä ohita käsittelemättömiä
+        manifest.save_manifest()
+    get_checkpoint(target_base_path).begin(source_path, full_reprocess)
+    store = get_content_store(target_base_path)
+    stats = {'total': 0, 'filename': 0, 'exif': 0, 'exif_other': 0, 'filesystem': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0}
+    timings = {}
+    counters = {'copied': 0}
+    handed_off = set()
+    manifest.begin_scan()
+
+    stage_names = ['discovery', 'extract']
+    reporter = _ProgressReporter(progress, stats)
+    images = _timed_stage('discovery', reporter.track_discovery(
+        discover_stage(source_path, manifest, stats, cancel_event)), timings)
+    if order == 'priority':
+        stage_names.append('schedule')
+        images = _timed_stage('schedule', schedule_stage(images, order, manifest, stats, handed_off), timings)
+    else:
+        images = schedule_stage(images, order, manifest, stats)
+    images = _timed_stage('extract', extract_stage(images, workers, stats, max_in_flight=min(max_records, 4096)), timings)
+    if store is not None:
+        stage_names.append('dedup')
+        images = _timed_stage('dedup', dedup_stage(images, store, manifest, link_mode, stats), timings)
+    if order == 'date':
+        stage_names.append('sort')
+        images = _timed_stage('sort', external_sort(images, key=lambda x: x['date'], max_items=max_records,
+                                                   spill_dir=os.environ.get('INGEST_SPILL_DIR') or None), timings)
+    stage_names += ['link', 'index']
+    images = _timed_stage('link', link_stage(images, target_base_path, link_mode, counters), timings)
+    images = _timed_stage('index', index_stage(images, db, target_base_path), timings)
+
+    order_names = {'date': 'aikajärjestyksessä', 'priority': 'uusimmat ensin'}
+    print(f"Aloitetaan kuvien luokittelu ({order_names.get(order, 'virtaavana')}, LINK_MODE={link_mode})")
+    reporter.report('classify', force=True)
+    processed = 0
+    cancelled = False
+    date_start = date_end = None
+    for image in images:
+        processed += 1
+        reporter.processed = processed
+        reporter.report()
+        # Kuva on jo indeksoitu, joten se lasketaan aikaväliin ennen keskeytyksen tarkistusta
+        if date_start is None or image['date'] < date_start:
+            date_start = image['date']
+        if date_end is None or image['date'] > date_end:
+            date_end = image['date']
+        if cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+            break
+
+    # Kumulatiivisista ajoista vaihekohtaiset ajat
+    throughput = {}
+    previous_seconds = 0.0
+    for stage in stage_names:
+        timing = timings.get(stage, {'files': 0, 'seconds': 0.0})
+        files = stats['total'] if stage == 'discovery' else timing['files']
+        throughput[stage] = _stage_throughput(files, max(0.0, timing['seconds'] - previous_seconds))
+        previous_seconds = timing['seconds']
+
+    # Keskeytetty etsintä ei näe kaikkia lähdetiedostoja, joten sitä ei voi käyttää tarkistuksiin
+    cancelled = cancelled or (cancel_event is not None and cancel_event.is_set())
+    # Generaattoriketju suljetaan heti, jotta prosessipooli ja avoimet kansiot vapautuvat
+    images.close()
+
+    if not processed and not stats['skipped'] and not stats['duplicates'] and not cancelled:
         return {"error": f"Ei kuvia löytynyt kansiosta {source_dir} tai kaikissa puuttuu päivämäärä"}
-    all_images.sort(key=lambda x: x['date'])
-    copy_results = copy_all_images_to_hierarchical_structure(all_images, target_base_path, db)
-    result = {"stats": stats, "classified": copy_results, "date_range": {"start": all_images[0]['date'].isoformat(), "end": all_images[-1]['date'].isoformat()}}
+
+    reporter.report('finalize', force=True)
+    copy_results = finalize_hierarchical_structure(target_base_path, db)
+    if cancelled:
+        print(f"Luokittelu keskeytetty {processed} kuvan jälkeen")
+        # Tiedostovahdin ja HTTP-vastaanoton antamat kuvat voivat olla vielä jonossa tai kesken putkea
+        _drain_live_inbox(target_base_path, db, handed_off)
+    else:
+        manifest.prune()
+    save_ingest_state(target_base_path, db)
+    print(f"Yhteensä kopioitu {counters['copied']} kuvakopiota hierarkkiseen rakenteeseen")
+    if counters.get('syscalls'):
+        print(f"Linkityksen tiedostojärjestelmäkutsut: {counters['syscalls']}")
+
+    for stage, values in throughput.items():
+        print(f"Vaihe {stage}: {values['files']} tiedostoa {values['seconds']} s ({values['files_per_sec']} tiedostoa/s)")
+    date_range = {"start": date_start.isoformat(), "end": date_end.isoformat()} if processed else None
+    result = {"stats": stats, "classified": copy_results, "date_range": date_range,
+              "throughput": throughput, "workers": workers, "link_syscalls": counters.get('syscalls', {})}
+    if cancelled:
+        result['cancelled'] = True
     return result
 
-def copy_all_images_to_hierarchical_structure(all_images, target_base_path, db):
+def classify_files(file_paths, target_base_dir, db, workers=1, save=True):
+    """Luokittele annetut lähdetiedostot ilman lähdekansion läpikäyntiä (esim. tiedostovahdilta).
+    Manifestissa jo olevat tiedostot ohitetaan. Tulosten laskenta ja tietokannan uudelleenskannaus
+    jätetään tekemättä, jotta yksittäisen kuvan käsittely ei riipu arkiston koosta."""
+    with INGEST_LOCK:
+        target_base_path = Path(target_base_dir)
+        target_base_path.mkdir(parents=True, exist_ok=True)
+        link_mode = os.environ.get('LINK_MODE', 'symlink').lower()
+        manifest = get_manifest(target_base_path)
+        store = get_content_store(target_base_path)
+        stats = {'total': 0, 'filename': 0, 'exif': 0, 'exif_other': 0, 'filesystem': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0}
+        counters = {'copied': 0}
+
+        def candidates():
+            for file_path in file_paths:
+                file_path = Path(file_path)
+                if file_path.suffix.lower() not in IMAGE_EXTENSIONS:
+                    continue
+                try:
+                    file_stat = file_path.stat()
+                except OSError:
+                    continue
+                stats['total'] += 1
+                if manifest.is_processed(file_path, file_stat):
+                    stats['skipped'] += 1
+                    continue
+                yield file_path, file_stat
+
+        # Priority-järjestyksessä otetaan samalla vastaan edellisestä ajosta LIVE_INBOXiin jääneet tiedostot
+        images = schedule_stage(candidates(), INGEST_ORDER, manifest, stats)
+        images = extract_stage(images, get_ingest_workers(workers), stats)
+        if store is not None:
+            images = dedup_stage(images, store, manifest, link_mode, stats)
+        images = link_stage(images, target_base_path, link_mode, counters)
+        images = index_stage(images, db, target_base_path)
+        processed = sum(1 for _ in images)
+        if (processed or stats['duplicates']) and save:
+            save_ingest_state(target_base_path, db)
+        return {'stats': stats, 'processed': processed, 'copied': counters['copied'], 'link_syscalls': counters.get('syscalls', {})}
+
+def save_ingest_state(target_base_dir, db):
+    """Tallenna tarkistuspiste: tietokanta, hash-indeksi, manifesti ja ajon tila tässä järjestyksessä.
+    Manifesti tallennetaan viimeisenä, joten kaatumisen jälkeen se ei koskaan merkitse käsitellyksi
+    kuvaa, jota ei ole tietokannassa; jatkoajo käsittelee tällaiset kuvat uudelleen (linkit ovat jo
+    olemassa, joten ne vain indeksoidaan)."""
+    with INGEST_LOCK:
+        db.save_database()
+        store = get_content_store(target_base_dir)
+        if store is not None:
+            store.save_index()
+        get_manifest(target_base_dir).save_manifest()
+        get_checkpoint(target_base_dir).record(len(db.images))
+
+
+def count_hierarchical_results(target_base_path, db=None):
+    """Laske kuvat ja kansiot jokaisessa aikakategoriassa"""
     results = {}
-    LINK_MODE = os.environ.get('LINK_MODE', 'symlink').lower()
-    
-    print(f"Aloitetaan kuvien kopiointi {len(all_images)} kuvalle")
-    print("Luodaan hierarkkinen kansiorakenne...")
-    
-    # Luodaan ensin pääkansiot
-    main_categories = ['years', 'months', 'weeks', 'days', 'hours', 'minutes', 'seconds']
-    for category in main_categories:
-        (target_base_path / category).mkdir(parents=True, exist_ok=True)
-    
-    total_copied = 0
-    
-    for image in all_images:
-        date = image['date']
-        year = date.year
-        month = date.month
-        week = get_week_number(date)
-        day = date.day
-        hour = date.hour
-        minute = date.minute
-        second = date.second
-        
-        # Määritellään hierarkkiset polut
-        hierarchical_paths = {
-            'year': target_base_path / 'years' / str(year),
-            'month': target_base_path / 'months' / str(year) / f"{month:02d}",
-            'week': target_base_path / 'weeks' / str(year) / f"W{week:02d}",
-            'day': target_base_path / 'days' / str(year) / f"{month:02d}" / f"{day:02d}",
-            'hour': target_base_path / 'hours' / str(year) / f"{month:02d}" / f"{day:02d}" / f"{hour:02d}",
-            'minute': target_base_path / 'minutes' / str(year) / f"{month:02d}" / f"{day:02d}" / f"{hour:02d}" / f"{minute:02d}",
-            'second': target_base_path / 'seconds' / str(year) / f"{month:02d}" / f"{day:02d}" / f"{hour:02d}" / f"{minute:02d}" / f"{second:02d}"
-        }
-        
-        for category_type, target_dir in hierarchical_paths.items():
-            try:
-                # Varmistetaan että kohdekansio on olemassa
-                target_dir.mkdir(parents=True, exist_ok=True)
-                
-                target_file = target_dir / image['filename']
-                
-                if not target_file.exists():
-                    # Kopioi/linkitä tiedosto
-                    if LINK_MODE == 'symlink':
-                        try:
-                            os.symlink(os.path.abspath(str(image['path'])), str(target_file))
-                        except Exception as e:
-                            shutil.copy2(image['path'], target_file)
-                    elif LINK_MODE == 'hardlink':
-                        try:
-                            os.link(image['path'], target_file)
-                        except Exception as e:
-                            shutil.copy2(image['path'], target_file)
-                    else:
-                        shutil.copy2(image['path'], target_file)
-                    
-                    try:
-                        os.utime(target_file, (image['date'].timestamp(), image['date'].timestamp()))
-                    except Exception:
-                        pass
-                    
-                    print(f"Kopioitu {category_type}: {target_file}")
-                    total_copied += 1
-                
-                # Lisää tietokantaan
-                rel_path = str(target_file.relative_to(target_base_path))
-                if rel_path not in db.images:
-                    time_key = f"{year}" if category_type == 'year' else \
-                              f"{year}-{month:02d}" if category_type == 'month' else \
-                              f"{year}-W{week:02d}" if category_type == 'week' else \
-                              f"{year}-{month:02d}-{day:02d}" if category_type == 'day' else \
-                              f"{year}-{month:02d}-{day:02d}-{hour:02d}" if category_type == 'hour' else \
-                              f"{year}-{month:02d}-{day:02d}-{hour:02d}-{minute:02d}" if category_type == 'minute' else \
-                              f"{year}-{month:02d}-{day:02d}-{hour:02d}-{minute:02d}-{second:02d}"
-                    
-                    db.add_image(target_file, image['date'].isoformat(), f"{category_type}_{time_key}", image['source'])
-                    
-            except Exception as e:
-                print(f"Virhe käsiteltäessä {image['filename']} kategoriaan {category_type}: {e}")
-    
-    # Lasketaan tulokset
-    for category in main_categories:
+    if is_virtual_layout() and db is not None:
+        tree = db.get_virtual_tree()
+        for level in active_levels():
+            folder_count, image_count = tree.summary(level['dir'])
+            results[level['level']] = {'folders': folder_count, 'images': image_count}
+        return results
+    if db is not None:
+        # Määrät ylläpidetään tietokannan lisäysten mukana, joten arkistoa ei tarvitse käydä läpi
+        for level in active_levels():
+            folder_count, image_count = db.category_counts.summary(level['dir'])
+            results[level['level']] = {'folders': folder_count, 'images': image_count}
+            print(f"Kategoria {level['dir']}: {image_count} kuvaa {folder_count} kansiossa")
+        return results
+    for category in [level['dir'] for level in active_levels()]:
         category_path = target_base_path / category
         image_count = 0
         folder_count = 0
@@ -206,11 +653,113 @@ def copy_all_images_to_hierarchical_structure(all_images, target_base_path, db):
         category_type = category[:-1]  # Poista 's' lopusta: years -> year
         results[category_type] = {'folders': folder_count, 'images': image_count}
         print(f"Kategoria {category}: {image_count} kuvaa {folder_count} kansiossa")
+    return results
+
+def prepare_hierarchical_structure(target_base_path):
+    """Luo aikakategorioiden pääkansiot"""
+    if is_virtual_layout():
+        return
+    for level in active_levels():
+        (target_base_path / level['dir']).mkdir(parents=True, exist_ok=True)
+
+def submit_image_links(image, target_base_path, link_mode, executor):
+    """Lisää kuvan linkit jokaiseen aikakategoriaan executorin jonoon.
+    Palauttaa listan (kategoria, kohdetiedosto, operaatio)."""
+    paths = level_paths(image['date'])
+    
+    if is_virtual_layout() and image.get('blob'):
+        # Virtuaalinen asettelu: ei linkkejä, tietokantaan vain varaston tiedosto
+        level = finest_level()
+        return [(f"{level}_{paths[level][1]}", image['blob'], None)]
+    
+    # Varastoon tallennettu sisältö: linkit osoittavat blobiin, ja copy-tilassa blobi (joka on jo kopio)
+    # kovalinkitetään, jolloin sisältö on levyllä vain kerran
+    link_source = image.get('blob') or image['path']
+    if image.get('blob') and link_mode == 'copy':
+        link_mode = 'hardlink'
+    mtime = image['date'].timestamp()
+    
+    # Hierarkkiset polut ja niiden aikatunnisteet (vain LINK_LEVELS-tasot)
+    ops = []
+    for level in active_levels():
+        folder_parts, time_key = paths[level['level']]
+        # Jaetuilla tasoilla kuva menee aikakansion alla kamera-/hash-alikansioon (SHARD_LEVELS)
+        folder_parts = folder_parts + shard_parts(level['level'], image.get('camera'), image.get('hash'))
+        target_dir = target_base_path / level['dir'] / Path(*folder_parts)
+        op = executor.submit(link_source, target_dir, image['filename'], link_mode, mtime)
+        ops.append((f"{level['level']}_{time_key}", target_dir / image['filename'], op))
+    return ops
+
+def collect_image_links(image, ops):
+    """Tallenna onnistuneet kohteet image['links'] -listaan indeksointia varten. Palauttaa uusien kopioiden määrän."""
+    copied = 0
+    image['links'] = []
+    for category, target_file, op in ops:
+        if op is not None and op['error'] is not None:
+            print(f"Virhe käsiteltäessä {image['filename']} kategoriaan {category.split('_')[0]}: {op['error']}")
+            continue
+        if op is not None and op['created']:
+            print(f"Kopioitu {category.split('_')[0]}: {target_file}")
+            copied += 1
+        image['links'].append((target_file, category))
+    return copied
+
+def link_image_to_hierarchy(image, target_base_path, link_mode, executor=None):
+    """Linkitä/kopioi kuva jokaiseen aikakategoriaan. Onnistuneet kohteet tallennetaan
+    image['links'] -listaan (kohdetiedosto, kategoria) indeksointia varten.
+    Palauttaa uusien kopioiden määrän."""
+    if executor is None:
+        with LinkExecutor() as own_executor:
+            return link_image_to_hierarchy(image, target_base_path, link_mode, own_executor)
+    ops = submit_image_links(image, target_base_path, link_mode, executor)
+    executor.flush()
+    return collect_image_links(image, ops)
+
+def index_image(image, db):
+    """Lisää kuvan linkit tietokantaan yhtenä transaktiona: joko kaikki kuvan linkit tai ei mitään.
+    Tallennus tehdään erissä (save_ingest_state), ei jokaisen kuvan jälkeen. Palauttaa False, jos
+    indeksointi peruttiin; silloin kuvaa ei saa merkitä manifestiin käsitellyksi."""
+    try:
+        with db.transaction(save=False):
+            for target_file, category in image.get('links', []):
+                rel_path = str(target_file.relative_to(db.base_path))
+                if rel_path not in db.images:
+                    db.add_image(target_file, image['date'].isoformat(), category, image['source'], image.get('camera'),
+                                 filename=image['filename'], content_hash=image.get('hash'))
+                else:
+                    # Linkki on juuri luotu tai todettu olemassa olevaksi, joten mahdollinen puuttumismerkintä poistetaan
+                    db.set_missing(rel_path, False)
+    except Exception as e:
+        print(f"Virhe indeksoitaessa {image['filename']}: {e}")
+        return False
+    return True
+
+def finalize_hierarchical_structure(target_base_path, db):
+    """Laske tulokset ja tallenna tietokanta. Luokittelu on jo rekisteröinyt kaikki luomansa
+    tiedostot, joten arkistoa ei skannata uudelleen; muualta ilmestyneet tiedostot poimii
+    taustalla ajettava ArchiveReconciler."""
+    results = count_hierarchical_results(target_base_path, db)
     
     db.save_database()
-    added_count = db.scan_for_images()
-    if added_count > 0:
-        print(f"Skannauksessa lisätty {added_count} uutta kuvaa tietokantaan")
+    return results
+
+def copy_all_images_to_hierarchical_structure(all_images, target_base_path, db):
+    LINK_MODE = os.environ.get('LINK_MODE', 'symlink').lower()
+    
+    print(f"Aloitetaan kuvien kopiointi {len(all_images)} kuvalle")
+    print("Luodaan hierarkkinen kansiorakenne...")
+    
+    # Luodaan ensin pääkansiot
+    prepare_hierarchical_structure(target_base_path)
+    
+    total_copied = 0
+    
+    with LinkExecutor() as executor:
+        for image in all_images:
+            total_copied += link_image_to_hierarchy(image, target_base_path, LINK_MODE, executor)
+            index_image(image, db)
+    
+    results = finalize_hierarchical_structure(target_base_path, db)
     
     print(f"Yhteensä kopioitu {total_copied} kuvakopiota hierarkkiseen rakenteeseen")
     return results
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime
+from pathlib import Path
+
+from durable_io import JsonJournal
+from fast_copy import copy_file
+
+STORE_DIR_NAME = 'store'
+
+class ContentStore:
+    """Sisältöosoitteinen kuvavarasto.
+
+    Jokainen uniikki kuva tallennetaan kerran polkuun store/<2 merkkiä>/<tiiviste><pääte>
+    ja hash_index.json kertoo tiivisteen perusteella O(1)-ajassa, onko sisältö jo nähty.
+    Aikahierarkian linkit osoittavat varaston tiedostoon. Indeksin muutokset tallennetaan
+    journaaliin (hash_index.json.journal), joten tallennus kirjoittaa vain uudet tiivisteet.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = Path(base_path)
+        self.store_path = self.base_path / STORE_DIR_NAME
+        self.index_file = self.base_path / 'hash_index.json'
+        self.journal = JsonJournal(self.index_file)
+        self.index = self.load_index()
+
+    def load_index(self):
+        try:
+            return self.journal.load()
+        except Exception as e:
+            print(f"Virhe hash-indeksin lataamisessa: {e}")
+            return {}
+
+    def save_index(self):
+        try:
+            self.journal.save(self.index)
+        except Exception as e:
+            print(f"Virhe hash-indeksin tallennuksessa: {e}")
+
+    def lookup(self, digest):
+        """Tiivisteen merkintä tai None. Merkintä, jonka blob ei enää aukea (symlinkki-tilassa
+        alkuperäinen tiedosto on poistettu), ei kelpaa duplikaatin tunnistamiseen, vaan sisältö
+        tallennetaan uudelleen put():lla."""
+        entry = self.index.get(digest)
+        if entry and not (self.base_path / entry['path']).exists():
+            return None
+        return entry
+
+    def blob_path(self, digest, suffix):
+        return self.store_path / digest[:2] / f"{digest}{suffix.lower()}"
+
+    def put(self, image, link_mode):
+        """Tallenna kuvan sisältö varastoon (LINK_MODE:n mukaisesti) ja palauta blobin polku"""
+        digest = image['hash']
+        blob = self.blob_path(digest, image['path'].suffix)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if os.path.lexists(blob) and not blob.exists():
+            # Katkennut symlinkki: osoitetaan blob uuteen lähteeseen, jolloin myös vanhat linkit toimivat taas
+            os.unlink(blob)
+        if not os.path.lexists(blob):
+            if link_mode == 'symlink':
+                try:
+                    os.symlink(os.path.abspath(str(image['path'])), str(blob))
+                except Exception:
+                    copy_file(image['path'], blob)
+            elif link_mode == 'hardlink':
+                try:
+                    os.link(image['path'], blob)
+                except Exception:
+                    copy_file(image['path'], blob)
+            else:
+                copy_file(image['path'], blob)
+        self.index[digest] = {
+            'path': str(blob.relative_to(self.base_path)),
+            'source': str(image['path']),
+            'filename': image['filename'],
+            'added': datetime.now().isoformat()
+        }
+        self.journal.put(digest, self.index[digest])
+        return blob
+
+    def forget(self, digest):
+        if self.index.pop(digest, None) is not None:
+            self.journal.remove(digest)
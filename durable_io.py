@@ -0,0 +1,153 @@
+"""
+Kaatumisen kestävät tiedostokirjoitukset.
+
+Tiedosto kirjoitetaan ensin väliaikaiseen tiedostoon samaan kansioon, synkronoidaan levylle
+(fsync) ja vaihdetaan paikalleen os.replace-kutsulla. Lopuksi synkronoidaan kansio, jotta
+nimenvaihto säilyy myös virtakatkossa. Lukija näkee siis aina joko vanhan tai uuden
+kokonaisen tiedoston, ei koskaan puolikasta.
+"""
+
+import os
+import json
+from pathlib import Path
+
+def fsync_dir(path):
+    try:
+        dir_fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_text(path, text, encoding='utf-8'):
+    tmp_file = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_file, 'w', encoding=encoding) as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    fsync_dir(path.parent)
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Kirjoita data JSON-muodossa atomisesti ja kestävästi (dump_kwargs välitetään json.dump:lle)"""
+    tmp_file = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    fsync_dir(path.parent)
+
+
+def atomic_write_bytes(path, chunks):
+    """Kirjoita bytes-palat (iteroitava) atomisesti ja kestävästi"""
+    tmp_file = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_file, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    fsync_dir(path.parent)
+
+
+_REMOVED = object()
+
+
+class JsonJournal:
+    """JSON-objektitiedosto, jonka muutokset lisätään rivijournaaliin (<tiedosto>.journal).
+
+    save() kirjoittaa vain edellisen tallennuksen jälkeen muuttuneet avaimet yhdellä fsyncillä.
+    Kun journaalissa on vähintään compact_min_entries riviä ja puolet avainten määrästä, koko
+    tiedosto kirjoitetaan atomisesti uudelleen ja journaali poistetaan; kirjoitettu määrä pysyy
+    siis lineaarisena muutosten määrään nähden. Lataus lukee tiedoston ja toistaa journaalin
+    (rivit ovat idempotentteja, joten kesken jäänyt uudelleenkirjoitus ei haittaa).
+    """
+
+    def __init__(self, path, compact_min_entries=10000):
+        self.path = Path(path)
+        self.journal_file = self.path.with_name(self.path.name + '.journal')
+        self.compact_min_entries = compact_min_entries
+        self.pending = {}
+        self.rewrite = False
+        self.journal_entries = 0
+        self.journal = None
+
+    def load(self):
+        """Lue tiedosto ja toista journaali. Katkennut viimeinen rivi poistetaan."""
+        data = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        if not self.journal_file.exists():
+            return data
+        good_offset = 0
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if line.endswith(b'\n'):
+                        good_offset += len(line)
+                        continue
+                    break
+                good_offset += len(line)
+                self.journal_entries += 1
+                if 'v' in entry:
+                    data[entry['k']] = entry['v']
+                else:
+                    data.pop(entry['k'], None)
+        if good_offset < self.journal_file.stat().st_size:
+            print(f"Journaalin keskeneräinen loppu poistettu: {self.journal_file}")
+            os.truncate(self.journal_file, good_offset)
+        return data
+
+    @property
+    def dirty(self):
+        return self.rewrite or bool(self.pending)
+
+    def put(self, key, value):
+        self.pending[key] = value
+
+    def remove(self, key):
+        self.pending[key] = _REMOVED
+
+    def reset(self):
+        """Koko sisältö vaihtui (esim. tyhjennys): seuraava tallennus kirjoittaa tiedoston kokonaan"""
+        self.pending = {}
+        self.rewrite = True
+
+    def save(self, data):
+        """Tallenna muutokset; data on koko nykyinen sisältö (tarvitaan vain uudelleenkirjoituksessa)"""
+        if not self.dirty:
+            return
+        if self.rewrite or self.journal_entries + len(self.pending) >= max(self.compact_min_entries, len(data) // 2):
+            self.compact(data)
+            return
+        lines = [json.dumps({'k': key} if value is _REMOVED else {'k': key, 'v': value}, ensure_ascii=False, default=str)
+                 for key, value in self.pending.items()]
+        if self.journal is None:
+            self.journal = open(self.journal_file, 'ab')
+        self.journal.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_entries += len(lines)
+        self.pending = {}
+
+    def compact(self, data):
+        atomic_write_json(self.path, data, ensure_ascii=False, default=str)
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.journal_file.exists():
+            os.unlink(self.journal_file)
+            fsync_dir(self.path.parent)
+        self.journal_entries = 0
+        self.pending = {}
+        self.rewrite = False
@@ -0,0 +1,137 @@
+"""
+Kevyt EXIF-päivämäärän lukija JPEG-kuville.
+
+Lukee vain tiedoston alun (SOI ... APP1/Exif) ja käy TIFF-rakenteesta läpi
+IFD0:n sekä Exif-alihakemiston ilman PIL.Image.open-kutsua. Palauttaa None,
+jos muotoa ei tunnisteta tai otsake on katkennut, jolloin kutsuja käyttää
+PIL-polkua.
+"""
+
+import struct
+from datetime import datetime
+
+from PIL.ExifTags import TAGS
+
+# JPEG:n APP1-segmentti on enintään 64 KiB, ja se on käytännössä tiedoston alussa
+EXIF_HEADER_BYTES = 64 * 1024
+
+DATE_TAGS = (36867, 36868, 306)  # DateTimeOriginal, DateTimeDigitized, DateTime
+_EXIF_IFD_POINTER = 34665
+_ASCII = 2
+_LONG = 4
+_DATE_TAG_IDS = {tag_id for tag_id, name in TAGS.items() if 'date' in name.lower() or 'time' in name.lower()}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def read_exif_header(file_path, size=EXIF_HEADER_BYTES):
+    with open(file_path, 'rb') as f:
+        return f.read(size)
+
+
+def _find_jpeg_exif(data):
+    """Palauta TIFF-lohkon alku- ja loppuindeksi JPEG:n APP1-segmentistä tai None jos Exifiä ei ole"""
+    if data[:2] != b'\xff\xd8':
+        raise _Unsupported('ei JPEG')
+    offset = 2
+    length = len(data)
+    while True:
+        if offset + 4 > length:
+            raise _Unsupported('otsake katkesi')
+        if data[offset] != 0xFF:
+            raise _Unsupported('virheellinen merkki')
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI tai kuvadatan alku: Exif-segmenttiä ei ole
+            return None
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            offset += 2
+            continue
+        segment_length = struct.unpack_from('>H', data, offset + 2)[0]
+        segment_start = offset + 4
+        segment_end = offset + 2 + segment_length
+        if marker == 0xE1 and data[segment_start:segment_start + 6] == b'Exif\x00\x00':
+            if segment_end > length:
+                raise _Unsupported('Exif-segmentti katkesi')
+            return segment_start + 6, segment_end
+        offset = segment_end
+
+
+def _read_ifd(tiff, offset, endian, wanted):
+    """Lue IFD:n ASCII-kentät wanted-joukosta. Palauttaa (kentät, Exif-alihakemiston offset)."""
+    if offset + 2 > len(tiff):
+        raise _Unsupported('IFD rajojen ulkopuolella')
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    values = {}
+    exif_offset = None
+    entry = offset + 2
+    for _ in range(count):
+        if entry + 12 > len(tiff):
+            raise _Unsupported('IFD katkesi')
+        tag, field_type, value_count = struct.unpack_from(endian + 'HHI', tiff, entry)
+        if tag == _EXIF_IFD_POINTER and field_type == _LONG:
+            exif_offset = struct.unpack_from(endian + 'I', tiff, entry + 8)[0]
+        elif tag in wanted and field_type == _ASCII:
+            if value_count <= 4:
+                raw = tiff[entry + 8:entry + 8 + value_count]
+            else:
+                value_offset = struct.unpack_from(endian + 'I', tiff, entry + 8)[0]
+                if value_offset + value_count > len(tiff):
+                    raise _Unsupported('arvo rajojen ulkopuolella')
+                raw = tiff[value_offset:value_offset + value_count]
+            values[tag] = bytes(raw).split(b'\x00', 1)[0].decode('ascii', 'replace')
+        entry += 12
+    return values, exif_offset
+
+
+def read_exif_date_tags(data):
+    """Palauta {tag_id: arvo} päivämääräkentistä tai None jos muotoa ei tueta"""
+    try:
+        location = _find_jpeg_exif(memoryview(data))
+        if location is None:
+            return {}
+        tiff = memoryview(data)[location[0]:location[1]]
+        byte_order = bytes(tiff[:2])
+        if byte_order == b'II':
+            endian = '<'
+        elif byte_order == b'MM':
+            endian = '>'
+        else:
+            raise _Unsupported('tuntematon tavujärjestys')
+        if struct.unpack_from(endian + 'H', tiff, 2)[0] != 42:
+            raise _Unsupported('ei TIFF-otsaketta')
+        ifd0_offset = struct.unpack_from(endian + 'I', tiff, 4)[0]
+        values, exif_offset = _read_ifd(tiff, ifd0_offset, endian, _DATE_TAG_IDS)
+        if exif_offset:
+            exif_values, _ = _read_ifd(tiff, exif_offset, endian, _DATE_TAG_IDS)
+            values.update(exif_values)
+        return values
+    except (_Unsupported, struct.error):
+        return None
+
+
+def parse_exif_date(data):
+    """Palauta (datetime, lähde) JPEG-otsakkeesta, (None, 'none') jos päivämäärää ei ole,
+    tai None jos muotoa ei voi lukea ilman PIL:iä"""
+    values = read_exif_date_tags(data)
+    if values is None:
+        return None
+    for tag_id in DATE_TAGS:
+        if tag_id in values:
+            for fmt in ('%Y:%m:%d %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+                try:
+                    return datetime.strptime(values[tag_id], fmt), 'exif'
+                except ValueError:
+                    continue
+    for tag_id, value in values.items():
+        if tag_id in DATE_TAGS or len(value) <= 8:
+            continue
+        try:
+            return datetime.strptime(value, '%Y:%m:%d %H:%M:%S'), 'exif_other'
+        except ValueError:
+            continue
+    return None, 'none'
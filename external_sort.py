@@ -0,0 +1,61 @@
+"""
+Ulkoinen lomituslajittelu generaattoreille.
+
+Alkiot kerätään muistiin enintään max_items kerrallaan. Jos syöte ei mahdu
+puskuriin, jokainen täysi puskuri lajitellaan ja kirjoitetaan levylle omaksi
+ajokseen (pickle-virta), ja lopuksi ajot lomitetaan heapq.mergellä. Pienet
+syötteet lajitellaan kokonaan muistissa koskematta levyyn.
+"""
+
+import os
+import heapq
+import pickle
+import tempfile
+
+def _write_run(items, spill_dir):
+    fd, run_path = tempfile.mkstemp(prefix='ingest-sort-', suffix='.run', dir=spill_dir)
+    with os.fdopen(fd, 'wb') as f:
+        for item in items:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+def _read_run(run_path):
+    try:
+        with open(run_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+    finally:
+        try:
+            os.remove(run_path)
+        except OSError:
+            pass
+
+def external_sort(iterable, key, max_items, spill_dir=None):
+    """Lajittele iterable avaimen mukaan käyttäen enintään max_items alkion muistipuskuria"""
+    max_items = max(1, int(max_items))
+    buffer = []
+    run_paths = []
+    try:
+        for item in iterable:
+            buffer.append(item)
+            if len(buffer) >= max_items:
+                buffer.sort(key=key)
+                run_paths.append(_write_run(buffer, spill_dir))
+                buffer = []
+        buffer.sort(key=key)
+        if not run_paths:
+            yield from buffer
+            return
+        print(f"Ulkoinen lajittelu: lomitetaan {len(run_paths) + 1} ajoa")
+        yield from heapq.merge(iter(buffer), *(_read_run(path) for path in run_paths), key=key)
+    finally:
+        # Poista ajot myös jos kuluttaja lopetti kesken
+        for run_path in run_paths:
+            if os.path.exists(run_path):
+                try:
+                    os.remove(run_path)
+                except OSError:
+                    pass
@@ -0,0 +1,138 @@
+"""
+Kopiointi ytimen avulla LINK_MODE=copy -tilaan ja linkkien varakopiointiin.
+
+Kopiointitavat paremmuusjärjestyksessä:
+  reflink          FICLONE-ioctl (btrfs, xfs): tiedosto jakaa lohkot lähteen kanssa, ei dataa kopioida
+  copy_file_range  kopio ytimessä ilman käyttäjätilan puskureita (voi myös käyttää reflinkiä tai palvelinpuolen kopiota)
+  sendfile         vanhempien ytimien ytimensisäinen kopio
+  buffered         tavallinen luku/kirjoitus puskurin kautta
+
+Ensimmäinen toimiva tapa muistetaan tiedostojärjestelmäparille (lähteen ja kohteen st_dev),
+joten epäonnistuvia kutsuja ei yritetä jokaiselle kuvalle uudelleen.
+"""
+
+import os
+import errno
+import shutil
+import threading
+
+FICLONE = 0x40049409
+COPY_METHODS = ('reflink', 'copy_file_range', 'sendfile', 'buffered')
+_BUFFER_SIZE = 1024 * 1024
+# Näillä virheillä tapa ei ole tuettu kyseisellä tiedostojärjestelmällä, ja siirrytään seuraavaan
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EBADF,
+                       getattr(errno, 'EOPNOTSUPP', errno.ENOTSUP), errno.ENOTSUP}
+
+_method_cache = {}
+_cache_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:  # ei-POSIX-alusta
+    fcntl = None
+
+
+def _reflink(src_fd, dst_fd, size):
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, 'FICLONE ei saatavilla')
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range ei saatavilla')
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+        if copied == 0:
+            if offset == 0:
+                # Osa tiedostojärjestelmistä (esim. procfs-tyyppiset) palauttaa 0 vaikka dataa on
+                raise OSError(errno.EINVAL, 'copy_file_range ei kopioinut mitään')
+            break
+        offset += copied
+
+
+def _sendfile(src_fd, dst_fd, size):
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, 'sendfile ei saatavilla')
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            if offset == 0:
+                raise OSError(errno.EINVAL, 'sendfile ei kopioinut mitään')
+            break
+        offset += sent
+
+
+def _buffered(src_fd, dst_fd, size):
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    while True:
+        chunk = os.read(src_fd, _BUFFER_SIZE)
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            written = os.write(dst_fd, view)
+            view = view[written:]
+
+
+_IMPLEMENTATIONS = {'reflink': _reflink, 'copy_file_range': _copy_file_range, 'sendfile': _sendfile,
+                    'buffered': _buffered}
+
+
+def _reset_target(dst_fd):
+    os.ftruncate(dst_fd, 0)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+
+
+def copy_fd(src_fd, dst_fd, cache_key=None):
+    """Kopioi avoimen tiedoston sisältö tyhjään kohdetiedostoon nopeimmalla toimivalla tavalla.
+    Palauttaa käytetyn tavan nimen."""
+    src_stat = os.fstat(src_fd)
+    if cache_key is None:
+        cache_key = (src_stat.st_dev, os.fstat(dst_fd).st_dev)
+    with _cache_lock:
+        first = _method_cache.get(cache_key, COPY_METHODS[0])
+    for method in COPY_METHODS[COPY_METHODS.index(first):]:
+        try:
+            _IMPLEMENTATIONS[method](src_fd, dst_fd, src_stat.st_size)
+        except OSError as e:
+            if method == 'buffered' or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            _reset_target(dst_fd)
+            continue
+        if method != first:
+            with _cache_lock:
+                _method_cache[cache_key] = method
+            print(f"Kopiointitapa tiedostojärjestelmille {cache_key}: {method}")
+        return method
+    raise OSError(errno.EIO, 'kopiointi epäonnistui')
+
+
+def copy_file(source, target):
+    """shutil.copy2:n korvaaja: kopioi sisällön copy_fd:llä ja säilyttää aikaleimat ja oikeudet.
+    Kohde luodaan O_EXCL-lipulla, eikä keskeneräistä kopiota jätetä levylle. Palauttaa käytetyn tavan."""
+    src_fd = os.open(source, os.O_RDONLY)
+    try:
+        dst_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            method = copy_fd(src_fd, dst_fd)
+        except BaseException:
+            os.close(dst_fd)
+            try:
+                os.unlink(target)
+            except OSError:
+                pass
+            raise
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(source, target)
+    return method
+
+
+def cached_methods():
+    """Tiedostojärjestelmäkohtaiset valinnat (esim. /health-tietoihin)"""
+    with _cache_lock:
+        return {f"{src}:{dst}": method for (src, dst), method in _method_cache.items()}
@@ -0,0 +1,106 @@
+"""
+Aikaleiman ja kameran tunnistus kuvatiedoston nimestä.
+
+Kameroiden tiedostonimissä on tarkka epoch-aika, esim.
+'2-Ovi-1762371760.378526-b2yisl.jpg'. Poimijat ovat säännöllisiä lausekkeita,
+joissa on joko nimetty ryhmä 'epoch' (sekunnit, desimaalit sallittu) tai ryhmät
+'year', 'month', 'day', 'hour', 'minute', 'second' (ja valinnainen 'fraction').
+Valinnainen ryhmä 'camera' kertoo kameran nimen.
+
+Poimijat voi korvata ympäristömuuttujalla FILENAME_TIMESTAMP_PATTERNS
+(JSON-lista lausekkeita, tyhjä lista poistaa tunnistuksen käytöstä).
+"""
+
+import os
+import re
+import json
+from datetime import datetime
+
+DEFAULT_TIMESTAMP_PATTERNS = [
+    r'^(?P<camera>.+?)-(?P<epoch>\d{9,11}\.\d+)(?=[-_.]|$)',
+]
+
+# Hyväksytään vain järkevät vuodet, jotta satunnaiset numerosarjat eivät tulkitu aikaleimoiksi
+_MIN_YEAR = 2000
+_MAX_YEAR = 2100
+
+
+def _load_patterns():
+    raw = os.environ.get('FILENAME_TIMESTAMP_PATTERNS')
+    patterns = DEFAULT_TIMESTAMP_PATTERNS
+    if raw:
+        try:
+            patterns = json.loads(raw)
+            if not isinstance(patterns, list):
+                raise ValueError('odotettiin listaa')
+        except ValueError as e:
+            print(f"Virheellinen FILENAME_TIMESTAMP_PATTERNS ({e}), käytetään oletuksia")
+            patterns = DEFAULT_TIMESTAMP_PATTERNS
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error as e:
+            print(f"Virheellinen aikaleimalauseke {pattern!r}: {e}")
+    return compiled
+
+
+TIMESTAMP_PATTERNS = _load_patterns()
+
+
+def _match_to_datetime(match):
+    groups = match.groupdict()
+    if groups.get('epoch'):
+        return datetime.fromtimestamp(float(groups['epoch']))
+    fraction = groups.get('fraction') or '0'
+    return datetime(int(groups['year']), int(groups['month']), int(groups['day']),
+                    int(groups.get('hour') or 0), int(groups.get('minute') or 0), int(groups.get('second') or 0),
+                    int(fraction[:6].ljust(6, '0')))
+
+
+def parse_filename_timestamp(name):
+    """Palauta (datetime, kamera) tiedostonimestä tai (None, None) jos mikään poimija ei täsmää"""
+    base = os.path.basename(name)
+    for pattern in TIMESTAMP_PATTERNS:
+        match = pattern.search(base)
+        if not match:
+            continue
+        try:
+            parsed = _match_to_datetime(match)
+        except (ValueError, OverflowError, OSError, KeyError, TypeError):
+            continue
+        if not _MIN_YEAR <= parsed.year <= _MAX_YEAR:
+            continue
+        camera = (match.groupdict().get('camera') or '').strip() or None
+        return parsed, camera
+    return None, None
+
+
+def filename_camera(name):
+    """Kameran nimi tiedostonimestä: ensisijaisesti aikaleimapoimijan 'camera'-ryhmä,
+    muuten extract_camera_from_filename. Palauttaa None jos kameraa ei tunnisteta."""
+    _, camera = parse_filename_timestamp(name)
+    return camera or extract_camera_from_filename(name) or None
+
+
+def extract_camera_from_filename(name):
+    """
+    Palauttaa kameran nimen kuvatiedoston nimestä.
+    Etsii ensin timestamp-muotoisen segmentin ('-<digits>.<digits>') ja palauttaa kaiken
+    sitä edeltävän osan. Tämä käsittelee kameranimiä, joissa voi olla '-',
+    esim. '2-Ovi-1762371760.378526-b2yisl.jpg' -> '2-Ovi'
+    Fallback: jos timestampia ei löydy, ottaa osan ennen ensimmäistä '-'.
+    """
+    if not name:
+        return ''
+    base = os.path.basename(name)
+
+    # etsi pattern: '-' followed by digits, a dot, then digits (esim. -1762371760.378526)
+    m = re.search(r'-(\d+\.\d+)', base)
+    if m:
+        cam = base[:m.start()]
+        return cam.strip()
+    idx = base.find('-')
+    if idx > 0:
+        return base[:idx].strip()
+    return ''
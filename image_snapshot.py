@@ -0,0 +1,191 @@
+"""
+Tietokannan binäärinen tilannekuva (image_database.snap).
+
+Sarakemuotoinen tiedosto, joka avataan mmapilla: käynnistys lukee vain otsakkeen, ja
+tietueet puretaan vasta kun niitä käytetään. Rivit ovat polun mukaan järjestyksessä,
+joten polulla haku on binäärihaku suoraan mapatusta tiedostosta.
+
+Rakenne (little endian, osiot 8 tavun rajoilla):
+  otsake: MAGIC, versio, rivit, merkkijonot, meta-osion pituus, osioiden alkukohdat (u64)
+  string_offsets: u64 × (merkkijonot + 1)
+  strings: UTF-8-merkkijonot peräkkäin; jokainen eri arvo tallennetaan kerran (internointi),
+           joten toistuvat kategoriat, lähteet, kamerat ja tiedostonimet vievät vain 4 tavua riviä kohden
+  path, timestamp, category, ...: u32-merkkijonotunnisteet riveittäin (NONE = arvo puuttuu)
+  epoch: f64 riveittäin (NaN = aikaleima puuttuu), aikavälihakuja ja aikaindeksiä varten
+  extra: u32-tunniste JSON-merkkijonoon muista kentistä (esim. missing)
+  meta: JSON-objekti tilannekuvan kanssa tallennettavista tiedoista (esim. kategoriamäärät);
+        versiossa 1 osiota ei ole
+"""
+
+import json
+import math
+import mmap
+import struct
+from array import array
+from datetime import datetime
+
+from durable_io import atomic_write_bytes
+
+MAGIC = b'IMGSNAP1'
+VERSION = 2
+NONE = 0xFFFFFFFF
+
+RECORD_COLUMNS = ('timestamp', 'category', 'source', 'filename', 'added', 'camera', 'hash')
+_STRING_COLUMNS = ('path',) + RECORD_COLUMNS + ('extra',)
+_SECTIONS = ('string_offsets', 'strings', 'epoch') + _STRING_COLUMNS + ('meta',)
+# Versio 1 on muuten sama mutta ilman meta-osiota
+_HEADERS = {1: struct.Struct('<8sIIII' + 'Q' * (len(_SECTIONS) - 1)), 2: struct.Struct('<8sIIII' + 'Q' * len(_SECTIONS))}
+_HEADER = _HEADERS[VERSION]
+
+
+def record_epoch(info):
+    """Tietueen aikaleima epoch-sekunteina tai None"""
+    timestamp = info.get('timestamp')
+    try:
+        if isinstance(timestamp, str):
+            return datetime.fromisoformat(timestamp).timestamp()
+        if isinstance(timestamp, datetime):
+            return timestamp.timestamp()
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+    return None
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def write_snapshot(path, records, meta=None):
+    """Kirjoita (polku, tietue) -parit tilannekuvaksi atomisesti. meta tallennetaan sellaisenaan
+    (ImageSnapshot.meta()). Palauttaa rivien määrän."""
+    rows = sorted(records, key=lambda item: item[0])
+    interned = {}
+    strings = []
+
+    def intern(value):
+        if value is None:
+            return NONE
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif not isinstance(value, str):
+            value = str(value)
+        string_id = interned.get(value)
+        if string_id is None:
+            string_id = interned[value] = len(strings)
+            strings.append(value.encode('utf-8'))
+        return string_id
+
+    columns = {name: array('I') for name in _STRING_COLUMNS}
+    epochs = array('d')
+    for rel_path, info in rows:
+        columns['path'].append(intern(rel_path))
+        for name in RECORD_COLUMNS:
+            columns[name].append(intern(info.get(name)))
+        extra = {key: value for key, value in info.items() if key not in RECORD_COLUMNS}
+        columns['extra'].append(intern(json.dumps(extra, ensure_ascii=False, default=str)) if extra else NONE)
+        epoch = record_epoch(info)
+        epochs.append(math.nan if epoch is None else epoch)
+
+    string_offsets = array('Q', [0])
+    for value in strings:
+        string_offsets.append(string_offsets[-1] + len(value))
+    blob = b''.join(strings)
+    sections = {'string_offsets': string_offsets.tobytes(), 'strings': blob, 'epoch': epochs.tobytes(),
+                'meta': json.dumps(meta, ensure_ascii=False).encode('utf-8') if meta else b''}
+    sections.update((name, column.tobytes()) for name, column in columns.items())
+
+    offsets = []
+    position = _HEADER.size + len(_padding(_HEADER.size))
+    for name in _SECTIONS:
+        offsets.append(position)
+        position += len(sections[name]) + len(_padding(len(sections[name])))
+    header = _HEADER.pack(MAGIC, VERSION, len(rows), len(strings), len(sections['meta']), *offsets)
+
+    def chunks():
+        yield header + _padding(len(header))
+        for name in _SECTIONS:
+            yield sections[name]
+            yield _padding(len(sections[name]))
+
+    atomic_write_bytes(path, chunks())
+    return len(rows)
+
+
+class ImageSnapshot:
+    """Vain luku -näkymä mapattuun tilannekuvaan. Rivit puretaan tietueiksi vasta luettaessa."""
+
+    def __init__(self, path):
+        self.file = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<8sI', self.mm, 0)
+        if magic != MAGIC or version not in _HEADERS:
+            raise ValueError(f"Tuntematon tilannekuvan muoto: {path}")
+        values = _HEADERS[version].unpack_from(self.mm, 0)
+        self.rows, self.string_count, self.meta_size = values[2:5]
+        if version == 1:
+            self.meta_size = 0
+        offsets = dict(zip(_SECTIONS, values[5:]))
+        self.meta_start = offsets.get('meta', 0)
+        view = memoryview(self.mm)
+        self.string_offsets = view[offsets['string_offsets']:offsets['string_offsets'] + 8 * (self.string_count + 1)].cast('Q')
+        self.strings_start = offsets['strings']
+        self.epochs = view[offsets['epoch']:offsets['epoch'] + 8 * self.rows].cast('d')
+        self.columns = {name: view[offsets[name]:offsets[name] + 4 * self.rows].cast('I') for name in _STRING_COLUMNS}
+
+    def __len__(self):
+        return self.rows
+
+    def _bytes(self, string_id):
+        start = self.strings_start + self.string_offsets[string_id]
+        return self.mm[start:self.strings_start + self.string_offsets[string_id + 1]]
+
+    def string(self, string_id):
+        if string_id == NONE:
+            return None
+        return self._bytes(string_id).decode('utf-8')
+
+    def path(self, row):
+        return self.string(self.columns['path'][row])
+
+    def find(self, rel_path):
+        """Rivin numero polulle tai -1 (binäärihaku UTF-8-tavuina, sama järjestys kuin merkkijonoilla)"""
+        key = rel_path.encode('utf-8')
+        paths = self.columns['path']
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(paths[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.rows and self._bytes(paths[low]) == key:
+            return low
+        return -1
+
+    def record(self, row):
+        info = {}
+        for name in RECORD_COLUMNS:
+            value = self.string(self.columns[name][row])
+            if value is not None or name in ('timestamp', 'category'):
+                info[name] = value
+        extra = self.columns['extra'][row]
+        if extra != NONE:
+            info.update(json.loads(self.string(extra)))
+        return info
+
+    def meta(self):
+        """Tilannekuvan kanssa tallennetut tiedot ({} jos niitä ei ole)"""
+        if not self.meta_size:
+            return {}
+        return json.loads(self.mm[self.meta_start:self.meta_start + self.meta_size])
+
+    def epoch(self, row):
+        value = self.epochs[row]
+        return None if math.isnan(value) else value
+
+    def category_ids(self, skip_rows=()):
+        column = self.columns['category']
+        if not skip_rows:
+            return set(column)
+        return {column[row] for row in range(self.rows) if row not in skip_rows}
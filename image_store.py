@@ -0,0 +1,559 @@
+"""
+ImageDatabasen tietueiden tallennustavat (DB_BACKEND).
+
+journal: binäärinen tilannekuva image_database.snap avataan mmapilla ja tietueet luetaan
+         siitä vasta tarvittaessa; muutokset pidetään muistissa ja tallennus lisää ne
+         journaaliin image_database.journal, joka tiivistetään taustalla uudeksi
+         tilannekuvaksi (oletus). Vanha image_database.json luetaan vain kerran
+         siirrettäessä ja nimetään sen jälkeen image_database.json.migrated.
+         Vanha asetus DB_BACKEND=json tarkoittaa samaa.
+sqlite:  tietueet ovat SQLite-tietokannassa image_database.sqlite (WAL-tila). Aikaleima
+         (epoch), kamera, kategorian taso ja hash ovat indeksoituja sarakkeita, joten
+         aikavälihaku ei käy kaikkia tietueita läpi. Ensimmäisellä avauksella journal-
+         tallennuksen tiedostot siirretään tietokantaan ja nimetään *.migrated.
+
+Molemmat käyttäytyvät kuten sanakirja (polku -> tietue), ja lisäksi niillä on
+save(), iter_range(), categories() ja epoch_bounds().
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from datetime import datetime
+from pathlib import Path
+
+from image_snapshot import NONE, RECORD_COLUMNS, ImageSnapshot, record_epoch, write_snapshot
+
+DB_BACKENDS = ('journal', 'sqlite')
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Journal tiivistetään tilannekuvaksi, kun siinä on näin monta muutosta tietueiden määrästä riippumatta,
+# joten käynnistyksessä toistettava journaali pysyy lyhyenä myös suurella tietokannalla
+DB_COMPACT_MIN_ENTRIES = _env_int('DB_COMPACT_MIN_ENTRIES', 10000)
+
+_DELETED = object()
+_ABSENT = object()
+
+
+def _in_range(epoch, start_epoch, end_epoch):
+    if epoch is None:
+        return False
+    return (start_epoch is None or epoch >= start_epoch) and (end_epoch is None or epoch < end_epoch)
+
+
+class JournalImageStore(MutableMapping):
+    """Tilannekuva + muutokset: tietueet luetaan mapatusta tilannekuvasta (ImageSnapshot), jonka
+    päällä on muistissa oleva kerros edellisen tiivistyksen jälkeen muuttuneista tietueista.
+
+    image_database.journal on JSON-rivejä ({"op": "put"|"del", "path": ..., "record": ...}).
+    save() lisää journaaliin vain edellisen tallennuksen jälkeen muuttuneet tietueet ja
+    synkronoi ne levylle yhdellä fsyncillä, joten kaatuessa menetetään enintään viimeinen erä
+    eikä mikään tiedosto jää puolikkaaksi (katkennut viimeinen rivi ohitetaan latauksessa).
+    Kun journaali kasvaa, se siirretään nimelle image_database.journal.1 ja taustasäie
+    kirjoittaa uuden tilannekuvan atomisesti; sen jälkeen tilannekuvaan päätyneet muutokset
+    poistetaan muistista ja vanha journaali poistetaan. Lataus avaa tilannekuvan ja toistaa
+    journaalit vanhimmasta alkaen.
+    """
+
+    backend = 'journal'
+
+    def __init__(self, base_path):
+        base_path = Path(base_path)
+        self.snapshot_file = base_path / 'image_database.snap'
+        self.json_file = base_path / 'image_database.json'
+        self.journal_file = base_path / 'image_database.journal'
+        self.rotated_file = base_path / 'image_database.journal.1'
+        self.db_file = self.snapshot_file
+        self.base = None
+        self.overlay = {}  # polku -> tietue tai _DELETED (muutokset tilannekuvan päällä)
+        self.pending = {}  # tallentamattomat muutokset journaalia varten
+        self.size = 0
+        self.journal_entries = 0
+        self.journal = None
+        self.compactor = None
+        # Kutsutaan tiivistyssäikeessä tilannekuvan poluilla; palauttaa tilannekuvaan tallennettavat tiedot (dict)
+        self.snapshot_meta_for = None
+        self.lock = threading.RLock()
+        migrating = self.load()
+        self.replay(self.rotated_file)
+        self.journal_entries = self.replay(self.journal_file, repair=True)
+        if migrating or os.path.exists(self.rotated_file):
+            self.compact()
+
+    def load(self):
+        """Avaa tilannekuva. Palauttaa True, jos tietueet luettiin vanhasta JSON-tiedostosta
+        (jolloin tilannekuva kirjoitetaan heti ja JSON nimetään siirretyksi)."""
+        if self.snapshot_file.exists():
+            try:
+                self.base = ImageSnapshot(self.snapshot_file)
+                self.size = len(self.base)
+                if self.json_file.exists():
+                    # Siirto ehti kirjoittaa tilannekuvan mutta ei nimetä JSONia
+                    os.replace(self.json_file, self.json_file.with_name(self.json_file.name + '.migrated'))
+                return False
+            except Exception as e:
+                print(f"Virhe tilannekuvan avaamisessa: {e}")
+                self.base = None
+                self.size = 0
+        if self.json_file.exists():
+            try:
+                with open(self.json_file, 'r', encoding='utf-8') as f:
+                    images = json.load(f)
+            except Exception as e:
+                print(f"Virhe tietokannan lataamisessa: {e}")
+                return False
+            print(f"Siirretään {len(images)} tietuetta tiedostosta {self.json_file} tilannekuvaan")
+            for rel_path, info in images.items():
+                self._apply(rel_path, info)
+            return True
+        return False
+
+    def replay(self, journal_file, repair=False):
+        """Toista journaalin muutokset. repair=True katkaisee keskeneräisen viimeisen rivin pois."""
+        if not os.path.exists(journal_file):
+            return 0
+        entries = 0
+        good_offset = 0
+        with open(journal_file, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if line.endswith(b'\n'):
+                        print(f"Virheellinen journaalirivi ohitettu: {journal_file}")
+                        good_offset += len(line)
+                        continue
+                    break
+                good_offset += len(line)
+                entries += 1
+                self._apply(entry['path'], _DELETED if entry.get('op') == 'del' else entry['record'])
+        if repair and good_offset < os.path.getsize(journal_file):
+            print(f"Journaalin keskeneräinen loppu poistettu: {journal_file}")
+            os.truncate(journal_file, good_offset)
+        return entries
+
+    def files(self):
+        return [path for path in (self.snapshot_file, self.json_file, self.rotated_file, self.journal_file)
+                if os.path.exists(path)]
+
+    def _present(self, rel_path):
+        value = self.overlay.get(rel_path, _ABSENT)
+        if value is _ABSENT:
+            return self.base is not None and self.base.find(rel_path) >= 0
+        return value is not _DELETED
+
+    def _apply(self, rel_path, info):
+        """Aseta muutos kerrokseen ja päivitä tietueiden määrä. Palauttaa oliko polku olemassa."""
+        present = self._present(rel_path)
+        if info is _DELETED:
+            if not present:
+                return False
+            self.size -= 1
+        elif not present:
+            self.size += 1
+        self.overlay[rel_path] = info
+        return present
+
+    def __getitem__(self, rel_path):
+        value = self.overlay.get(rel_path, _ABSENT)
+        if value is _DELETED:
+            raise KeyError(rel_path)
+        if value is not _ABSENT:
+            return value
+        base = self.base
+        row = base.find(rel_path) if base is not None else -1
+        if row < 0:
+            raise KeyError(rel_path)
+        return base.record(row)
+
+    def __contains__(self, rel_path):
+        return self._present(rel_path)
+
+    def __setitem__(self, rel_path, info):
+        with self.lock:
+            self._apply(rel_path, info)
+            self.pending[rel_path] = info
+
+    def __delitem__(self, rel_path):
+        with self.lock:
+            if not self._apply(rel_path, _DELETED):
+                raise KeyError(rel_path)
+            self.pending[rel_path] = _DELETED
+
+    def __len__(self):
+        return self.size
+
+    def _layers(self):
+        with self.lock:
+            return self.base, dict(self.overlay)
+
+    def _base_rows(self, base, overlay):
+        """Tilannekuvan rivit, joita muistissa oleva kerros ei korvaa: (rivi, polku)"""
+        if base is None:
+            return
+        for row in range(len(base)):
+            rel_path = base.path(row)
+            if rel_path not in overlay:
+                yield row, rel_path
+
+    def __iter__(self):
+        base, overlay = self._layers()
+        keys = [rel_path for _, rel_path in self._base_rows(base, overlay)]
+        keys.extend(rel_path for rel_path, info in overlay.items() if info is not _DELETED)
+        return iter(keys)
+
+    def items(self):
+        base, overlay = self._layers()
+        items = [(rel_path, base.record(row)) for row, rel_path in self._base_rows(base, overlay)]
+        items.extend((rel_path, info) for rel_path, info in overlay.items() if info is not _DELETED)
+        return items
+
+    def values(self):
+        return [info for _, info in self.items()]
+
+    def epoch_entries(self):
+        """(polku, epoch) -parit aikaindeksiä varten purkamatta tietueita (epoch on oma sarakkeensa)"""
+        base, overlay = self._layers()
+        entries = [(rel_path, base.epoch(row)) for row, rel_path in self._base_rows(base, overlay)]
+        entries.extend((rel_path, record_epoch(info)) for rel_path, info in overlay.items() if info is not _DELETED)
+        return entries
+
+    def missing_entries(self):
+        """(polku, puuttuuko) -parit laiskasti purkamatta tietueita: tilannekuvasta luetaan vain
+        polku- ja lisätietosarake (puuttuvan merkintä on lisätiedoissa)"""
+        base, overlay = self._layers()
+        if base is not None:
+            extras = base.columns['extra']
+            for row, rel_path in self._base_rows(base, overlay):
+                extra = extras[row]
+                yield rel_path, extra != NONE and bool(json.loads(base.string(extra)).get('missing'))
+        for rel_path, info in overlay.items():
+            if info is not _DELETED:
+                yield rel_path, bool(info.get('missing'))
+
+    def snapshot_meta(self):
+        """Käytössä olevan tilannekuvan kanssa tallennetut tiedot ({} jos niitä ei ole)"""
+        base = self.base
+        return base.meta() if base is not None else {}
+
+    def snapshot_paths(self):
+        """Tilannekuvan polut (ilman muistissa olevan kerroksen muutoksia)"""
+        base = self.base
+        return [base.path(row) for row in range(len(base))] if base is not None else []
+
+    def snapshot_changes(self):
+        """(polku, olemassa) -parit poluista, joiden olemassaolo eroaa tilannekuvasta"""
+        base, overlay = self._layers()
+        changes = []
+        for rel_path, info in overlay.items():
+            in_base = base is not None and base.find(rel_path) >= 0
+            if in_base == (info is _DELETED):
+                changes.append((rel_path, not in_base))
+        return changes
+
+    def _shadowed_rows(self, base, overlay):
+        return {row for row in (base.find(rel_path) for rel_path in overlay) if row >= 0}
+
+    def _append_pending(self):
+        if not self.pending:
+            return
+        lines = []
+        for rel_path, info in self.pending.items():
+            entry = {'op': 'del', 'path': rel_path} if info is _DELETED else {'op': 'put', 'path': rel_path, 'record': info}
+            lines.append(json.dumps(entry, ensure_ascii=False, default=str))
+        if self.journal is None:
+            self.journal = open(self.journal_file, 'ab')
+        self.journal.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_entries += len(lines)
+        self.pending = {}
+
+    def save(self):
+        """Lisää muuttuneet tietueet journaaliin yhtenä eränä (O(muutokset))"""
+        with self.lock:
+            self._append_pending()
+            if self.journal_entries >= DB_COMPACT_MIN_ENTRIES:
+                self.compact()
+
+    def compact(self, wait=False):
+        """Kirjoita tilannekuva taustalla ja poista sen kattama journaali"""
+        with self.lock:
+            if self.compactor is not None and self.compactor.is_alive():
+                return
+            self._append_pending()
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if os.path.exists(self.journal_file):
+                if os.path.exists(self.rotated_file):
+                    # Edellinen tiivistys jäi kesken: sen journaali on jo toistettu muistiin, joten
+                    # yhdistetään uudet rivit sen perään ja kirjoitetaan tilannekuva molemmista
+                    with open(self.rotated_file, 'ab') as rotated, open(self.journal_file, 'rb') as current:
+                        rotated.write(current.read())
+                        rotated.flush()
+                        os.fsync(rotated.fileno())
+                    os.unlink(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.rotated_file)
+            self.journal_entries = 0
+            # Tietueita ei muuteta paikallaan (muutos korvaa koko tietueen), joten matala kopio riittää
+            base, frozen = self.base, dict(self.overlay)
+            self.compactor = threading.Thread(target=self._write_snapshot, args=(base, frozen), daemon=True,
+                                              name='image-db-compactor')
+            self.compactor.start()
+        if wait:
+            self.compactor.join()
+
+    def _write_snapshot(self, base, frozen):
+        try:
+            records = [(rel_path, base.record(row)) for row, rel_path in self._base_rows(base, frozen)]
+            records.extend((rel_path, info) for rel_path, info in frozen.items() if info is not _DELETED)
+            meta_for = self.snapshot_meta_for
+            meta = meta_for(rel_path for rel_path, _ in records) if meta_for is not None else None
+            count = write_snapshot(self.snapshot_file, records, meta)
+            del records
+            snapshot = ImageSnapshot(self.snapshot_file)
+            with self.lock:
+                self.base = snapshot
+                # Tilannekuvaan päätyneet muutokset poistetaan kerroksesta, ellei niitä ole sen jälkeen muutettu
+                for rel_path, info in frozen.items():
+                    if self.overlay.get(rel_path, _ABSENT) is info:
+                        del self.overlay[rel_path]
+            if os.path.exists(self.rotated_file):
+                os.unlink(self.rotated_file)
+            if self.json_file.exists():
+                os.replace(self.json_file, self.json_file.with_name(self.json_file.name + '.migrated'))
+            print(f"Tietokanta tiivistetty: {count} tietuetta")
+        except Exception as e:
+            print(f"Virhe tietokannan tiivistyksessä: {e}")
+
+    def iter_range(self, start_epoch=None, end_epoch=None):
+        """(polku, tietue) -parit, joiden aikaleima on välillä [start_epoch, end_epoch)"""
+        base, overlay = self._layers()
+        records = []
+        if base is not None:
+            for row in range(len(base)):
+                if _in_range(base.epoch(row), start_epoch, end_epoch):
+                    rel_path = base.path(row)
+                    if rel_path not in overlay:
+                        records.append((rel_path, base.record(row)))
+        records.extend((rel_path, info) for rel_path, info in overlay.items()
+                       if info is not _DELETED and _in_range(record_epoch(info), start_epoch, end_epoch))
+        return records
+
+    def categories(self):
+        base, overlay = self._layers()
+        categories = {info.get('category') for info in overlay.values() if info is not _DELETED}
+        if base is not None:
+            categories.update(base.string(string_id) for string_id in base.category_ids(self._shadowed_rows(base, overlay)))
+        categories.discard(None)
+        return sorted(categories)
+
+    def epoch_bounds(self):
+        base, overlay = self._layers()
+        epochs = [epoch for epoch in (record_epoch(info) for info in overlay.values() if info is not _DELETED)
+                  if epoch is not None]
+        if base is not None:
+            shadowed = self._shadowed_rows(base, overlay)
+            base_epochs = [epoch for epoch in (base.epoch(row) for row in range(len(base)) if row not in shadowed)
+                           if epoch is not None]
+            if base_epochs:
+                epochs += [min(base_epochs), max(base_epochs)]
+        if not epochs:
+            return None, None
+        return min(epochs), max(epochs)
+
+    def close(self):
+        self.save()
+        compactor = self.compactor
+        if compactor is not None:
+            compactor.join()
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+
+_COLUMNS = RECORD_COLUMNS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    rel_path TEXT PRIMARY KEY,
+    epoch REAL,
+    timestamp TEXT,
+    level TEXT,
+    category TEXT,
+    source TEXT,
+    filename TEXT,
+    added TEXT,
+    camera TEXT,
+    hash TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS images_epoch ON images (epoch);
+CREATE INDEX IF NOT EXISTS images_camera ON images (camera, epoch);
+CREATE INDEX IF NOT EXISTS images_level ON images (level, category);
+CREATE INDEX IF NOT EXISTS images_hash ON images (hash);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_SELECT = "SELECT rel_path, " + ', '.join(_COLUMNS) + ", extra FROM images"
+
+
+class SqliteImageStore(MutableMapping):
+    """Sanakirjan kaltainen näkymä SQLite-tauluun. Muutokset kirjoitetaan heti yhteyden
+    avoimeen transaktioon ja save() vahvistaa ne (commit), joten tallennus maksaa
+    muuttuneiden rivien verran. Yhteys on jaettu säikeiden kesken lukon takana."""
+
+    backend = 'sqlite'
+
+    def __init__(self, db_file, migrate_from=None):
+        self.db_file = Path(db_file)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        if migrate_from is not None:
+            self.migrate(Path(migrate_from))
+
+    @staticmethod
+    def _row(rel_path, info):
+        extra = {key: value for key, value in info.items() if key not in _COLUMNS}
+        category = info.get('category')
+        level = category.split('_', 1)[0] if isinstance(category, str) else None
+        timestamp = info.get('timestamp')
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        return (rel_path, record_epoch(info), timestamp, level, category, info.get('source'), info.get('filename'),
+                info.get('added'), info.get('camera'), info.get('hash'),
+                json.dumps(extra, ensure_ascii=False, default=str) if extra else None)
+
+    @staticmethod
+    def _record(row):
+        info = {key: value for key, value in zip(_COLUMNS, row[1:-1]) if value is not None or key in ('timestamp', 'category')}
+        if row[-1]:
+            info.update(json.loads(row[-1]))
+        return info
+
+    def migrate(self, base_path):
+        """Siirrä journal-tallennuksen tietueet (tilannekuva, vanha JSON ja journaalit) kerran SQLiteen"""
+        if not any((base_path / name).exists() for name in ('image_database.snap', 'image_database.json',
+                                                            'image_database.journal', 'image_database.journal.1')):
+            return 0
+        with self.lock:
+            if self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone():
+                return 0
+            images = JournalImageStore(base_path)
+            images.close()
+            self.conn.executemany(f"INSERT OR REPLACE INTO images VALUES ({', '.join('?' * 11)})",
+                                  (self._row(rel_path, info) for rel_path, info in images.items()))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_from', ?)", (str(base_path),))
+            self.conn.commit()
+        for path in images.files():
+            os.replace(path, path.with_name(path.name + '.migrated'))
+        print(f"Siirretty {len(images)} tietuetta kansiosta {base_path} SQLite-tietokantaan")
+        return len(images)
+
+    def __getitem__(self, rel_path):
+        with self.lock:
+            row = self.conn.execute(_SELECT + " WHERE rel_path = ?", (rel_path,)).fetchone()
+        if row is None:
+            raise KeyError(rel_path)
+        return self._record(row)
+
+    def __setitem__(self, rel_path, info):
+        with self.lock:
+            self.conn.execute(f"INSERT OR REPLACE INTO images VALUES ({', '.join('?' * 11)})", self._row(rel_path, info))
+
+    def __delitem__(self, rel_path):
+        with self.lock:
+            if self.conn.execute("DELETE FROM images WHERE rel_path = ?", (rel_path,)).rowcount == 0:
+                raise KeyError(rel_path)
+
+    def __contains__(self, rel_path):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM images WHERE rel_path = ?", (rel_path,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def __iter__(self):
+        # Avaimet haetaan kerralla, jotta iterointi ei pidä kursoria auki samalla kun muut säikeet kirjoittavat
+        with self.lock:
+            keys = [row[0] for row in self.conn.execute("SELECT rel_path FROM images")]
+        return iter(keys)
+
+    def items(self):
+        with self.lock:
+            rows = self.conn.execute(_SELECT).fetchall()
+        return [(row[0], self._record(row)) for row in rows]
+
+    def values(self):
+        return [info for _, info in self.items()]
+
+    def missing_entries(self, chunk_size=5000):
+        """(polku, puuttuuko) -parit paloittain polkujärjestyksessä, jotta lukko ei ole varattuna koko läpikäyntiä"""
+        last = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute("SELECT rel_path, extra FROM images WHERE rel_path > ? ORDER BY rel_path LIMIT ?",
+                                         (last, chunk_size)).fetchall()
+            if not rows:
+                return
+            for rel_path, extra in rows:
+                yield rel_path, bool(extra) and bool(json.loads(extra).get('missing'))
+            last = rows[-1][0]
+
+    def save(self):
+        with self.lock:
+            self.conn.commit()
+
+    def iter_range(self, start_epoch=None, end_epoch=None):
+        conditions, params = ['epoch IS NOT NULL'], []
+        if start_epoch is not None:
+            conditions.append('epoch >= ?')
+            params.append(start_epoch)
+        if end_epoch is not None:
+            conditions.append('epoch < ?')
+            params.append(end_epoch)
+        with self.lock:
+            rows = self.conn.execute(_SELECT + " WHERE " + ' AND '.join(conditions) + " ORDER BY epoch, rel_path", params).fetchall()
+        return [(row[0], self._record(row)) for row in rows]
+
+    def categories(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT category FROM images WHERE category IS NOT NULL ORDER BY category")]
+
+    def epoch_bounds(self):
+        with self.lock:
+            return tuple(self.conn.execute("SELECT MIN(epoch), MAX(epoch) FROM images").fetchone())
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def open_image_store(base_path, backend=None):
+    """Avaa kohdekansion tietuevarasto DB_BACKEND-asetuksen mukaan"""
+    base_path = Path(base_path)
+    backend = (backend or os.environ.get('DB_BACKEND', 'journal')).lower()
+    if backend == 'sqlite':
+        base_path.mkdir(parents=True, exist_ok=True)
+        return SqliteImageStore(base_path / 'image_database.sqlite', migrate_from=base_path)
+    if backend not in ('journal', 'json'):
+        print(f"Tuntematon DB_BACKEND {backend}, käytetään journal-tallennusta")
+    return JournalImageStore(base_path)
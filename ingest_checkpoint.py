@@ -0,0 +1,78 @@
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from durable_io import atomic_write_json
+
+class IngestCheckpoint:
+    """Luokitteluajon tarkistuspiste (ingest_checkpoint.json).
+
+    Ajon alussa tiedostoon kirjataan tila 'running' ja ajon parametrit, jokaisen välitallennuksen
+    jälkeen edistyminen ja lopuksi tila 'completed' tai 'cancelled'. Jos tiedostossa on
+    käynnistettäessä tila 'running', edellinen ajo keskeytyi (esim. kontin uudelleenkäynnistys)
+    ja se voidaan jatkaa: manifesti kertoo jo käsitellyt tiedostot, joten jatkoajo käsittelee
+    vain loput.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = Path(base_path)
+        self.checkpoint_file = self.base_path / 'ingest_checkpoint.json'
+        self.state = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        if self.checkpoint_file.exists():
+            try:
+                with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Virhe tarkistuspisteen lataamisessa: {e}")
+                return {}
+        return {}
+
+    def save_checkpoint(self):
+        try:
+            atomic_write_json(self.checkpoint_file, self.state, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"Virhe tarkistuspisteen tallennuksessa: {e}")
+
+    def is_active(self):
+        return self.state.get('state') == 'running'
+
+    def interrupted_run(self):
+        """Palauta keskeytyneen ajon tiedot tai None"""
+        return dict(self.state) if self.is_active() else None
+
+    def begin(self, source_dir, full_reprocess=False):
+        previous = self.interrupted_run()
+        self.state = {
+            'run_id': uuid.uuid4().hex[:12],
+            'state': 'running',
+            'source': str(source_dir),
+            'full_reprocess': bool(full_reprocess),
+            'started': datetime.now().isoformat(),
+            'checkpoints': 0,
+            'last_checkpoint': None,
+            'indexed': 0,
+            'resumed_from': previous.get('run_id') if previous else None
+        }
+        if previous:
+            print(f"Jatketaan keskeytynyttä luokittelua {previous.get('run_id')} "
+                  f"(viimeisin tarkistuspiste {previous.get('last_checkpoint')})")
+        self.save_checkpoint()
+
+    def record(self, indexed):
+        """Kirjaa tarkistuspiste, kun tietokanta, hash-indeksi ja manifesti on tallennettu"""
+        if not self.is_active():
+            return
+        self.state['checkpoints'] += 1
+        self.state['last_checkpoint'] = datetime.now().isoformat()
+        self.state['indexed'] = indexed
+        self.save_checkpoint()
+
+    def finish(self, state='completed'):
+        if not self.is_active():
+            return
+        self.state['state'] = state
+        self.state['finished'] = datetime.now().isoformat()
+        self.save_checkpoint()
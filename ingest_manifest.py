@@ -0,0 +1,86 @@
+import time
+from datetime import datetime
+from pathlib import Path
+
+from durable_io import JsonJournal
+
+class IngestManifest:
+    """Kirjanpito jo luokitelluista lähdetiedostoista.
+
+    Avaimena on lähdetiedoston polku, ja tiedosto tulkitaan käsitellyksi vain jos
+    sen koko, mtime ja inode ovat samat kuin edellisellä luokittelukerralla.
+
+    Muutokset tallennetaan journaaliin (ingest_manifest.json.journal), joten välitallennus
+    kirjoittaa vain edellisen tallennuksen jälkeen käsitellyt tiedostot. Täyden läpikäynnin
+    aikana nähdyt tiedostot merkitään läpikäynnin tunnisteella (seen), ja prune() poistaa
+    merkinnät, joita läpikäynti ei nähnyt.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = Path(base_path)
+        self.manifest_file = self.base_path / 'ingest_manifest.json'
+        self.journal = JsonJournal(self.manifest_file)
+        self.entries = self.load_manifest()
+        self.generation = None
+
+    def load_manifest(self):
+        try:
+            return self.journal.load()
+        except Exception as e:
+            print(f"Virhe manifestin lataamisessa: {e}")
+            return {}
+
+    def save_manifest(self):
+        try:
+            self.journal.save(self.entries)
+        except Exception as e:
+            print(f"Virhe manifestin tallennuksessa: {e}")
+
+    @staticmethod
+    def _signature(file_stat):
+        return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns, 'inode': file_stat.st_ino}
+
+    def is_processed(self, file_path, file_stat):
+        entry = self.entries.get(str(file_path))
+        if not entry:
+            return False
+        return (entry.get('size') == file_stat.st_size
+                and entry.get('mtime_ns') == file_stat.st_mtime_ns
+                and entry.get('inode') == file_stat.st_ino)
+
+    def mark_processed(self, file_path, file_stat, image_info=None):
+        entry = self._signature(file_stat)
+        if image_info:
+            entry['hash'] = image_info.get('hash')
+            entry['date'] = image_info['date'].isoformat() if image_info.get('date') else None
+            entry['source'] = image_info.get('source')
+        entry['classified'] = datetime.now().isoformat()
+        if self.generation is not None:
+            entry['seen'] = self.generation
+        self.entries[str(file_path)] = entry
+        self.journal.put(str(file_path), entry)
+
+    def begin_scan(self):
+        """Aloita lähdekansion läpikäynti: mark_seen() merkitsee nähdyt tiedostot tällä tunnisteella"""
+        self.generation = time.time_ns()
+        return self.generation
+
+    def mark_seen(self, file_path):
+        # Vain muistissa: merkintä tallentuu, jos tiedosto käsitellään, mutta pelkkä näkeminen ei kirjoita mitään
+        entry = self.entries.get(str(file_path))
+        if entry is not None:
+            entry['seen'] = self.generation
+
+    def prune(self):
+        """Poista merkinnät lähdetiedostoista, joita viimeisin läpikäynti ei nähnyt"""
+        if self.generation is None:
+            return 0
+        removed = [path for path, entry in self.entries.items() if entry.get('seen') != self.generation]
+        for path in removed:
+            del self.entries[path]
+            self.journal.remove(path)
+        return len(removed)
+
+    def clear(self):
+        self.entries = {}
+        self.journal.reset()
@@ -0,0 +1,193 @@
+"""
+Luokitteluputken prioriteettijärjestys: uusimmat kuvat ensin.
+
+Etsinnän löytämät tiedostot kerätään rajattuun ikkunaan ja jaetaan kameroittain
+jonoihin. Tuoreet kuvat (aikaleima tiedostonimestä tai mtimesta, enintään
+INGEST_LIVE_SECONDS vanhoja) käsitellään ensin uusimmasta alkaen, ja kamerat
+vuorottelevat, jottei yhden kameran purkautuva ruuhka jätä muita jonoon.
+Vanhemmalle ruuhkalle varataan INGEST_BACKLOG_SHARE -osuus läpimenosta, joten
+sekin etenee koko ajan.
+
+Käynnissä olevaan ajoon voi lisätä tiedostoja LIVE_INBOX-jonon kautta: tiedostovahti
+antaa uudet kuvat sille sen sijaan, että odottaisi ison ajon valmistumista.
+"""
+
+import os
+import heapq
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from filename_timestamps import filename_camera, parse_filename_timestamp
+
+class LiveInbox:
+    """Käynnissä olevalle ajolle annettavat tiedostot. offer() palauttaa False, jos mikään ajo
+    ei ota tiedostoja vastaan, jolloin kutsujan on käsiteltävä ne itse."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = deque()
+        self.accepting = 0
+
+    def offer(self, file_paths):
+        with self.lock:
+            if not self.accepting:
+                return False
+            self.items.extend(Path(file_path) for file_path in file_paths)
+            return True
+
+    def open(self):
+        with self.lock:
+            self.accepting += 1
+
+    def take(self):
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+            return items
+
+    def close_if_empty(self):
+        """Lopeta vastaanotto, jos jonossa ei ole mitään. Palauttaa True jos suljettiin."""
+        with self.lock:
+            if self.items:
+                return False
+            self.accepting -= 1
+            return True
+
+    def release(self):
+        """Lopeta vastaanotto keskeytyksessä. Jonoon jääneet tiedostot haetaan take_orphaned()-kutsulla."""
+        with self.lock:
+            self.accepting -= 1
+
+    def take_orphaned(self):
+        """Ota jonoon jääneet tiedostot, jos mikään ajo ei enää ota niitä vastaan"""
+        with self.lock:
+            if self.accepting:
+                return []
+            items = list(self.items)
+            self.items.clear()
+            return items
+
+
+LIVE_INBOX = LiveInbox()
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class PriorityScheduler:
+    def __init__(self, window=4096, live_seconds=None, backlog_share=None, now=None):
+        self.window = max(1, window)
+        self.live_seconds = _env_float('INGEST_LIVE_SECONDS', 600) if live_seconds is None else live_seconds
+        share = _env_float('INGEST_BACKLOG_SHARE', 0.2) if backlog_share is None else backlog_share
+        self.backlog_share = min(1.0, max(0.0, share))
+        self.now = now
+        self.queues = {'live': OrderedDict(), 'backlog': OrderedDict()}  # kamera -> keko (-aikaleima, järjestys, polku)
+        self.size = 0
+        self.counter = 0
+        self.credit = 0.0
+        self.scheduled = set()  # jonossa juuri nyt olevat polut; muisti pysyy ikkunan kokoisena
+        self.stats = {'live': 0, 'backlog': 0, 'injected': 0}
+
+    @staticmethod
+    def sort_time(file_path, file_stat):
+        """Aikaleima järjestystä varten: tiedostonimen epoch, muuten mtime"""
+        parsed, _ = parse_filename_timestamp(file_path.name)
+        if parsed is not None:
+            return parsed.timestamp()
+        return file_stat.st_mtime if file_stat is not None else 0.0
+
+    @staticmethod
+    def camera_key(file_path):
+        return filename_camera(file_path.name) or file_path.parent.name
+
+    def push(self, file_path, file_stat):
+        key = str(file_path)
+        if key in self.scheduled:
+            return
+        self.scheduled.add(key)
+        timestamp = self.sort_time(file_path, file_stat)
+        now = self.now if self.now is not None else time.time()
+        kind = 'live' if now - timestamp <= self.live_seconds else 'backlog'
+        queue = self.queues[kind].setdefault(self.camera_key(file_path), [])
+        self.counter += 1
+        heapq.heappush(queue, (-timestamp, self.counter, file_path))
+        self.size += 1
+
+    def _pop_from(self, kind):
+        # Kierretään kameroita: otetaan vuorossa olevan kameran uusin kuva ja siirretään kamera jonon perälle
+        cameras = self.queues[kind]
+        camera, queue = next(iter(cameras.items()))
+        _, _, file_path = heapq.heappop(queue)
+        self.scheduled.discard(str(file_path))
+        del cameras[camera]
+        if queue:
+            cameras[camera] = queue
+        self.size -= 1
+        self.stats[kind] += 1
+        return file_path
+
+    def pop(self):
+        if not self.size:
+            return None
+        has_live = bool(self.queues['live'])
+        has_backlog = bool(self.queues['backlog'])
+        if has_backlog and has_live:
+            self.credit += self.backlog_share
+            if self.credit >= 1.0:
+                self.credit -= 1.0
+                return self._pop_from('backlog')
+            return self._pop_from('live')
+        return self._pop_from('live' if has_live else 'backlog')
+
+    def _take_injected(self, inbox, accept):
+        # Jonossa olevat ohitetaan tässä; jo käsitellyt tiedostot suodattaa accept (manifesti)
+        for file_path in inbox.take():
+            if str(file_path) in self.scheduled:
+                continue
+            try:
+                file_stat = file_path.stat()
+            except OSError:
+                continue
+            if accept is not None and not accept(file_path, file_stat):
+                continue
+            self.stats['injected'] += 1
+            self.push(file_path, file_stat)
+
+    def run(self, items, inbox=None, accept=None):
+        """Järjestä (polku, stat) -parit. Ikkuna pidetään täynnä lukemalla syötettä sitä mukaa kuin
+        tiedostoja annetaan eteenpäin. inbox-jonosta otetaan ajon aikana annetut tiedostot;
+        accept(polku, stat) päättää, käsitelläänkö annettu tiedosto (esim. manifestin perusteella)."""
+        items = iter(items)
+        exhausted = False
+        closed = inbox is None
+        if inbox is not None:
+            inbox.open()
+        try:
+            while True:
+                if inbox is not None:
+                    self._take_injected(inbox, accept)
+                while not exhausted and self.size < self.window:
+                    try:
+                        file_path, file_stat = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    self.push(file_path, file_stat)
+                file_path = self.pop()
+                if file_path is not None:
+                    yield file_path
+                    continue
+                if not exhausted:
+                    continue
+                if closed or inbox.close_if_empty():
+                    closed = True
+                    return
+        finally:
+            if not closed:
+                inbox.release()
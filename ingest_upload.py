@@ -0,0 +1,283 @@
+"""
+HTTP-vastaanotto: kamerat ja reunalaitteet voivat lähettää kuvat suoraan POST /api/ingest
+-kutsulla SFTP:n sijaan.
+
+Pyynnön runko kirjoitetaan paloittain suoraan lopulliseen paikkaansa lähdekansion
+upload-kansioon (sama paikka kuin SFTP-latauksilla), ja samasta virrasta lasketaan
+samalla hash ja otetaan talteen otsake EXIF-päivämäärää varten. Tiedostoa ei siis
+lueta uudelleen, vaan kuva ajetaan heti duplikaattitarkistuksen, linkityksen ja
+indeksoinnin läpi eikä erillistä skannausta tarvita. Jos luokittelu on käynnissä,
+kuva annetaan sille LIVE_INBOXin kautta.
+
+Tietokanta, hash-indeksi ja manifesti tallennetaan levylle enintään INGEST_FLUSH_SECONDS
+välein (kuten tiedostovahdilla), ei jokaisen pyynnön jälkeen. Kuvatiedosto on jo fsyncattu,
+joten kaatumisen jälkeen tallentamatta jäänyt kuva luokitellaan uudelleen manifestin perusteella.
+"""
+
+import atexit
+import os
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from classify_images import (IMAGE_EXTENSIONS, INGEST_FLUSH_SECONDS, INGEST_LOCK, get_content_store, get_manifest,
+                             get_pil_metadata_date, index_image, link_image_to_hierarchy, new_hasher,
+                             prepare_hierarchical_structure, save_ingest_state)
+from exif_reader import EXIF_HEADER_BYTES, parse_exif_date
+from filename_timestamps import filename_camera, parse_filename_timestamp
+from ingest_scheduler import LIVE_INBOX
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Yksittäisen kuvan enimmäiskoko (0 = ei rajaa)
+INGEST_MAX_UPLOAD_MB = _env_int('INGEST_MAX_UPLOAD_MB', 100)
+
+
+class UploadError(Exception):
+    pass
+
+
+def upload_dir(source_dir):
+    """Kansio, johon HTTP:llä vastaanotetut kuvat tallennetaan (INGEST_UPLOAD_DIR tai <lähde>/uploads)"""
+    return Path(os.environ.get('INGEST_UPLOAD_DIR') or Path(source_dir) / 'uploads')
+
+
+def _camera_folder(camera):
+    return secure_filename(camera or '') or 'http'
+
+
+def _unique_path(path):
+    if not os.path.lexists(path):
+        return path
+    for index in range(1, 10000):
+        candidate = path.with_name(f"{path.stem}_{index}{path.suffix}")
+        if not os.path.lexists(candidate):
+            return candidate
+    raise UploadError(f"Vapaata tiedostonimeä ei löytynyt: {path.name}")
+
+
+def receive_stream(chunks, target_dir, filename, max_bytes=None):
+    """Kirjoita palat väliaikaiseen tiedostoon kohdekansioon ja laske samalla hash.
+    Palauttaa (väliaikainen polku, hash, otsake, koko)."""
+    max_bytes = INGEST_MAX_UPLOAD_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    target_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = target_dir / f".{filename}.{uuid.uuid4().hex[:8]}.part"
+    hasher = new_hasher()
+    header = bytearray()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadError(f"Kuva on liian suuri (yli {max_bytes // (1024 * 1024)} MB)")
+                hasher.update(chunk)
+                if len(header) < EXIF_HEADER_BYTES:
+                    header += chunk[:EXIF_HEADER_BYTES - len(header)]
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if not size:
+        os.unlink(tmp_path)
+        raise UploadError('Tyhjä kuva')
+    return tmp_path, hasher.hexdigest(), bytes(header), size
+
+
+def _upload_date(file_path, filename, header, timestamp):
+    """Päivämäärä samassa järjestyksessä kuin luokittelussa: tiedostonimi, EXIF, lopuksi
+    lähettäjän antama aikaleima tai vastaanottohetki"""
+    filename_date, _ = parse_filename_timestamp(filename)
+    if filename_date:
+        return filename_date, 'filename'
+    parsed = parse_exif_date(header)
+    if parsed is None:
+        # Muu kuin JPEG: PIL lukee jo levyllä olevan tiedoston
+        parsed = get_pil_metadata_date(file_path)
+    if parsed[0] is not None:
+        return parsed
+    if timestamp is not None:
+        return datetime.fromtimestamp(timestamp), 'filesystem'
+    return datetime.now(), 'filesystem'
+
+
+def _register(image, target_base_path, db, stats):
+    """Duplikaattitarkistus, linkitys ja indeksointi yhdelle vastaanotetulle kuvalle (INGEST_LOCKin alla)"""
+    link_mode = os.environ.get('LINK_MODE', 'symlink').lower()
+    manifest = get_manifest(target_base_path)
+    store = get_content_store(target_base_path)
+    if store is not None:
+        entry = store.lookup(image['hash'])
+        if entry and entry.get('source') != str(image['path']):
+            # Sisältö on jo arkistossa: uutta tiedostoa ei tarvita
+            stats['duplicates'] += 1
+            os.unlink(image['path'])
+            print(f"Duplikaatti ohitettu: {image['filename']} (sama sisältö kuin {entry.get('source')})")
+            return {'status': 'duplicate', 'duplicate_of': entry.get('source')}
+        image['blob'] = store.put(image, link_mode)
+    prepare_hierarchical_structure(target_base_path)
+    link_image_to_hierarchy(image, target_base_path, link_mode)
+    if not index_image(image, db):
+        # Kuva jää lähdekansioon merkitsemättä, joten seuraava luokittelu tai täsmäytys indeksoi sen
+        stats['failed'] += 1
+        return {'status': 'failed', 'error': 'Indeksointi epäonnistui'}
+    manifest.mark_processed(image['path'], image['path'].stat(), image)
+    if image['source'] in stats:
+        stats[image['source']] += 1
+    return {'status': 'indexed', 'links': [str(target.relative_to(db.base_path)) for target, _ in image.get('links', [])]}
+
+
+def ingest_upload(chunks, filename, source_dir, target_base_dir, db, stats, camera=None, timestamp=None):
+    """Vastaanota yksi kuva paloina (iteroitava bytes-olioita) ja rekisteröi se. Palauttaa tulos-dictin."""
+    safe_name = secure_filename(filename or '')
+    if not safe_name or Path(safe_name).suffix.lower() not in IMAGE_EXTENSIONS:
+        raise UploadError(f"Tiedostotyyppiä ei tueta: {filename}")
+    camera = camera or filename_camera(safe_name)
+    target_dir = upload_dir(source_dir) / _camera_folder(camera)
+    stats['total'] += 1
+
+    tmp_path, digest, header, size = receive_stream(chunks, target_dir, safe_name)
+    try:
+        image_date, source = _upload_date(tmp_path, safe_name, header, timestamp)
+        file_path = _unique_path(target_dir / safe_name)
+        os.utime(tmp_path, (image_date.timestamp(), image_date.timestamp()))
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    result = {'filename': file_path.name, 'path': str(file_path), 'hash': digest, 'bytes': size,
+              'date': image_date.isoformat(), 'source': source, 'camera': camera}
+
+    if LIVE_INBOX.offer([file_path]):
+        # Käynnissä oleva luokittelu ottaa kuvan omaan jonoonsa
+        stats['queued'] += 1
+        result['status'] = 'queued'
+        return result
+    image = {'path': file_path, 'date': image_date, 'hash': digest, 'filename': file_path.name, 'source': source,
+             'camera': camera}
+    with INGEST_LOCK:
+        manifest = get_manifest(target_base_dir)
+        if manifest.is_processed(file_path, file_path.stat()):
+            # Luokittelu ehti käsitellä tiedoston ennen lukon vapautumista
+            result['status'] = 'indexed'
+            return result
+        result.update(_register(image, Path(target_base_dir), db, stats))
+    return result
+
+
+_flush_lock = threading.Lock()
+_flush_timers = {}  # kohdekansio -> (ajastin, tietokanta)
+
+
+def save_uploads(target_base_dir, db):
+    """Ajasta vastaanottojen tallennus INGEST_FLUSH_SECONDS sekunnin päähän, ellei se ole jo ajastettu"""
+    key = str(Path(target_base_dir))
+    with _flush_lock:
+        if key in _flush_timers:
+            return
+        timer = threading.Timer(INGEST_FLUSH_SECONDS, _flush_uploads, (key,))
+        timer.daemon = True
+        _flush_timers[key] = (timer, db)
+    timer.start()
+
+
+def _flush_uploads(key):
+    with _flush_lock:
+        pending = _flush_timers.pop(key, None)
+    if pending is None:
+        return
+    try:
+        with INGEST_LOCK:
+            save_ingest_state(key, pending[1])
+    except Exception as e:
+        print(f"Virhe vastaanotettujen kuvien tallennuksessa: {e}")
+
+
+def flush_uploads():
+    """Tallenna ajastetut vastaanotot heti (esim. sammutettaessa)"""
+    with _flush_lock:
+        keys = list(_flush_timers)
+        for timer, _ in _flush_timers.values():
+            timer.cancel()
+    for key in keys:
+        _flush_uploads(key)
+
+
+atexit.register(flush_uploads)
+
+
+def new_upload_stats():
+    return {'total': 0, 'filename': 0, 'exif': 0, 'exif_other': 0, 'filesystem': 0, 'failed': 0, 'duplicates': 0,
+            'queued': 0}
+
+
+class MultipartReader:
+    """multipart/form-data -rungon lukija, joka ei puskuroi tiedostoja muistiin tai levylle.
+    files() palauttaa (tiedostonimi, kentät, palat) -kolmikot; palat on luettava loppuun
+    ennen seuraavaa tiedostoa. Tiedostoa edeltävät tekstikentät (esim. camera) välitetään
+    kenttinä, joten ne koskevat kaikkia niiden jälkeen tulevia tiedostoja."""
+
+    def __init__(self, stream, boundary, chunk_size=UPLOAD_CHUNK_SIZE, max_field_bytes=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=max_field_bytes)
+        self.fields = {}
+        self.finished = False
+
+    def _events(self):
+        while True:
+            event = self.decoder.next_event()
+            if isinstance(event, NeedData):
+                if self.finished:
+                    raise UploadError('Multipart-runko katkesi')
+                data = self.stream.read(self.chunk_size)
+                if not data:
+                    self.finished = True
+                self.decoder.receive_data(data or None)
+                continue
+            yield event
+            if isinstance(event, Epilogue):
+                return
+
+    def _read_data(self, events):
+        for event in events:
+            if not isinstance(event, Data):
+                raise UploadError('Odottamaton multipart-osa')
+            yield event.data
+            if not event.more_data:
+                return
+
+    def files(self):
+        events = self._events()
+        for event in events:
+            if isinstance(event, File):
+                data = self._read_data(events)
+                yield event.filename, dict(self.fields), data
+                # Lukematta jäänyt osa (esim. hylätty tiedosto) ohitetaan
+                for _ in data:
+                    pass
+            elif isinstance(event, Field):
+                value = b''.join(self._read_data(events))
+                self.fields[event.name] = value.decode('utf-8', 'replace')
@@ -0,0 +1,252 @@
+"""
+Lähdekansion tiedostovahti: poimii SFTP:llä ladatut kuvat heti kun lataus on valmis
+ja ajaa ne classify_files-putken läpi (metatiedot -> linkitys -> indeksointi).
+
+Linuxissa käytetään inotifya (IN_CLOSE_WRITE / IN_MOVED_TO), muuten kansiota
+pollataan ja tiedosto katsotaan valmiiksi kun sen koko ja mtime pysyvät samoina.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from pathlib import Path
+
+from classify_images import IMAGE_EXTENSIONS, classify_files, get_manifest, iter_image_files, save_ingest_state, INGEST_FLUSH_SECONDS
+from ingest_scheduler import LIVE_INBOX
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Ohut ctypes-kääre libc:n inotify-rajapinnalle"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError(errno.ENOSYS, 'libc ei löydy')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify ei ole saatavilla')
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches = {}  # wd -> kansion polku
+
+    def add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.watches[wd] = path
+        return wd
+
+    def read_events(self, timeout):
+        """Palauta lista (kansio, nimi, mask) -tapahtumia, odottaa enintään timeout sekuntia"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            events.append((self.watches.get(wd), os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class SourceWatcher(threading.Thread):
+    """Taustasäie, joka syöttää valmiit uudet kuvat luokitteluun"""
+
+    def __init__(self, source_dir, target_dir, db, poll_interval=1.0, settle_seconds=1.0,
+                 batch_delay=0.3, max_batch=500, use_inotify=True, catch_up=True):
+        super().__init__(name='source-watcher', daemon=True)
+        self.source_dir = Path(source_dir)
+        self.target_dir = Path(target_dir)
+        self.db = db
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self.use_inotify = use_inotify
+        self.catch_up = catch_up
+        self.mode = None
+        self.stats = {'batches': 0, 'processed': 0, 'handed_off': 0, 'last_batch': None}
+        self._stop_event = threading.Event()
+        self._ready = {}     # polku -> valmistumishetki (monotonic)
+        self._settling = {}  # polku -> (koko, mtime_ns, havaittu)
+        self._dirty_since = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self.source_dir.mkdir(parents=True, exist_ok=True)
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify()
+                self._watch_tree(inotify, self.source_dir)
+                self.mode = 'inotify'
+            except OSError as e:
+                print(f"inotify ei käytettävissä ({e}), käytetään pollausta")
+                if inotify:
+                    inotify.close()
+                inotify = None
+        if inotify is None:
+            self.mode = 'polling'
+        print(f"Tiedostovahti käynnistetty: {self.source_dir} ({self.mode})")
+
+        if self.catch_up or self.mode == 'polling':
+            # Palvelun ollessa alhaalla ladatut kuvat: tarkistetaan kerran koko kansio
+            self._scan_for_candidates()
+
+        try:
+            while not self._stop_event.is_set():
+                if inotify is not None:
+                    self._handle_events(inotify, inotify.read_events(self._next_timeout()))
+                else:
+                    self._stop_event.wait(self.poll_interval)
+                    self._scan_for_candidates()
+                self._check_settling()
+                self._flush_ready()
+                self._save_if_due()
+        except Exception as e:
+            print(f"Tiedostovahti pysähtyi virheeseen: {e}")
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self._flush_ready(force=True)
+            self._save_if_due(force=True)
+
+    def _watch_tree(self, inotify, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            try:
+                inotify.add_watch(dirpath)
+            except OSError as e:
+                print(f"Virhe lisättäessä vahtia {dirpath}: {e}")
+
+    def _next_timeout(self):
+        if self._ready or self._settling:
+            return min(self.batch_delay, self.settle_seconds)
+        return self.poll_interval
+
+    def _handle_events(self, inotify, events):
+        for directory, name, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                print("inotify-jono ylivuoti, tarkistetaan kansio")
+                self._scan_for_candidates()
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Uusi alikansio: vahti sille ja jo ehtineet tiedostot vakautustarkistukseen
+                    self._watch_tree(inotify, path)
+                    self._scan_for_candidates(path)
+                continue
+            if not self._is_image(name):
+                continue
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._settling.pop(path, None)
+                self._ready.setdefault(path, time.monotonic())
+
+    def _is_image(self, name):
+        return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+    def _scan_for_candidates(self, root=None):
+        manifest = get_manifest(self.target_dir)
+        now = time.monotonic()
+        for file_path, file_stat in iter_image_files(root or self.source_dir):
+            path = str(file_path)
+            if path in self._ready or manifest.is_processed(file_path, file_stat):
+                continue
+            if path not in self._settling:
+                self._settling[path] = (file_stat.st_size, file_stat.st_mtime_ns, now)
+
+    def _check_settling(self):
+        """Tiedosto on valmis, kun koko ja mtime eivät ole muuttuneet settle_seconds aikana"""
+        now = time.monotonic()
+        for path, (size, mtime_ns, seen) in list(self._settling.items()):
+            if now - seen < self.settle_seconds:
+                continue
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                del self._settling[path]
+                continue
+            if file_stat.st_size == size and file_stat.st_mtime_ns == mtime_ns:
+                del self._settling[path]
+                self._ready.setdefault(path, now)
+            else:
+                self._settling[path] = (file_stat.st_size, file_stat.st_mtime_ns, now)
+
+    def _flush_ready(self, force=False):
+        if not self._ready:
+            return
+        oldest = min(self._ready.values())
+        if not force and len(self._ready) < self.max_batch and time.monotonic() - oldest < self.batch_delay:
+            return
+        batch = list(self._ready)[:self.max_batch]
+        for path in batch:
+            del self._ready[path]
+        # Jos iso luokitteluajo on käynnissä, annetaan kuvat sille eikä jäädä odottamaan sen valmistumista
+        if LIVE_INBOX.offer(batch):
+            self.stats['handed_off'] += len(batch)
+            return
+        try:
+            result = classify_files(batch, self.target_dir, self.db, save=False)
+        except Exception as e:
+            print(f"Virhe tiedostovahdin luokittelussa: {e}")
+            return
+        if result['processed']:
+            self.stats['batches'] += 1
+            self.stats['processed'] += result['processed']
+            self.stats['last_batch'] = time.time()
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+            print(f"Tiedostovahti luokitteli {result['processed']} uutta kuvaa")
+
+    def _save_if_due(self, force=False):
+        # Muistissa oleva tietokanta näkyy selaimelle heti, levylle tallennetaan harvemmin
+        if self._dirty_since is None:
+            return
+        if force or time.monotonic() - self._dirty_since >= INGEST_FLUSH_SECONDS:
+            save_ingest_state(self.target_dir, self.db)
+            self._dirty_since = None
+
+    def status(self):
+        return {'running': self.is_alive(), 'mode': self.mode, 'pending': len(self._ready) + len(self._settling), **self.stats}
@@ -0,0 +1,149 @@
+"""
+Taustatyöt pitkille operaatioille (esim. luokittelu).
+
+Työ ajetaan omassa säikeessään, ja sen tila, edistyminen (tiedostoa/s, vaihe, arvioitu
+jäljellä oleva aika) sekä lopputulos luetaan /api/jobs-rajapinnasta. Samanlaiset
+samanaikaiset pyynnöt yhdistetään: jos samanlajinen työ on jo käynnissä, palautetaan
+sen tunniste uuden työn käynnistämisen sijaan.
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.state = 'queued'
+        self.created = datetime.now().isoformat()
+        self.started = None
+        self.finished = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.version = 0
+        self.changed = threading.Condition()
+        self._start_time = None
+
+    def _touch(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def update_progress(self, progress):
+        """Päivitä edistyminen putken raportista ja laske nopeus ja arvioitu valmistumisaika"""
+        progress = dict(progress)
+        elapsed = time.monotonic() - self._start_time if self._start_time else 0.0
+        done = progress.get('processed', 0) + progress.get('failed', 0) + progress.get('duplicates', 0)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        progress['elapsed'] = round(elapsed, 1)
+        progress['files_per_sec'] = round(rate, 1)
+        progress['eta_seconds'] = None
+        if progress.get('discovery_done') and rate > 0:
+            remaining = progress.get('discovered', 0) - progress.get('skipped', 0) - done
+            progress['eta_seconds'] = round(max(0, remaining) / rate, 1)
+        self.progress = progress
+        self._touch()
+
+    def cancel(self):
+        if self.state in ACTIVE_STATES:
+            self.cancel_event.set()
+            self._touch()
+            return True
+        return False
+
+    def is_active(self):
+        return self.state in ACTIVE_STATES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'state': self.state,
+            'cancel_requested': self.cancel_event.is_set(),
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error
+        }
+
+    def wait_for_change(self, version, timeout):
+        """Odota kunnes työn tila muuttuu versiosta version tai timeout umpeutuu. Palauttaa uuden version."""
+        with self.changed:
+            if self.version == version and self.is_active():
+                self.changed.wait(timeout)
+            return self.version
+
+
+class JobManager:
+    def __init__(self, max_history=50):
+        self.jobs = OrderedDict()
+        self.max_history = max_history
+        self.lock = threading.Lock()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def active(self, kind):
+        with self.lock:
+            for job in self.jobs.values():
+                if job.kind == kind and job.is_active():
+                    return job
+        return None
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def submit(self, kind, params, target):
+        """Käynnistä työ tai palauta jo käynnissä oleva samanlajinen työ.
+        target(job) ajetaan taustasäikeessä ja sen paluuarvo tallennetaan työn tulokseksi.
+        Palauttaa (työ, yhdistettiinkö käynnissä olevaan)."""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.kind == kind and job.is_active():
+                    return job, True
+            job = Job(kind, params)
+            self.jobs[job.id] = job
+            self._trim()
+        threading.Thread(target=self._run, args=(job, target), daemon=True, name=f"job-{kind}-{job.id}").start()
+        return job, False
+
+    def _trim(self):
+        # Vanhimmat valmiit työt poistetaan, käynnissä olevia ei koskaan
+        finished = [job_id for job_id, job in self.jobs.items() if not job.is_active()]
+        while len(self.jobs) > self.max_history and finished:
+            del self.jobs[finished.pop(0)]
+
+    def _run(self, job, target):
+        job.state = 'running'
+        job.started = datetime.now().isoformat()
+        job._start_time = time.monotonic()
+        job._touch()
+        try:
+            job.result = target(job)
+            if job.cancel_event.is_set():
+                job.state = 'cancelled'
+            elif isinstance(job.result, dict) and job.result.get('error'):
+                job.state = 'failed'
+                job.error = job.result['error']
+            else:
+                job.state = 'done'
+        except Exception as e:
+            print(f"Virhe taustatyössä {job.kind} {job.id}: {e}")
+            job.state = 'failed'
+            job.error = str(e)
+        job.finished = datetime.now().isoformat()
+        job._touch()
@@ -0,0 +1,150 @@
+import os
+import shutil
+from collections import OrderedDict, defaultdict
+
+from fast_copy import COPY_METHODS, copy_fd
+
+class LinkExecutor:
+    """Linkkien luonti aikahierarkiaan eräajona.
+
+    Operaatiot kerätään submit()-kutsuilla ja suoritetaan flush()-kutsussa kohdekansioittain:
+    kansio luodaan ja avataan kerran, ja symlink/link/utime tehdään dir_fd-suhteellisina.
+    Jo luodut kansiot muistetaan, joten toistuvia mkdir-kutsuja ei tehdä. Olemassa oleva
+    kohde tunnistetaan EEXIST-virheestä erillisen exists()-tarkistuksen sijaan.
+    """
+
+    def __init__(self, max_open_dirs=128, max_known_dirs=65536):
+        self.max_open_dirs = max_open_dirs
+        self.max_known_dirs = max_known_dirs
+        self._known_dirs = OrderedDict()
+        self._dir_fds = OrderedDict()
+        self._pending = defaultdict(list)
+        self.counters = {'mkdir': 0, 'mkdir_cached': 0, 'open_dir': 0, 'symlink': 0, 'link': 0,
+                         'copy': 0, 'utime': 0, 'exists': 0, 'errors': 0}
+        self.counters.update({f"copy_{method}": 0 for method in COPY_METHODS})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def submit(self, source, target_dir, name, link_mode, mtime=None):
+        """Lisää linkitysoperaatio jonoon. Palauttaa operaation, jonka 'created'/'error' täyttyy flushissa."""
+        op = {'source': source, 'target_dir': str(target_dir), 'name': name, 'link_mode': link_mode,
+              'mtime': mtime, 'created': False, 'error': None}
+        self._pending[op['target_dir']].append(op)
+        return op
+
+    def flush(self):
+        pending, self._pending = self._pending, defaultdict(list)
+        for target_dir, ops in pending.items():
+            try:
+                self._ensure_dir(target_dir)
+                dir_fd = self._open_dir(target_dir)
+            except OSError as e:
+                for op in ops:
+                    op['error'] = e
+                self.counters['errors'] += len(ops)
+                continue
+            for op in ops:
+                self._execute(dir_fd, op)
+
+    def close(self):
+        self.flush()
+        while self._dir_fds:
+            _, dir_fd = self._dir_fds.popitem()
+            try:
+                os.close(dir_fd)
+            except OSError:
+                pass
+
+    def stats(self):
+        return dict(self.counters)
+
+    def _ensure_dir(self, path):
+        if path in self._known_dirs:
+            self._known_dirs.move_to_end(path)
+            self.counters['mkdir_cached'] += 1
+            return
+        os.makedirs(path, exist_ok=True)
+        self.counters['mkdir'] += 1
+        self._known_dirs[path] = True
+        if len(self._known_dirs) > self.max_known_dirs:
+            self._known_dirs.popitem(last=False)
+
+    def _open_dir(self, path):
+        dir_fd = self._dir_fds.get(path)
+        if dir_fd is not None:
+            self._dir_fds.move_to_end(path)
+            return dir_fd
+        dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        self.counters['open_dir'] += 1
+        self._dir_fds[path] = dir_fd
+        if len(self._dir_fds) > self.max_open_dirs:
+            _, old_fd = self._dir_fds.popitem(last=False)
+            os.close(old_fd)
+        return dir_fd
+
+    def _execute(self, dir_fd, op):
+        source = os.path.abspath(str(op['source']))
+        name = op['name']
+        try:
+            if op['link_mode'] == 'symlink':
+                try:
+                    os.symlink(source, name, dir_fd=dir_fd)
+                    self.counters['symlink'] += 1
+                except FileExistsError:
+                    raise
+                except OSError:
+                    self._copy(source, dir_fd, op)
+            elif op['link_mode'] == 'hardlink':
+                try:
+                    os.link(source, name, dst_dir_fd=dir_fd)
+                    self.counters['link'] += 1
+                except FileExistsError:
+                    raise
+                except OSError:
+                    self._copy(source, dir_fd, op)
+            else:
+                self._copy(source, dir_fd, op)
+        except FileExistsError:
+            self.counters['exists'] += 1
+            return
+        except Exception as e:
+            op['error'] = e
+            self.counters['errors'] += 1
+            return
+        op['created'] = True
+        if op['mtime'] is not None:
+            try:
+                os.utime(name, (op['mtime'], op['mtime']), dir_fd=dir_fd)
+                self.counters['utime'] += 1
+            except OSError:
+                pass
+
+    def _copy(self, source, dir_fd, op):
+        # O_EXCL varaa nimen, joten olemassa olevaa kohdetta ei koskaan ylikirjoiteta
+        target_fd = os.open(op['name'], os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644, dir_fd=dir_fd)
+        try:
+            source_fd = os.open(source, os.O_RDONLY)
+            try:
+                # Reflink / copy_file_range / sendfile ennen puskuroitua kopiota (fast_copy.py)
+                method = copy_fd(source_fd, target_fd)
+            finally:
+                os.close(source_fd)
+            os.close(target_fd)
+            target_fd = None
+            shutil.copystat(source, os.path.join(op['target_dir'], op['name']))
+        except BaseException:
+            # Keskeneräinen kopio poistetaan, ettei se näytä valmiilta seuraavalla ajolla
+            if target_fd is not None:
+                os.close(target_fd)
+            try:
+                os.unlink(op['name'], dir_fd=dir_fd)
+            except OSError:
+                pass
+            raise
+        self.counters['copy'] += 1
+        self.counters[f"copy_{method}"] += 1
@@ -0,0 +1,75 @@
+"""
+Arkiston täsmäytyksen (archive_reconciler.ArchiveReconciler) orpojen tarkistus: poistetun
+tiedoston tietue merkitään puuttuvaksi ja merkintä poistetaan tiedoston palatessa, sekä
+transaktion perumisen vaikutus puuttuvan merkintään.
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import contextlib
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from app import ImageDatabase  # noqa: E402
+from archive_reconciler import ArchiveReconciler  # noqa: E402
+
+NAMES = ('a.jpg', 'b.jpg', 'c.jpg')
+
+
+def _archive(base_path):
+    db = ImageDatabase(base_path)
+    folder = base_path / 'days/2025/11/05'
+    folder.mkdir(parents=True)
+    for name in NAMES:
+        (folder / name).write_bytes(b'image')
+        db.add_image(folder / name, '2025-11-05T19:42:00', 'day_2025-11-05')
+    db.save_database()
+    return db, folder
+
+
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_sweep_sets_and_clears_missing_flag(tmp_path, monkeypatch, backend):
+    monkeypatch.setenv('DB_BACKEND', backend)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db, folder = _archive(tmp_path)
+        if backend == 'journal':
+            # Osa tietueista tilannekuvassa, osa muistissa olevassa kerroksessa
+            db.images.compact(wait=True)
+            db.images['days/2025/11/05/c.jpg'] = dict(db.images['days/2025/11/05/c.jpg'])
+        reconciler = ArchiveReconciler(tmp_path, db, files_per_second=0, batch_size=2)
+
+        (folder / 'a.jpg').unlink()
+        (folder / 'c.jpg').unlink()
+        assert reconciler.sweep() == (2, 0)
+        assert db.images['days/2025/11/05/a.jpg'].get('missing')
+        assert db.images['days/2025/11/05/c.jpg'].get('missing')
+        assert 'missing' not in db.images['days/2025/11/05/b.jpg']
+        assert reconciler.missing == 2
+        assert reconciler.sweep() == (0, 0)
+
+        (folder / 'a.jpg').write_bytes(b'image')
+        assert reconciler.sweep() == (0, 1)
+        assert 'missing' not in db.images['days/2025/11/05/a.jpg']
+        assert db.images['days/2025/11/05/c.jpg'].get('missing')
+        db.close()
+
+
+def test_rollback_restores_missing_flag(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        db, folder = _archive(tmp_path)
+        db.set_missing('days/2025/11/05/b.jpg', True)
+        with pytest.raises(RuntimeError):
+            with db.transaction(save=False):
+                assert db.set_missing('days/2025/11/05/a.jpg', True)
+                assert db.set_missing('days/2025/11/05/b.jpg', False)
+                db.add_image(folder / 'd.jpg', '2025-11-05T19:43:00', 'day_2025-11-05')
+                raise RuntimeError('keskeytys')
+    assert 'missing' not in db.images['days/2025/11/05/a.jpg']
+    assert db.images['days/2025/11/05/b.jpg'].get('missing')
+    assert 'days/2025/11/05/d.jpg' not in db.images
+    assert db.category_counts.total == 3
@@ -0,0 +1,44 @@
+"""
+Kategoriamäärät (category_counts.CategoryCounts) jaetussa linkkipuussa: jakokansiot
+(SHARD_LEVELS, _c-/_h-) eivät ole omia aikakansioitaan.
+
+Ajo: python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from category_counts import CategoryCounts  # noqa: E402
+
+
+def test_shard_dirs_are_not_counted_as_folders(tmp_path):
+    counts = CategoryCounts(tmp_path, load=False)
+    paths = [f'years/2025/_c-cam{camera}/_h-{digest}/img{camera}{digest}.jpg'
+             for camera in range(3) for digest in ('ab', 'cd')]
+    paths += [f'months/2025/11/_c-cam{camera}/img{camera}.jpg' for camera in range(3)]
+    paths.append('days/2025/11/05/img.jpg')
+    for rel_path in paths:
+        counts.add(rel_path)
+
+    assert counts.summary('years') == (1, 6)
+    assert counts.summary('months') == (2, 3)
+    assert counts.count('years/2025') == 6
+    assert counts.count('months/2025/11') == 3
+    assert counts.total == 10
+
+    for rel_path in paths[:6]:
+        counts.remove(rel_path)
+    assert counts.summary('years') == (0, 0)
+    assert counts.summary('months') == (2, 3)
+    assert counts.total == 4
+
+
+def test_counts_saved_in_older_format_are_not_loaded(tmp_path):
+    counts = CategoryCounts(tmp_path, load=False)
+    counts.add('years/2025/img.jpg')
+    counts.save_counts()
+    assert CategoryCounts(tmp_path).loaded
+    (tmp_path / 'category_counts.json').write_text('{"total": 1, "levels": {}, "snapshot": [1, 2, 3]}')
+    assert not CategoryCounts(tmp_path).loaded
@@ -0,0 +1,187 @@
+"""
+Journal-tallennuksen (image_store.JournalImageStore) palautumistestit: journaalin toisto,
+keskeneräisen lopun korjaus, kesken jääneen tiivistyksen jatkaminen ja tilannekuvan
+(image_snapshot) tietueiden säilyminen, tiivistyksen raja sekä tilannekuvaan tallennetut
+kategoriamäärät journaalin päällä.
+
+Ajo: python -m pytest -q tests
+"""
+import os
+import io
+import sys
+import contextlib
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import image_snapshot  # noqa: E402
+import image_store  # noqa: E402
+from app import ImageDatabase  # noqa: E402
+from category_counts import CategoryCounts  # noqa: E402
+from image_snapshot import ImageSnapshot, write_snapshot  # noqa: E402
+from image_store import JournalImageStore  # noqa: E402
+
+
+def _record(index, **extra):
+    record = {'timestamp': f'2025-11-05T19:42:{index % 60:02d}', 'category': 'day_2025-11-05', 'source': 'filename',
+              'filename': f'img{index}.jpg', 'added': '2025-11-05T20:00:00'}
+    record.update(extra)
+    return record
+
+
+def _open(base_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return JournalImageStore(base_path)
+
+
+def test_journal_replay_restores_puts_and_deletes(tmp_path):
+    store = _open(tmp_path)
+    for index in range(5):
+        store[f'days/2025/11/05/img{index}.jpg'] = _record(index)
+    store.save()
+    del store['days/2025/11/05/img1.jpg']
+    store['days/2025/11/05/img2.jpg'] = _record(2, camera='2-Ovi')
+    store.save()
+    store.close()
+
+    reopened = _open(tmp_path)
+    assert len(reopened) == 4
+    assert 'days/2025/11/05/img1.jpg' not in reopened
+    assert reopened['days/2025/11/05/img2.jpg']['camera'] == '2-Ovi'
+    assert reopened.journal_entries == 7
+    reopened.close()
+
+
+def test_partial_journal_tail_is_truncated(tmp_path):
+    store = _open(tmp_path)
+    store['days/2025/11/05/img0.jpg'] = _record(0)
+    store.save()
+    store.close()
+    journal = tmp_path / 'image_database.journal'
+    intact_size = journal.stat().st_size
+    # Kaatuminen kesken kirjoituksen jättää puolikkaan rivin ilman rivinvaihtoa
+    with open(journal, 'ab') as f:
+        f.write(b'{"op": "put", "path": "days/2025/11/05/img1.jpg", "rec')
+
+    reopened = _open(tmp_path)
+    assert list(reopened) == ['days/2025/11/05/img0.jpg']
+    assert journal.stat().st_size == intact_size
+    # Korjauksen jälkeen lisätyt rivit alkavat omalta riviltään ja toistuvat seuraavalla avauksella
+    reopened['days/2025/11/05/img2.jpg'] = _record(2)
+    reopened.save()
+    reopened.close()
+    assert sorted(_open(tmp_path)) == ['days/2025/11/05/img0.jpg', 'days/2025/11/05/img2.jpg']
+
+
+def test_interrupted_compaction_is_resumed(tmp_path):
+    store = _open(tmp_path)
+    for index in range(3):
+        store[f'days/2025/11/05/img{index}.jpg'] = _record(index)
+    store.save()
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.compact(wait=True)
+    store['days/2025/11/05/img3.jpg'] = _record(3)
+    del store['days/2025/11/05/img0.jpg']
+    store.save()
+    store.close()
+    # Tiivistys ehti siirtää journaalin sivuun mutta ei kirjoittaa tilannekuvaa; sen jälkeen tuli uusi muutos
+    os.replace(tmp_path / 'image_database.journal', tmp_path / 'image_database.journal.1')
+    store = _open(tmp_path)
+    store.compactor.join()
+    store['days/2025/11/05/img4.jpg'] = _record(4)
+    store.save()
+    store.close()
+
+    reopened = _open(tmp_path)
+    if reopened.compactor is not None:
+        reopened.compactor.join()
+    assert sorted(reopened) == [f'days/2025/11/05/img{index}.jpg' for index in (1, 2, 3, 4)]
+    assert not (tmp_path / 'image_database.journal.1').exists()
+    assert len(reopened.base) >= 3
+    reopened.close()
+
+
+def test_snapshot_round_trip(tmp_path):
+    records = [
+        ('days/2025/11/05/ä.jpg', _record(0, camera='2-Ovi', hash='abc', missing='2025-11-06T00:00:00')),
+        ('days/2025/11/05/b.jpg', _record(1)),
+        ('days/unknown/c.jpg', {'timestamp': None, 'category': 'unknown', 'source': 'filesystem',
+                                'filename': 'c.jpg', 'added': 'x'}),
+    ]
+    path = tmp_path / 'image_database.snap'
+    assert write_snapshot(path, records) == 3
+    snapshot = ImageSnapshot(path)
+    for rel_path, info in records:
+        row = snapshot.find(rel_path)
+        assert row >= 0
+        assert snapshot.path(row) == rel_path
+        assert snapshot.record(row) == info
+    assert snapshot.find('days/2025/11/05/puuttuu.jpg') == -1
+    assert snapshot.epoch(snapshot.find('days/unknown/c.jpg')) is None
+    assert snapshot.meta() == {}
+    write_snapshot(path, records, {'category_counts': {'total': 3}})
+    assert ImageSnapshot(path).meta() == {'category_counts': {'total': 3}}
+
+
+def test_version_1_snapshot_is_readable(tmp_path, monkeypatch):
+    # Versio 1 kirjoitetaan nykyisellä koodilla ilman meta-osiota
+    monkeypatch.setattr(image_snapshot, 'VERSION', 1)
+    monkeypatch.setattr(image_snapshot, '_HEADER', image_snapshot._HEADERS[1])
+    monkeypatch.setattr(image_snapshot, '_SECTIONS', image_snapshot._SECTIONS[:-1])
+    write_snapshot(tmp_path / 'image_database.snap', [(f'days/2025/11/05/img{index}.jpg', _record(index))
+                                                      for index in range(3)])
+    monkeypatch.undo()
+    snapshot = ImageSnapshot(tmp_path / 'image_database.snap')
+    assert snapshot.meta() == {}
+    assert snapshot.record(snapshot.find('days/2025/11/05/img1.jpg')) == _record(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(tmp_path)
+    assert db.category_counts.count('days/2025/11/05') == 3
+    db.close()
+
+
+def test_journal_is_compacted_at_fixed_length(tmp_path, monkeypatch):
+    write_snapshot(tmp_path / 'image_database.snap', [(f'days/2025/11/05/img{index}.jpg', _record(index))
+                                                      for index in range(100)])
+    monkeypatch.setattr(image_store, 'DB_COMPACT_MIN_ENTRIES', 5)
+    store = _open(tmp_path)
+    for index in range(4):
+        store[f'days/2025/11/06/img{index}.jpg'] = _record(index)
+    store.save()
+    assert store.compactor is None
+    store['days/2025/11/06/img4.jpg'] = _record(4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.save()
+        store.compactor.join()
+    assert not (tmp_path / 'image_database.journal').exists()
+    assert len(store.base) == 105
+    store.close()
+
+
+def test_category_counts_follow_snapshot_and_journal(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(tmp_path)
+        for index in range(4):
+            db.add_image(tmp_path / f'days/2025/11/0{index + 1}/img{index}.jpg', _record(index)['timestamp'],
+                         'day_2025-11-05')
+        db.save_database()
+        db.images.compact(wait=True)
+        with db.transaction():
+            db.add_image(tmp_path / 'hours/2025/11/05/19/img9.jpg', _record(9)['timestamp'], 'hour_2025-11-05-19')
+        del db.images['days/2025/11/01/img0.jpg']
+        db.category_counts.remove('days/2025/11/01/img0.jpg')
+        db.save_database()
+        db.close()
+
+        reopened = ImageDatabase(tmp_path)
+    expected = CategoryCounts(tmp_path, load=False)
+    expected.rebuild(reopened.images)
+    assert reopened.category_counts.levels == expected.levels
+    assert reopened.category_counts.total == 4
+    assert reopened.category_counts.count('days/2025/11') == 3
+    assert reopened.category_counts.count('hours') == 1
+    # Määrät tallentuvat tilannekuvaan, erillistä tiedostoa ei kirjoiteta
+    assert reopened.images.snapshot_meta()['category_counts']['total'] == 4
+    assert not (tmp_path / 'category_counts.json').exists()
+    reopened.close()
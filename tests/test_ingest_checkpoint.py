@@ -0,0 +1,88 @@
+"""
+Luokittelun tarkistuspiste (ingest_checkpoint.IngestCheckpoint) ja keskeytyneen ajon jatkaminen:
+jatkoajo ohittaa manifestiin jo tallennetut kuvat ja käsittelee vain loput.
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import threading
+import contextlib
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from PIL import Image  # noqa: E402
+
+import classify_images  # noqa: E402
+from app import ImageDatabase  # noqa: E402
+from classify_images import classify_images_hierarchical, get_checkpoint, get_manifest  # noqa: E402
+from ingest_checkpoint import IngestCheckpoint  # noqa: E402
+
+
+def test_checkpoint_marks_unfinished_run_interrupted(tmp_path):
+    checkpoint = IngestCheckpoint(tmp_path)
+    assert checkpoint.interrupted_run() is None
+    checkpoint.begin('/data/source')
+    checkpoint.record(3)
+    run_id = checkpoint.state['run_id']
+
+    # Prosessi kuoli ennen finish()-kutsua
+    interrupted = IngestCheckpoint(tmp_path).interrupted_run()
+    assert interrupted['run_id'] == run_id
+    assert interrupted['indexed'] == 3
+    assert interrupted['checkpoints'] == 1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        resumed = IngestCheckpoint(tmp_path)
+        resumed.begin('/data/source')
+    assert resumed.state['resumed_from'] == run_id
+    resumed.finish()
+    assert IngestCheckpoint(tmp_path).interrupted_run() is None
+
+
+def test_interrupted_run_resumes_with_remaining_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(classify_images, 'PROGRESS_INTERVAL', 0)
+    source = tmp_path / 'source' / 'cam'
+    source.mkdir(parents=True)
+    for epoch in range(1762371760, 1762371766):
+        Image.new('RGB', (8, 8), (epoch % 255, 0, 0)).save(source / f'2-Ovi-{epoch}.000001-x.jpg')
+    target = tmp_path / 'classified'
+    cancel_event = threading.Event()
+
+    def progress(state):
+        if state['processed'] >= 2:
+            cancel_event.set()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(target)
+        first = classify_images_hierarchical(str(source.parent), str(target), db, workers=1, order='none',
+                                             progress=progress, cancel_event=cancel_event)
+        done = len(get_manifest(target).entries)
+        indexed = len(db.images)
+        db.close()
+    assert first.get('cancelled')
+    assert 0 < done < 6
+
+    # Keskeytetty ajo merkitään 'cancelled'; kaatuminen jättäisi tilaksi 'running'
+    checkpoint = get_checkpoint(target)
+    checkpoint.state['state'] = 'running'
+    checkpoint.save_checkpoint()
+    run_id = checkpoint.state['run_id']
+    # Uusi prosessi: välimuistissa olevat manifestit, hash-indeksit ja tarkistuspisteet luetaan levyltä
+    for cache in (classify_images._manifests, classify_images._content_stores, classify_images._checkpoints):
+        cache.clear()
+
+    assert get_checkpoint(target).interrupted_run()['run_id'] == run_id
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(target)
+        second = classify_images_hierarchical(str(source.parent), str(target), db, workers=1, order='none')
+    assert second['stats']['skipped'] == done
+    assert second['stats']['total'] == 6
+    assert len(get_manifest(target).entries) == 6
+    assert len(db.images) > indexed
+    state = IngestCheckpoint(target).state
+    assert state['state'] == 'completed'
+    assert state['resumed_from'] == run_id
+    db.close()
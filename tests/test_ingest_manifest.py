@@ -0,0 +1,96 @@
+"""
+Manifestin ja hash-indeksin journaalitallennus (durable_io.JsonJournal) sekä läpikäynnin
+tunnisteeseen perustuva karsinta.
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from content_store import ContentStore  # noqa: E402
+from ingest_manifest import IngestManifest  # noqa: E402
+
+STAT = SimpleNamespace(st_size=10, st_mtime_ns=20, st_ino=30)
+
+
+def _info():
+    return {'hash': 'abc', 'date': datetime(2025, 11, 5, 19, 42), 'source': 'filename'}
+
+
+def test_manifest_save_appends_only_changes(tmp_path):
+    manifest = IngestManifest(tmp_path)
+    for index in range(3):
+        manifest.mark_processed(f'/src/img{index}.jpg', STAT, _info())
+    manifest.save_manifest()
+    journal = tmp_path / 'ingest_manifest.json.journal'
+    size = journal.stat().st_size
+    manifest.save_manifest()
+    assert journal.stat().st_size == size
+    manifest.mark_processed('/src/img3.jpg', STAT, _info())
+    manifest.save_manifest()
+    assert len(journal.read_bytes().splitlines()) == 4
+
+    reopened = IngestManifest(tmp_path)
+    assert sorted(reopened.entries) == [f'/src/img{index}.jpg' for index in range(4)]
+    assert reopened.is_processed('/src/img3.jpg', STAT)
+
+
+def test_partial_manifest_journal_line_is_dropped(tmp_path):
+    manifest = IngestManifest(tmp_path)
+    manifest.mark_processed('/src/a.jpg', STAT, _info())
+    manifest.save_manifest()
+    with open(tmp_path / 'ingest_manifest.json.journal', 'ab') as f:
+        f.write(b'{"k": "/src/b.jpg", "v": {"si')
+    with contextlib.redirect_stdout(io.StringIO()):
+        reopened = IngestManifest(tmp_path)
+    assert list(reopened.entries) == ['/src/a.jpg']
+    reopened.mark_processed('/src/c.jpg', STAT, _info())
+    reopened.save_manifest()
+    assert sorted(IngestManifest(tmp_path).entries) == ['/src/a.jpg', '/src/c.jpg']
+
+
+def test_prune_removes_entries_not_seen_by_scan(tmp_path):
+    manifest = IngestManifest(tmp_path)
+    manifest.mark_processed('/src/kept.jpg', STAT, _info())
+    manifest.mark_processed('/src/deleted.jpg', STAT, _info())
+    manifest.save_manifest()
+
+    manifest = IngestManifest(tmp_path)
+    manifest.begin_scan()
+    manifest.mark_seen('/src/kept.jpg')
+    manifest.mark_processed('/src/new.jpg', STAT, _info())
+    assert manifest.prune() == 1
+    manifest.save_manifest()
+    assert sorted(IngestManifest(tmp_path).entries) == ['/src/kept.jpg', '/src/new.jpg']
+
+
+def test_clear_rewrites_manifest(tmp_path):
+    manifest = IngestManifest(tmp_path)
+    manifest.mark_processed('/src/a.jpg', STAT, _info())
+    manifest.save_manifest()
+    manifest.clear()
+    manifest.save_manifest()
+    assert not (tmp_path / 'ingest_manifest.json.journal').exists()
+    assert IngestManifest(tmp_path).entries == {}
+
+
+def test_hash_index_journal(tmp_path):
+    source = tmp_path / 'src.jpg'
+    source.write_bytes(b'image')
+    store = ContentStore(tmp_path)
+    store.put({'hash': 'ab12', 'path': source, 'filename': 'src.jpg'}, 'copy')
+    store.put({'hash': 'cd34', 'path': source, 'filename': 'src.jpg'}, 'copy')
+    store.save_index()
+    store.forget('cd34')
+    store.save_index()
+
+    reopened = ContentStore(tmp_path)
+    assert list(reopened.index) == ['ab12']
+    assert reopened.lookup('ab12')['path'] == 'store/ab/ab12.jpg'
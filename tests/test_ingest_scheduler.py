@@ -0,0 +1,69 @@
+"""
+Prioriteettijärjestys (PriorityScheduler) ja käynnissä olevalle ajolle annetut tiedostot (LIVE_INBOX).
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import threading
+import contextlib
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from PIL import Image  # noqa: E402
+
+from app import ImageDatabase  # noqa: E402
+from classify_images import classify_images_hierarchical, get_manifest  # noqa: E402
+from ingest_scheduler import LIVE_INBOX, LiveInbox, PriorityScheduler  # noqa: E402
+
+
+def _frame(path, epoch):
+    path.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (8, 8), (epoch % 255, 0, 0)).save(path / f'2-Ovi-{epoch}.000001-x.jpg')
+    return path / f'2-Ovi-{epoch}.000001-x.jpg'
+
+
+def test_scheduler_pops_newest_first_and_forgets_popped_paths():
+    scheduler = PriorityScheduler(window=4, live_seconds=100, backlog_share=0.0, now=1000)
+    items = [(Path(f'/src/cam{index % 2}-{index}.jpg'), SimpleNamespace(st_mtime=900 + index)) for index in range(6)]
+    order = list(scheduler.run(iter(items)))
+    assert sorted(order) == sorted(path for path, _ in items)
+    # Kamerat vuorottelevat, ja kummaltakin otetaan ikkunan uusin kuva
+    assert order[:2] == [Path('/src/cam0-2.jpg'), Path('/src/cam1-3.jpg')]
+    assert not scheduler.scheduled
+
+
+def test_orphaned_inbox_items_are_only_taken_when_no_run_accepts():
+    inbox = LiveInbox()
+    assert not inbox.offer(['/src/a.jpg'])
+    inbox.open()
+    assert inbox.offer(['/src/a.jpg'])
+    assert inbox.take_orphaned() == []
+    inbox.release()
+    assert inbox.take_orphaned() == [Path('/src/a.jpg')]
+
+
+def test_cancelled_run_processes_handed_off_files(tmp_path, monkeypatch):
+    monkeypatch.setattr('classify_images.INGEST_ORDER', 'priority')
+    source = tmp_path / 'source'
+    for epoch in range(1762371760, 1762371765):
+        _frame(source / 'cam', epoch)
+    late = _frame(tmp_path / 'late', 1762371800)
+    db = ImageDatabase(tmp_path / 'classified')
+    cancel_event = threading.Event()
+
+    def progress(_state):
+        # Tiedostovahti antaa kuvan ajolle, ja ajo perutaan ennen kuin se ehtii jonoon
+        if not cancel_event.is_set() and LIVE_INBOX.offer([late]):
+            cancel_event.set()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = classify_images_hierarchical(str(source), str(tmp_path / 'classified'), db, order='priority',
+                                              progress=progress, cancel_event=cancel_event)
+    assert result.get('cancelled')
+    assert not LIVE_INBOX.items
+    assert get_manifest(tmp_path / 'classified').is_processed(late, late.stat())
+    assert any(path.endswith(late.name) for path in db.images)
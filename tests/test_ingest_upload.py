@@ -0,0 +1,104 @@
+"""
+POST /api/ingest: pyynnön tarkistukset (tiedostonimi, tiedostotyyppi, tyhjä ja liian suuri runko,
+multipart ilman rajamerkkiä tai tiedostoja) sekä onnistunut vastaanotto ja duplikaatti.
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import contextlib
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from PIL import Image  # noqa: E402
+
+import ingest_upload  # noqa: E402
+import web_interface  # noqa: E402
+from app import ImageDatabase  # noqa: E402
+
+FILENAME = '2-Ovi-1762371760.378526-a.jpg'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(tmp_path / 'classified')
+    monkeypatch.setattr(web_interface, 'CLASSIFICATION_AVAILABLE', True)
+    monkeypatch.setattr(web_interface, 'DB', db)
+    monkeypatch.setattr(web_interface, 'BASE_PATH', tmp_path / 'classified')
+    monkeypatch.setattr(web_interface, 'SOURCE_PATH', tmp_path / 'source')
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield web_interface.app.test_client()
+        ingest_upload.flush_uploads()
+        db.close()
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (5, 2, 3)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def _uploaded_files(tmp_path):
+    uploads = tmp_path / 'source' / 'uploads'
+    return sorted(path.name for path in uploads.rglob('*') if path.is_file()) if uploads.exists() else []
+
+
+def test_missing_filename_is_rejected(client, tmp_path):
+    response = client.post('/api/ingest', data=_jpeg())
+    assert response.status_code == 400
+    assert 'Tiedostonimi puuttuu' in response.json['error']
+    assert _uploaded_files(tmp_path) == []
+
+
+@pytest.mark.parametrize('filename', ['notes.txt', '../..', 'kuva'])
+def test_unsupported_file_type_is_rejected(client, tmp_path, filename):
+    response = client.post('/api/ingest', query_string={'filename': filename}, data=_jpeg())
+    assert response.status_code == 400
+    assert response.json['results'][0]['status'] == 'failed'
+    assert response.json['stats']['failed'] == 1
+    assert _uploaded_files(tmp_path) == []
+
+
+def test_empty_body_is_rejected(client, tmp_path):
+    response = client.post('/api/ingest', headers={'X-Filename': FILENAME}, data=b'')
+    assert response.status_code == 400
+    assert response.json['results'][0]['error'] == 'Tyhjä kuva'
+    assert _uploaded_files(tmp_path) == []
+
+
+def test_oversized_body_is_rejected(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_upload, 'INGEST_MAX_UPLOAD_MB', 1)
+    response = client.post('/api/ingest', query_string={'filename': FILENAME}, data=b'\xff' * (1024 * 1024 + 1))
+    assert response.status_code == 400
+    assert 'liian suuri' in response.json['results'][0]['error']
+    assert _uploaded_files(tmp_path) == []
+
+
+def test_multipart_without_boundary_or_files_is_rejected(client):
+    response = client.post('/api/ingest', data=b'--x--', headers={'Content-Type': 'multipart/form-data'})
+    assert response.status_code == 400
+    assert 'rajamerkki' in response.json['error']
+    response = client.post('/api/ingest', data={'camera': '2-Ovi'}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.json['error'] == 'Pyynnössä ei ollut kuvia'
+
+
+def test_upload_is_indexed_and_duplicate_skipped(client, tmp_path):
+    response = client.post('/api/ingest', query_string={'filename': FILENAME}, data=_jpeg())
+    assert response.status_code == 201
+    result = response.json['results'][0]
+    assert result['status'] == 'indexed'
+    assert result['camera'] == '2-Ovi'
+    assert result['date'].startswith('2025-11-05')
+    assert any(link.startswith('days/') for link in result['links'])
+
+    response = client.post('/api/ingest', data={'file': (io.BytesIO(_jpeg()), FILENAME)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.json['results'][0]['status'] == 'duplicate'
+    assert response.json['stats']['duplicates'] == 1
@@ -0,0 +1,54 @@
+"""
+Aikavälihaut järjestetystä aikaindeksistä (time_index.SortedTimeIndex) ja
+ImageDatabase.get_images_by_date_range molemmilla tallennustavoilla.
+
+Ajo: python -m pytest -q tests
+"""
+import io
+import sys
+import contextlib
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from app import ImageDatabase  # noqa: E402
+from time_index import SortedTimeIndex  # noqa: E402
+
+
+def test_index_range_add_and_remove():
+    index = SortedTimeIndex.build([('c', 30.0), ('a', 10.0), ('none', None), ('b', 20.0)])
+    assert index.range() == ['a', 'b', 'c']
+    assert index.range(10.0, 30.0) == ['a', 'b']
+    index.add('d', 15.0)
+    index.add('a', 40.0)
+    index.remove('b')
+    assert index.range() == ['d', 'c', 'a']
+    assert index.range(None, 30.0) == ['d']
+    assert index.bounds() == (15.0, 40.0)
+    assert len(index) == 3
+
+
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_date_range_query_follows_additions_and_missing_flags(tmp_path, monkeypatch, backend):
+    monkeypatch.setenv('DB_BACKEND', backend)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = ImageDatabase(tmp_path)
+        for day in (4, 5, 6):
+            db.add_image(tmp_path / f'days/2025/11/0{day}/img{day}.jpg', f'2025-11-0{day}T12:00:00',
+                         f'day_2025-11-0{day}')
+        db.save_database()
+        if backend == 'journal':
+            db.images.compact(wait=True)
+        found = db.get_images_by_date_range('2025-11-05', '2025-11-06')
+        assert sorted(image['filename'] for image in found) == ['img5.jpg', 'img6.jpg']
+
+        # Indeksin rakentamisen jälkeen lisätyt ja puuttuviksi merkityt
+        db.add_image(tmp_path / 'days/2025/11/05/late.jpg', '2025-11-05T23:59:59', 'day_2025-11-05')
+        db.set_missing('days/2025/11/06/img6.jpg', True)
+        found = db.get_images_by_date_range('2025-11-05', '2025-11-06')
+        assert sorted(image['filename'] for image in found) == ['img5.jpg', 'late.jpg']
+        assert [image['filename'] for image in db.get_images_by_date_range(None, '2025-11-04')] == ['img4.jpg']
+        db.close()
@@ -0,0 +1,129 @@
+"""
+Aikahierarkian tasot ja niiden polut.
+
+Sama määrittely käytetään sekä linkkipuun luonnissa (classify_images.py), virtuaalisessa
+aikaindeksissä (virtual_tree.py) että web-rajapinnan kategorioissa.
+
+LAYOUT_MODE=physical luo jokaiselle kuvalle linkin jokaiseen tasoon (years/.../seconds),
+LAYOUT_MODE=virtual tallentaa kuvan vain kerran sisältövarastoon ja tasot muodostetaan
+tietokannan aikaindeksistä.
+"""
+
+import os
+
+TIME_LEVELS = [
+    {'level': 'year', 'dir': 'years', 'name': 'Vuodet', 'icon': '📅'},
+    {'level': 'month', 'dir': 'months', 'name': 'Kuukaudet', 'icon': '📆'},
+    {'level': 'week', 'dir': 'weeks', 'name': 'Viikot', 'icon': '🗓️'},
+    {'level': 'day', 'dir': 'days', 'name': 'Päivät', 'icon': '📅'},
+    {'level': 'hour', 'dir': 'hours', 'name': 'Tunnit', 'icon': '⏰'},
+    {'level': 'minute', 'dir': 'minutes', 'name': 'Minuutit', 'icon': '⏱️'},
+    {'level': 'second', 'dir': 'seconds', 'name': 'Sekunnit', 'icon': '⚡'},
+]
+LEVEL_DIRS = {level['dir']: level['level'] for level in TIME_LEVELS}
+
+LAYOUT_MODE = os.environ.get('LAYOUT_MODE', 'physical').lower()
+
+
+def _parse_levels(raw, setting):
+    known = {level['level'] for level in TIME_LEVELS}
+    wanted = []
+    for name in (raw or '').split(','):
+        name = name.strip().lower()
+        if name.endswith('s') and name[:-1] in known:
+            name = name[:-1]
+        if name in known:
+            wanted.append(name)
+        elif name:
+            print(f"Tuntematon taso {setting}-asetuksessa: {name}")
+    return wanted
+
+
+def _parse_link_levels(raw):
+    return _parse_levels(raw, 'LINK_LEVELS') or [level['level'] for level in TIME_LEVELS]
+
+
+# Materialisoitavat tasot, esim. LINK_LEVELS=year,month,day,hour (oletuksena kaikki)
+LINK_LEVELS = _parse_link_levels(os.environ.get('LINK_LEVELS', ''))
+
+
+# Suurten aikakansioiden jako alikansioihin, esim. SHARD_LEVELS=year,month (oletuksena ei käytössä).
+# SHARD_BY=camera,hash jakaa kansion ensin kameran (_c-<kamera>) ja sitten sisältöhashin alun (_h-<xx>) mukaan,
+# jolloin yksittäisen kansion koko pysyy rajattuna säilytysajasta riippumatta.
+SHARD_LEVELS = _parse_levels(os.environ.get('SHARD_LEVELS', ''), 'SHARD_LEVELS')
+SHARD_BY = [key for key in os.environ.get('SHARD_BY', 'camera,hash').replace(' ', '').lower().split(',')
+            if key in ('camera', 'hash')]
+try:
+    SHARD_HASH_CHARS = max(1, int(os.environ.get('SHARD_HASH_CHARS', '2')))
+except ValueError:
+    SHARD_HASH_CHARS = 2
+SHARD_PREFIXES = ('_c-', '_h-')
+
+
+def is_shard_dir(name):
+    """Onko kansio aikakansion sisäinen jakokansio (ei oma aikayksikkönsä)"""
+    return name.startswith(SHARD_PREFIXES)
+
+
+def shard_parts(level, camera=None, digest=None):
+    """Palauta jakokansioiden nimet tason kansion alle (tyhjä lista jos tasoa ei jaeta)"""
+    if level not in SHARD_LEVELS:
+        return []
+    parts = []
+    for key in SHARD_BY:
+        if key == 'camera':
+            name = (camera or 'unknown').replace(os.sep, '_').replace('/', '_').strip() or 'unknown'
+            parts.append(f"_c-{name.lstrip('.')}")
+        elif key == 'hash' and digest:
+            parts.append(f"_h-{digest[:SHARD_HASH_CHARS]}")
+    return parts
+
+
+def active_levels():
+    """Käytössä olevat tasot karkeimmasta tarkimpaan"""
+    return [level for level in TIME_LEVELS if level['level'] in LINK_LEVELS]
+
+
+def finest_level():
+    return active_levels()[-1]['level']
+
+
+def is_virtual_layout():
+    return LAYOUT_MODE == 'virtual'
+
+
+def level_paths(date):
+    """Palauta {taso: (kansiopolun osat tason juurikansion alla, aikatunniste)}"""
+    year = date.year
+    month = date.month
+    week = date.isocalendar()[1]
+    day = date.day
+    hour = date.hour
+    minute = date.minute
+    second = date.second
+    return {
+        'year': ([str(year)], f"{year}"),
+        'month': ([str(year), f"{month:02d}"], f"{year}-{month:02d}"),
+        'week': ([str(year), f"W{week:02d}"], f"{year}-W{week:02d}"),
+        'day': ([str(year), f"{month:02d}", f"{day:02d}"], f"{year}-{month:02d}-{day:02d}"),
+        'hour': ([str(year), f"{month:02d}", f"{day:02d}", f"{hour:02d}"],
+                 f"{year}-{month:02d}-{day:02d}-{hour:02d}"),
+        'minute': ([str(year), f"{month:02d}", f"{day:02d}", f"{hour:02d}", f"{minute:02d}"],
+                   f"{year}-{month:02d}-{day:02d}-{hour:02d}-{minute:02d}"),
+        'second': ([str(year), f"{month:02d}", f"{day:02d}", f"{hour:02d}", f"{minute:02d}", f"{second:02d}"],
+                   f"{year}-{month:02d}-{day:02d}-{hour:02d}-{minute:02d}-{second:02d}"),
+    }
+
+
+def level_time_key(date, level):
+    return level_paths(date)[level][1]
+
+
+def category_from_rel_path(rel_path):
+    """Päättele kategoria (esim. 'day_2025-11-06') linkkipuun suhteellisesta polusta, tai None"""
+    parts = rel_path.replace(os.sep, '/').split('/')
+    level = LEVEL_DIRS.get(parts[0])
+    folder_parts = [part for part in parts[1:-1] if not is_shard_dir(part)]
+    if level is None or not folder_parts:
+        return None
+    return f"{level}_{'-'.join(folder_parts)}"
@@ -0,0 +1,70 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+class SortedTimeIndex:
+    """Tietueiden aikaleimat (epoch) järjestettynä listana aikavälihakuja varten.
+
+    Haku on kaksi bisect-hakua ja osumien läpikäynti, eli O(log n + k) ilman
+    aikaleimamerkkijonojen jäsentämistä. Lisäys on bisect.insort; uudet kuvat ovat
+    yleensä uusimpia, jolloin lisäys osuu listan loppuun ja on käytännössä halpa.
+    """
+
+    def __init__(self):
+        self.epochs = []
+        self.paths = []
+        self.by_path = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, entries):
+        """Rakenna indeksi (polku, epoch) -pareista yhdellä lajittelulla"""
+        index = cls()
+        pairs = sorted((epoch, rel_path) for rel_path, epoch in entries if epoch is not None)
+        index.epochs = [epoch for epoch, _ in pairs]
+        index.paths = [rel_path for _, rel_path in pairs]
+        index.by_path = {rel_path: epoch for epoch, rel_path in pairs}
+        return index
+
+    def _remove(self, rel_path):
+        epoch = self.by_path.pop(rel_path, None)
+        if epoch is None:
+            return
+        position = bisect_left(self.epochs, epoch)
+        while position < len(self.epochs) and self.epochs[position] == epoch:
+            if self.paths[position] == rel_path:
+                del self.epochs[position]
+                del self.paths[position]
+                return
+            position += 1
+
+    def add(self, rel_path, epoch):
+        with self.lock:
+            if self.by_path.get(rel_path) == epoch:
+                return
+            self._remove(rel_path)
+            if epoch is None:
+                return
+            position = bisect_right(self.epochs, epoch)
+            self.epochs.insert(position, epoch)
+            self.paths.insert(position, rel_path)
+            self.by_path[rel_path] = epoch
+
+    def remove(self, rel_path):
+        with self.lock:
+            self._remove(rel_path)
+
+    def range(self, start_epoch=None, end_epoch=None):
+        """Polut, joiden aikaleima on välillä [start_epoch, end_epoch), vanhimmasta uusimpaan"""
+        with self.lock:
+            start = 0 if start_epoch is None else bisect_left(self.epochs, start_epoch)
+            end = len(self.epochs) if end_epoch is None else bisect_left(self.epochs, end_epoch)
+            return self.paths[start:end]
+
+    def bounds(self):
+        with self.lock:
+            if not self.epochs:
+                return None, None
+            return self.epochs[0], self.epochs[-1]
+
+    def __len__(self):
+        return len(self.epochs)
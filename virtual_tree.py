@@ -0,0 +1,98 @@
+import threading
+from datetime import datetime
+
+from time_hierarchy import LEVEL_DIRS, TIME_LEVELS, level_paths
+
+class VirtualTimeTree:
+    """Muistissa oleva aikahierarkia (years/.../seconds) tietokannan tietueista.
+
+    Fyysisen linkkipuun tietue (esim. years/2025/kuva.jpg) lisätään omaan kansioonsa,
+    sisältövaraston tietue (store/ab/<hash>.jpg) jokaisen tason kansioon. Näin selaus,
+    kategoriat ja /images/<polku> toimivat samoilla poluilla ilman linkkejä levyllä.
+    """
+
+    def __init__(self, levels=None):
+        self.levels = [level for level in TIME_LEVELS if levels is None or level['level'] in levels]
+        self.nodes = {}  # kansion osat (tuple) -> {'folders': set, 'images': {nimi: (kohde, timestamp)}, 'count': int}
+        self.lock = threading.Lock()
+
+    def _node(self, parts):
+        node = self.nodes.get(parts)
+        if node is None:
+            node = {'folders': set(), 'images': {}, 'count': 0}
+            self.nodes[parts] = node
+        return node
+
+    def _add(self, folder_parts, filename, target, timestamp):
+        folder_parts = tuple(folder_parts)
+        leaf = self._node(folder_parts)
+        if filename in leaf['images']:
+            return
+        leaf['images'][filename] = (target, timestamp)
+        for depth in range(1, len(folder_parts) + 1):
+            node = self._node(folder_parts[:depth])
+            node['count'] += 1
+            if depth < len(folder_parts):
+                node['folders'].add(folder_parts[depth])
+
+    def add_record(self, rel_path, info):
+        parts = rel_path.split('/')
+        with self.lock:
+            if parts[0] in LEVEL_DIRS and len(parts) > 1:
+                self._add(parts[:-1], parts[-1], rel_path, info.get('timestamp'))
+                return
+            if parts[0] != 'store' or not info.get('timestamp'):
+                return
+            try:
+                date = datetime.fromisoformat(info['timestamp'])
+            except (TypeError, ValueError):
+                return
+            filename = info.get('filename') or parts[-1]
+            paths = level_paths(date)
+            for level in self.levels:
+                folder_parts, _ = paths[level['level']]
+                self._add([level['dir']] + folder_parts, filename, rel_path, info['timestamp'])
+
+    def resolve(self, virtual_path):
+        """Palauta virtuaalipolun (esim. days/2025/11/06/kuva.jpg) todellinen suhteellinen polku"""
+        parts = tuple(virtual_path.strip('/').split('/'))
+        with self.lock:
+            node = self.nodes.get(parts[:-1])
+            if not node:
+                return None
+            entry = node['images'].get(parts[-1])
+            return entry[0] if entry else None
+
+    def browse(self, path):
+        """Palauta kansion sisältö samassa muodossa kuin /api/browse tai None jos kansiota ei ole"""
+        parts = tuple(part for part in path.strip('/').split('/') if part)
+        with self.lock:
+            node = self.nodes.get(parts)
+            if node is None:
+                return None
+            folders = []
+            for name in sorted(node['folders']):
+                child = self.nodes.get(parts + (name,))
+                folders.append({'name': name, 'path': '/'.join(parts + (name,)), 'image_count': child['count'] if child else 0})
+            images = [(name, target, timestamp) for name, (target, timestamp) in sorted(node['images'].items())]
+        result_images = []
+        for name, target, timestamp in images:
+            try:
+                date_display = datetime.fromisoformat(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else 'Tuntematon'
+            except ValueError:
+                date_display = 'Tuntematon'
+            result_images.append({'path': '/'.join(parts + (name,)), 'filename': name, 'date_display': date_display,
+                                  'timestamp': timestamp or ''})
+        return {'folders': folders, 'images': result_images}
+
+    def count(self, level_dir):
+        with self.lock:
+            node = self.nodes.get((level_dir,))
+            return node['count'] if node else 0
+
+    def summary(self, level_dir):
+        """Palauta (kansioiden määrä, kuvien määrä) tason alla"""
+        with self.lock:
+            folders = sum(1 for parts in self.nodes if len(parts) > 1 and parts[0] == level_dir)
+            node = self.nodes.get((level_dir,))
+            return folders, node['count'] if node else 0
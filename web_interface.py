@@ -1,9 +1,15 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 import json
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import os
 import logging
+import threading
+
+from fast_copy import cached_methods
+from filename_timestamps import extract_camera_from_filename
+from jobs import JobManager
+from time_hierarchy import LEVEL_DIRS, active_levels, is_shard_dir, is_virtual_layout, level_time_key
 
 # Aseta logging
 logging.basicConfig(level=logging.DEBUG)
@@ -492,6 +498,12 @@ def create_templates():
                     <button class="classify-btn" onclick="classifyImages()" {% if not classification_available %}disabled{% endif %}>
                         🗂️ Luokittele Kuvat
                     </button>
+                    <button class="classify-btn" onclick="classifyImages(true)" title="Käsittele myös jo luokitellut kuvat (esim. sääntöjen muututtua)" {% if not classification_available %}disabled{% endif %}>
+                        🔁 Luokittele Kaikki Uudelleen
+                    </button>
+                    <button class="classify-btn" onclick="cancelClassify()" id="cancelClassifyBtn" style="display: none;">
+                        ⏹ Keskeytä Luokittelu
+                    </button>
                     <a href="/compare" class="nav-link">
                         ⚖️ Vertaile Kuvia
                     </a>
@@ -516,6 +528,7 @@ def create_templates():
 
                 <video id="hlsVideo" class="hls-video" controls></video>
 
+                <div id="classifyProgress" class="loading" style="display: none;"></div>
                 <div id="stats" class="stats" style="display: none;"></div>
             </div>
 
@@ -1039,15 +1052,18 @@ def create_templates():
     }
 
     // Luokittelu
-    async function classifyImages() {
+    async function classifyImages(fullReprocess = false) {
         try {
-            const response = await fetch('/api/classify', { method: 'POST' });
+            const response = await fetch('/api/classify', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ full_reprocess: fullReprocess })
+            });
             const result = await response.json();
 
             if (result.success) {
-                showStats(result.result);
-                alert('Kuvien luokittelu valmis!');
-                loadCategories(); // Päivitä hierarkkinen navigointi
+                // Luokittelu ajetaan taustatyönä; seurataan edistymistä kunnes työ valmistuu
+                followClassifyJob(result.job_id);
             } else {
                 alert('Luokittelu epäonnistui: ' + result.error);
             }
@@ -1056,10 +1072,89 @@ def create_templates():
         }
     }
 
+    let currentClassifyJob = null;
+
+    function followClassifyJob(jobId) {
+        currentClassifyJob = jobId;
+        document.getElementById('cancelClassifyBtn').style.display = 'inline-block';
+        if (window.EventSource) {
+            const source = new EventSource('/api/jobs/' + jobId + '/events');
+            source.onmessage = (event) => {
+                const job = JSON.parse(event.data);
+                if (handleClassifyJob(job)) source.close();
+            };
+            source.onerror = () => {
+                // Virta katkesi (esim. välityspalvelin), jatketaan kyselemällä
+                source.close();
+                pollClassifyJob(jobId);
+            };
+        } else {
+            pollClassifyJob(jobId);
+        }
+    }
+
+    async function pollClassifyJob(jobId) {
+        try {
+            const response = await fetch('/api/jobs/' + jobId);
+            const job = await response.json();
+            if (job.error && !job.state) {
+                showClassifyProgress('Virhe: ' + job.error);
+                return;
+            }
+            if (!handleClassifyJob(job)) setTimeout(() => pollClassifyJob(jobId), 1000);
+        } catch (error) {
+            setTimeout(() => pollClassifyJob(jobId), 2000);
+        }
+    }
+
+    // Päivitä näkymä työn tilasta. Palauttaa true kun työ on päättynyt.
+    function handleClassifyJob(job) {
+        if (job.state === 'queued' || job.state === 'running') {
+            const p = job.progress || {};
+            const eta = (p.eta_seconds !== null && p.eta_seconds !== undefined) ? `, arvio ${Math.ceil(p.eta_seconds)} s` : '';
+            const stage = job.cancel_requested ? 'keskeytetään' : (p.stage || 'käynnistyy');
+            showClassifyProgress(`Luokittelu: ${stage} – ${p.processed || 0} käsitelty, ${p.discovered || 0} löydetty, ` +
+                                 `${p.files_per_sec || 0} kuvaa/s${eta}`);
+            return false;
+        }
+        currentClassifyJob = null;
+        document.getElementById('cancelClassifyBtn').style.display = 'none';
+        if (job.state === 'done') {
+            showClassifyProgress('');
+            showStats(job.result);
+            alert('Kuvien luokittelu valmis!');
+        } else if (job.state === 'cancelled') {
+            showClassifyProgress('Luokittelu keskeytetty. Jo käsitellyt kuvat säilyvät.');
+            if (job.result && job.result.stats) showStats(job.result);
+        } else {
+            showClassifyProgress('');
+            alert('Luokittelu epäonnistui: ' + job.error);
+        }
+        loadCategories(); // Päivitä hierarkkinen navigointi
+        return true;
+    }
+
+    function showClassifyProgress(text) {
+        const el = document.getElementById('classifyProgress');
+        el.textContent = text;
+        el.style.display = text ? 'block' : 'none';
+    }
+
+    async function cancelClassify() {
+        if (!currentClassifyJob) return;
+        try {
+            await fetch('/api/jobs/' + currentClassifyJob + '/cancel', { method: 'POST' });
+        } catch (error) {
+            alert('Virhe keskeytyksessä: ' + error.message);
+        }
+    }
+
     function showStats(result) {
         const statsDiv = document.getElementById('stats');
         const stats = result.stats;
-        const classified = result.classified;
+        const classified = result.classified || {};
+        // LINK_LEVELS voi jättää tasoja pois
+        const levelImages = (level) => classified[level] ? classified[level].images : '–';
 
         statsDiv.innerHTML = `
             <div class="stat-card">
@@ -1071,11 +1166,11 @@ def create_templates():
                 <div>Tiedostojärjestelmä</div>
             </div>
             <div class="stat-card">
-                <div class="stat-number">${classified.year.images}</div>
+                <div class="stat-number">${levelImages('year')}</div>
                 <div>Vuosikuvia</div>
             </div>
             <div class="stat-card">
-                <div class="stat-number">${classified.minute.images}</div>
+                <div class="stat-number">${levelImages('minute')}</div>
                 <div>Minuuttikuvia</div>
             </div>
         `;
@@ -1362,9 +1457,22 @@ def create_templates():
         
         showMainView();
         loadCamerasToSelect();
+        resumeClassifyJob();
         
         loadImagesByTimeRange();
     });
+
+    // Jos luokittelu on jo käynnissä (esim. sivu ladattiin uudelleen), jatketaan sen seuraamista
+    async function resumeClassifyJob() {
+        try {
+            const response = await fetch('/api/jobs');
+            const jobs = await response.json();
+            const active = jobs.find(job => job.kind === 'classify' && (job.state === 'queued' || job.state === 'running'));
+            if (active) followClassifyJob(active.id);
+        } catch (error) {
+            console.error('Error loading jobs:', error);
+        }
+    }
 </script>
 </body>
 </html>
@@ -1924,9 +2032,11 @@ try:
     from classify_images import classify_images_hierarchical
     from app import ImageDatabase
     
-    # Alusta tietokanta
+    # Alusta tietokanta. Luokittelun työprosessit tuovat tämän moduulin nimellä __mp_main__,
+    # eikä niissä avata tietokantaa.
     BASE_PATH = Path('/data/classified')
-    DB = ImageDatabase(BASE_PATH)
+    if __name__ != '__mp_main__':
+        DB = ImageDatabase(BASE_PATH)
     CLASSIFICATION_AVAILABLE = True
     logger.info("Luokittelumoduulit ladattu onnistuneesti")
 except ImportError as e:
@@ -1934,6 +2044,92 @@ except ImportError as e:
 except Exception as e:
     logger.error(f"Tietokannan alustus epäonnistui: {e}")
 
+SOURCE_PATH = Path('/data/source')
+WATCHER = None
+JOBS = JobManager()
+RECONCILER = None
+
+_SERVICES_LOCK = threading.Lock()
+_SERVICES_STARTED = False
+
+def background_services_setting():
+    """BACKGROUND_SERVICES: auto = käynnistä kun sovellus ajetaan suoraan (python web_interface.py),
+    1 = käynnistä myös kun WSGI-palvelin tuo moduulin, 0 = ei taustapalveluita"""
+    setting = os.environ.get('BACKGROUND_SERVICES', 'auto').lower()
+    if setting in ('0', 'false', 'no'):
+        return 'off'
+    if setting in ('1', 'true', 'yes'):
+        return 'on'
+    return 'auto'
+
+def start_background_services():
+    """Käynnistä taustapalvelut (tiedostovahti ja arkiston täsmäytys) kerran prosessia kohden.
+    WATCH_SOURCE=0 poistaa vahdin ja RECONCILE_INTERVAL_SECONDS=0 täsmäytyksen käytöstä."""
+    global _SERVICES_STARTED
+    if not CLASSIFICATION_AVAILABLE or DB is None:
+        return
+    with _SERVICES_LOCK:
+        if _SERVICES_STARTED:
+            return
+        _SERVICES_STARTED = True
+    resume_interrupted_classification()
+    start_reconciler()
+    start_watcher()
+
+def resume_interrupted_classification():
+    """Jatka luokittelua, joka keskeytyi (esim. kontin uudelleenkäynnistys) ennen valmistumistaan.
+    RESUME_INGEST=0 poistaa automaattisen jatkamisen käytöstä."""
+    if os.environ.get('RESUME_INGEST', '1').lower() in ('0', 'false', 'no'):
+        return
+    try:
+        from classify_images import get_checkpoint
+        interrupted = get_checkpoint(BASE_PATH).interrupted_run()
+        if not interrupted:
+            return
+        logger.info(f"Edellinen luokittelu {interrupted.get('run_id')} keskeytyi, jatketaan tarkistuspisteestä")
+        # Manifesti sisältää jo käsitellyt tiedostot (myös täyden uudelleenkäsittelyn osalta), joten jatko on tavallinen ajo
+        start_classify_job(False, resumed_from=interrupted.get('run_id'))
+    except Exception as e:
+        logger.error(f"Keskeytyneen luokittelun jatkaminen epäonnistui: {e}")
+
+def start_reconciler():
+    global RECONCILER
+    if RECONCILER is not None:
+        return
+    interval = float(os.environ.get('RECONCILE_INTERVAL_SECONDS', '3600'))
+    if interval <= 0:
+        logger.info("Arkiston täsmäytys ei käytössä (RECONCILE_INTERVAL_SECONDS=0)")
+        return
+    try:
+        from archive_reconciler import ArchiveReconciler
+        RECONCILER = ArchiveReconciler(
+            BASE_PATH, DB,
+            interval=interval,
+            files_per_second=float(os.environ.get('RECONCILE_FILES_PER_SECOND', '200'))
+        )
+        RECONCILER.start()
+    except Exception as e:
+        logger.error(f"Arkiston täsmäytyksen käynnistys epäonnistui: {e}")
+
+def start_watcher():
+    global WATCHER
+    if WATCHER is not None:
+        return
+    if os.environ.get('WATCH_SOURCE', '1').lower() in ('0', 'false', 'no'):
+        logger.info("Tiedostovahti ei käytössä (WATCH_SOURCE=0)")
+        return
+    try:
+        from ingest_watcher import SourceWatcher
+        WATCHER = SourceWatcher(
+            SOURCE_PATH, BASE_PATH, DB,
+            poll_interval=float(os.environ.get('WATCH_POLL_SECONDS', '1.0')),
+            settle_seconds=float(os.environ.get('WATCH_SETTLE_SECONDS', '1.0')),
+            use_inotify=os.environ.get('WATCH_MODE', 'inotify').lower() != 'polling'
+        )
+        WATCHER.start()
+    except Exception as e:
+        logger.error(f"Tiedostovahdin käynnistys epäonnistui: {e}")
+
 # Apufunktio kuvien laskemiseen
 def count_images_in_folder(folder_path):
     """Laske kuvien määrä kansiossa ja sen alikansioissa"""
@@ -1953,29 +2149,26 @@ def count_images_in_folder(folder_path):
         logger.error(f"Virhe kuvien laskennassa {folder_path}: {e}")
         return 0
 
+def iter_folder_files(folder_path):
+    """Kansion tiedostot, mukaan lukien jakokansioihin (SHARD_LEVELS) sijoitetut"""
+    pending = [folder_path]
+    while pending:
+        current = pending.pop()
+        for item in current.iterdir():
+            if item.is_dir():
+                if is_shard_dir(item.name):
+                    pending.append(item)
+            elif item.is_file():
+                yield item
+
+def folder_image_count(rel_folder, folder_path):
+    """Aikatasojen kansioille määrä tietokannan laskureista, muille kansioille laskemalla"""
+    if DB and rel_folder.split('/', 1)[0] in LEVEL_DIRS:
+        return DB.category_counts.count(rel_folder)
+    return count_images_in_folder(folder_path)
+
 # --- Uudet apufunktiot: kameran tunnistus ja API ---
-def extract_camera_from_filename(name):
-    """
-    Palauttaa kameran nimen kuvatiedoston nimestä.
-    Etsii ensin timestamp-muotoisen segmentin ('-<digits>.<digits>') ja palauttaa kaiken
-    sitä edeltävän osan. Tämä käsittelee kameranimiä, joissa voi olla '-',
-    esim. '2-Ovi-1762371760.378526-b2yisl.jpg' -> '2-Ovi'
-    Fallback: jos timestampia ei löydy, ottaa osan ennen ensimmäistä '-'.
-    """
-    if not name:
-        return ''
-    base = os.path.basename(name)
-
-    import re
-    # etsi pattern: '-' followed by digits, a dot, then digits (esim. -1762371760.378526)
-    m = re.search(r'-(\d+\.\d+)', base)
-    if m:
-        cam = base[:m.start()]
-        return cam.strip()
-    idx = base.find('-')
-    if idx > 0:
-        return base[:idx].strip()
-    return ''
+# extract_camera_from_filename on jaettu luokittelun kanssa (filename_timestamps.py)
 
 @app.route('/api/cameras')
 def get_cameras():
@@ -2004,13 +2197,14 @@ def get_cameras():
         # fallback: skannaa filesystem-juuren kansion, mutta suodattaa aikakansiot pois
         base = Path('/data/classified')
         time_unit_names = {'years', 'months', 'weeks', 'days', 'hours', 'minutes', 'seconds'}
+        internal_dirs = {'store'}
         if base.exists():
             for item in base.iterdir():
                 if not item.is_dir():
                     continue
                 name = item.name
                 # Ohita selkeästi aikakansiot
-                if name.lower() in time_unit_names:
+                if name.lower() in time_unit_names or name in internal_dirs:
                     continue
                 # Jos kansio sisältää kuvia (tai alikansioissa), pidetään se mahdollisena kamerana
                 has_images = False
@@ -2040,49 +2234,17 @@ def get_categories():
         return jsonify([])
     
     try:
+        # Vain LINK_LEVELS-tasot; määrät tulevat tietokannan ylläpitämistä laskureista
+        # (virtuaalisessa asettelussa muistissa olevasta aikaindeksistä)
+        tree = DB.get_virtual_tree() if is_virtual_layout() else None
         categories = [
             {
-                'name': 'Vuodet',
-                'path': 'years',
-                'icon': '📅',
-                'count': count_images_in_folder(BASE_PATH / 'years')
-            },
-            {
-                'name': 'Kuukaudet', 
-                'path': 'months',
-                'icon': '📆',
-                'count': count_images_in_folder(BASE_PATH / 'months')
-            },
-            {
-                'name': 'Viikot',
-                'path': 'weeks', 
-                'icon': '🗓️',
-                'count': count_images_in_folder(BASE_PATH / 'weeks')
-            },
-            {
-                'name': 'Päivät',
-                'path': 'days',
-                'icon': '📅',
-                'count': count_images_in_folder(BASE_PATH / 'days')
-            },
-            {
-                'name': 'Tunnit',
-                'path': 'hours',
-                'icon': '⏰',
-                'count': count_images_in_folder(BASE_PATH / 'hours')
-            },
-            {
-                'name': 'Minuutit',
-                'path': 'minutes',
-                'icon': '⏱️',
-                'count': count_images_in_folder(BASE_PATH / 'minutes')
-            },
-            {
-                'name': 'Sekunnit',
-                'path': 'seconds',
-                'icon': '⚡',
-                'count': count_images_in_folder(BASE_PATH / 'seconds')
+                'name': level['name'],
+                'path': level['dir'],
+                'icon': level['icon'],
+                'count': tree.count(level['dir']) if tree else DB.category_counts.count(level['dir'])
             }
+            for level in active_levels()
         ]
         return jsonify(categories)
     except Exception as e:
@@ -2099,6 +2261,13 @@ def browse_path():
         if not path:
             return jsonify({'error': 'Polku puuttuu'})
         
+        if is_virtual_layout():
+            result = DB.get_virtual_tree().browse(path)
+            if result is None:
+                return jsonify({'error': f'Polkua ei löydy: {path}'})
+            logger.info(f"Browse result (virtual): {len(result['folders'])} folders, {len(result['images'])} images")
+            return jsonify(result)
+        
         full_path = BASE_PATH / path
         
         if not full_path.exists():
@@ -2106,19 +2275,20 @@ def browse_path():
         
         result = {'folders': [], 'images': []}
         
-        # Hae alikansiot
+        # Hae alikansiot (jakokansiot _c-/_h- eivät ole aikayksiköitä, niiden kuvat näytetään tässä kansiossa)
         for item in sorted(full_path.iterdir()):
-            if item.is_dir():
+            if item.is_dir() and not is_shard_dir(item.name):
+                rel_folder = str(item.relative_to(BASE_PATH))
                 result['folders'].append({
                     'name': item.name,
-                    'path': str(item.relative_to(BASE_PATH)),
-                    'image_count': count_images_in_folder(item)
+                    'path': rel_folder,
+                    'image_count': folder_image_count(rel_folder, item)
                 })
         
         # Hae kuvat
         image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-        for item in sorted(full_path.iterdir()):
-            if item.is_file() and item.suffix.lower() in image_extensions:
+        for item in sorted(iter_folder_files(full_path), key=lambda item: item.name):
+            if item.suffix.lower() in image_extensions:
                 # Yritä löytää kuva tietokannasta
                 rel_path = str(item.relative_to(BASE_PATH))
                 image_info = DB.images.get(rel_path) if DB else None
@@ -2355,6 +2525,19 @@ def index():
         logger.error(f"Virhe pääsivulla: {e}")
         return f"<h1>Kuvien Selaus</h1><p>Sovellus käynnistyy, mutta luokitteluominaisuudet eivät ole saatavilla. Tarkista logit.</p>"
 
+def _matches_time_unit(img, time_unit, time_value):
+    """Virtuaalisen asettelun tietueella on vain yksi kategoria, joten taso lasketaan aikaleimasta"""
+    if not img.get('path', '').startswith('store/') or not img.get('timestamp'):
+        return False
+    try:
+        return level_time_key(datetime.fromisoformat(img['timestamp']), time_unit) == time_value
+    except (KeyError, ValueError):
+        return False
+
+def verify_requested():
+    """?verify=true: tarkista hakutulosten tiedostot levyltä (vianetsintään, hidas)"""
+    return request.args.get('verify', '').lower() in ('1', 'true', 'yes')
+
 @app.route('/api/images')
 def get_images():
     """Hae kuvat aikavälin perusteella ilman duplikaatteja"""
@@ -2367,10 +2550,11 @@ def get_images():
         time_unit = request.args.get('time_unit', '')
         time_value = request.args.get('time_value', '')
         
-        images = DB.get_unique_images_by_date_range(start_date, end_date) if DB else []
+        images = DB.get_unique_images_by_date_range(start_date, end_date, verify_requested()) if DB else []
         
         if time_unit and time_value:
-            images = [img for img in images if f"{time_unit}_{time_value}" in img['category']]
+            images = [img for img in images if f"{time_unit}_{time_value}" in img['category']
+                      or _matches_time_unit(img, time_unit, time_value)]
         
         logger.info(f"Palautetaan {len(images)} uniikkia kuvaa aikavälillä {start_date} - {end_date}")
         return jsonify(images)
@@ -2388,7 +2572,7 @@ def get_unique_images():
         start_date = request.args.get('start_date', '')
         end_date = request.args.get('end_date', '')
         
-        all_images = DB.get_images_by_date_range(start_date, end_date) if DB else []
+        all_images = DB.get_images_by_date_range(start_date, end_date, verify_requested()) if DB else []
         
         unique_images = []
         seen_filenames = set()
@@ -2428,6 +2612,10 @@ def image_by_path():
         if not CLASSIFICATION_AVAILABLE or not p:
             return jsonify({})
         info = DB.images.get(p) if DB and getattr(DB,'images',None) else None
+        if not info and DB and is_virtual_layout():
+            # Virtuaalipolku (esim. days/2025/11/06/kuva.jpg) -> varaston tietue
+            target = DB.get_virtual_tree().resolve(p)
+            info = DB.images.get(target) if target else None
         if not info:
             fname = os.path.basename(p)
             cam = extract_camera_from_filename(fname)
@@ -2453,26 +2641,143 @@ def image_by_path():
         logger.error(f"Virhe image_by_path: {e}")
         return jsonify({})
 
+def start_classify_job(full_reprocess=False, resumed_from=None):
+    """Käynnistä luokittelu taustatyönä (tai palauta jo käynnissä oleva). Palauttaa (työ, yhdistetty)."""
+    def run_classification(job):
+        return classify_images_hierarchical(str(SOURCE_PATH), str(BASE_PATH), DB, full_reprocess=full_reprocess,
+                                            progress=job.update_progress, cancel_event=job.cancel_event)
+    
+    params = {'full_reprocess': full_reprocess}
+    if resumed_from:
+        params['resumed_from'] = resumed_from
+    return JOBS.submit('classify', params, run_classification)
+
 @app.route('/api/classify', methods=['POST'])
 def classify_images():
-    """Suorita kuvien luokittelu"""
+    """Käynnistä kuvien luokittelu taustatyönä ja palauta työn tunniste.
+    Jos luokittelu on jo käynnissä, palautetaan käynnissä olevan työn tunniste."""
     if not CLASSIFICATION_AVAILABLE:
         return jsonify({'success': False, 'error': 'Luokittelumoduulia ei ole saatavilla'})
     
     try:
-        source_dir = '/data/source'
-        target_dir = '/data/classified'
-        
-        result = classify_images_hierarchical(source_dir, target_dir, DB)
-        
-        if 'error' in result:
-            return jsonify({'success': False, 'error': result['error']})
+        data = request.get_json(silent=True) or {}
+        full_reprocess = bool(data.get('full_reprocess')) or request.args.get('full', '').lower() in ('1', 'true', 'yes')
         
-        return jsonify({'success': True, 'result': result})
+        job, coalesced = start_classify_job(full_reprocess)
+        if coalesced:
+            logger.info(f"Luokittelu on jo käynnissä, yhdistetään työhön {job.id}")
+        return jsonify({'success': True, 'job_id': job.id, 'coalesced': coalesced, 'job': job.to_dict()}), 202
     except Exception as e:
         logger.error(f"Virhe luokittelussa: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+def _parse_upload_timestamp(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_upload_endpoint():
+    """Vastaanota kuva tai kuvia suoraan HTTP:llä ja rekisteröi ne heti.
+    
+    Yksi kuva: runko on kuvan sisältö, nimi ?filename= -parametrina tai X-Filename-otsakkeessa.
+    Useampi kuva: multipart/form-data, kentät camera ja timestamp (epoch) koskevat niiden
+    jälkeen tulevia tiedostoja. camera ja timestamp voidaan antaa myös query-parametreina."""
+    if not CLASSIFICATION_AVAILABLE:
+        return jsonify({'success': False, 'error': 'Luokittelumoduulia ei ole saatavilla'}), 503
+    
+    from ingest_upload import MultipartReader, UploadError, ingest_upload, new_upload_stats, save_uploads
+    
+    stats = new_upload_stats()
+    results = []
+    
+    def receive(chunks, filename, camera, timestamp):
+        try:
+            results.append(ingest_upload(chunks, filename, SOURCE_PATH, BASE_PATH, DB, stats, camera=camera,
+                                         timestamp=_parse_upload_timestamp(timestamp)))
+        except UploadError as e:
+            stats['failed'] += 1
+            results.append({'filename': filename, 'status': 'failed', 'error': str(e)})
+    
+    try:
+        camera = request.args.get('camera')
+        timestamp = request.args.get('timestamp')
+        if request.mimetype == 'multipart/form-data':
+            boundary = request.mimetype_params.get('boundary')
+            if not boundary:
+                return jsonify({'success': False, 'error': 'multipart-rajamerkki puuttuu'}), 400
+            reader = MultipartReader(request.stream, boundary)
+            for filename, fields, chunks in reader.files():
+                receive(chunks, filename, fields.get('camera') or camera, fields.get('timestamp') or timestamp)
+        else:
+            filename = request.args.get('filename') or request.headers.get('X-Filename')
+            if not filename:
+                return jsonify({'success': False, 'error': 'Tiedostonimi puuttuu (filename tai X-Filename)'}), 400
+            chunks = iter(lambda: request.stream.read(64 * 1024), b'')
+            receive(chunks, filename, camera, timestamp)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'results': results, 'stats': stats}), 400
+    except Exception as e:
+        logger.error(f"Virhe kuvien vastaanotossa: {e}")
+        return jsonify({'success': False, 'error': str(e), 'results': results, 'stats': stats}), 500
+    finally:
+        if any(result.get('status') == 'indexed' for result in results) or stats['duplicates']:
+            save_uploads(BASE_PATH, DB)
+    
+    if not results:
+        return jsonify({'success': False, 'error': 'Pyynnössä ei ollut kuvia', 'stats': stats}), 400
+    received = [result for result in results if result['status'] != 'failed']
+    statuses = {result['status'] for result in received}
+    status = 201 if 'indexed' in statuses else 202 if 'queued' in statuses else 200 if received else 400
+    return jsonify({'success': bool(received), 'results': results, 'stats': stats}), status
+
+@app.route('/api/jobs')
+def list_jobs():
+    """Listaa viimeisimmät taustatyöt"""
+    return jsonify(JOBS.list())
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Palauta työn tila, edistyminen ja valmistuttuaan tulos"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Työtä ei löydy: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Työn edistyminen Server-Sent Events -virtana; virta päättyy kun työ on valmis"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Työtä ei löydy: {job_id}'}), 404
+    
+    def generate():
+        version = -1
+        while True:
+            new_version = job.wait_for_change(version, timeout=15)
+            if new_version == version:
+                # Sydämenlyönti pitää yhteyden auki välityspalvelimien läpi
+                yield ': keepalive\n\n'
+                continue
+            version = new_version
+            yield f"data: {json.dumps(job.to_dict(), default=str)}\n\n"
+            if not job.is_active():
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Pyydä käynnissä olevan työn keskeytys. Jo käsitellyt kuvat säilyvät."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Työtä ei löydy: {job_id}'}), 404
+    if not job.cancel():
+        return jsonify({'success': False, 'error': 'Työ ei ole käynnissä', 'job': job.to_dict()}), 409
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 @app.route('/api/rtsp/start', methods=['POST'])
 def api_rtsp_start():
     """Käynnistä RTSP -> HLS stream (palauttaa playlist polun)"""
@@ -2513,6 +2818,11 @@ def api_rtsp_stop():
 def serve_image(filename):
     """Palvele kuvia"""
     try:
+        if DB is not None and is_virtual_layout() and not (BASE_PATH / filename).exists():
+            # Virtuaalinen aikahierarkia: polku ratkaistaan aikaindeksistä varaston tiedostoon
+            target = DB.get_virtual_tree().resolve(filename)
+            if target:
+                return send_from_directory('/data/classified', target)
         return send_from_directory('/data/classified', filename)
     except Exception as e:
         logger.error(f"Virhe kuvan palvelussa: {e}")
@@ -2526,7 +2836,20 @@ def compare_view():
 @app.route('/health')
 def health_check():
     """Terveystarkistus"""
-    return jsonify({'status': 'healthy', 'classification_available': CLASSIFICATION_AVAILABLE, 'rtsp_available': _RTPS_AVAILABLE})
+    return jsonify({'status': 'healthy', 'classification_available': CLASSIFICATION_AVAILABLE, 'rtsp_available': _RTPS_AVAILABLE,
+                    'watcher': WATCHER.status() if WATCHER else None,
+                    'reconciler': RECONCILER.status() if RECONCILER else None,
+                    'copy_methods': cached_methods(),
+                    'ingest_checkpoint': ingest_checkpoint_state()})
+
+def ingest_checkpoint_state():
+    if not CLASSIFICATION_AVAILABLE:
+        return None
+    try:
+        from classify_images import get_checkpoint
+        return get_checkpoint(BASE_PATH).state or None
+    except Exception:
+        return None
 
 @app.route('/api/filter_by_time_range')
 def filter_by_time_range():
@@ -2567,7 +2890,8 @@ def filter_by_time_range():
         # Hae kaikki kuvat aikaväliltä (päivärajauksella)
         all_images = DB.get_images_by_date_range(
             start_dt.strftime('%Y-%m-%d'),
-            end_dt.strftime('%Y-%m-%d')
+            end_dt.strftime('%Y-%m-%d'),
+            verify_requested()
         ) if DB else []
         logger.debug(f"DB.get_images_by_date_range returned {len(all_images)} images for days {start_dt.date()} - {end_dt.date()}")
 
@@ -2613,5 +2937,15 @@ if __name__ == '__main__':
     # Luo templatit (korvaa olemassa olevat täydellisillä versioilla)
     create_templates()
     
+    debug = os.environ.get('FLASK_DEBUG', '1').lower() not in ('0', 'false', 'no')
+    # Debug-tilan reloader ajaa moduulin kahdesti: valvova prosessi ei palvele pyyntöjä,
+    # joten taustapalvelut käynnistetään vain varsinaisessa palvelinprosessissa
+    if background_services_setting() != 'off' and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_background_services()
+    
     logger.info("Käynnistetään sovellus...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
+elif __name__ != '__mp_main__' and background_services_setting() == 'on':
+    # WSGI-palvelin (esim. gunicorn web_interface:app) tuo moduulin; käytä yhtä työprosessia,
+    # koska tietokanta ja taustapalvelut ovat prosessikohtaisia
+    start_background_services()